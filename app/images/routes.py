@@ -1,10 +1,48 @@
-from flask import Blueprint, request, jsonify
+import json
+import traceback
+from typing import Iterator
+from flask import Blueprint, Response, request, jsonify, g, stream_with_context
 from app.utils.limiter import limiter
-from app.utils.exceptions import FileTooLargeError, ImageUnclearError
+from app.utils.exceptions import FileTooLargeError, ImageUnclearError, ValidationError
 from app.utils.authentication_managment import authorize_request
 from app.utils.image_managment import image_manager
+from app.utils.inference_queue import inference_queue, JobStatus
+from app.utils.preview_quality import quality_policy
+from app.utils.logging import get_logger
 
 images = Blueprint("images", __name__)
+logger = get_logger()
+
+def wants_stream() -> bool:
+    return request.args.get("stream", "false").lower() in ("1", "true") or "text/event-stream" in request.headers.get("Accept", "")
+
+def format_event(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def server_sent_events(events: Iterator[tuple[str, dict]]) -> Iterator[str]:
+    try:
+        for event, payload in events:
+            yield format_event(event, payload)
+    except FileTooLargeError as e:
+        yield format_event("error", {"error": str(e), "status_code": 413})
+    except ImageUnclearError as e:
+        yield format_event("error", {"error": str(e), "status_code": 422})
+    except ValidationError as e:
+        yield format_event("error", {"error": str(e), "status_code": 400})
+    except Exception as e:
+        logger.error(f"An unexpected error occurred while streaming a preview: {e}")
+        logger.error(traceback.format_exc())
+        yield format_event("error", {"error": "An unexpected error occurred.", "status_code": 500})
+
+def queued_events(job_id: str) -> Iterator[tuple[str, dict]]:
+    yield "queued", {"job_id": job_id, "status": JobStatus.QUEUED}
+    yield from inference_queue.events(job_id)
+
+def event_stream_response(events: Iterator[tuple[str, dict]]) -> Response:
+    return Response(stream_with_context(server_sent_events(events)), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no", # keeps nginx from buffering the events until the end
+    })
 
 @images.route("/preview", methods=['POST'])
 @limiter.limit("1 per minute")
@@ -12,13 +50,48 @@ images = Blueprint("images", __name__)
 def generate_image():
     if "file" not in request.files:
         return jsonify({"error": "No file provided"}), 400
-    
+
     file = request.files.get("file", None)
     try:
-        processed_dict = image_manager.process_image_preview(file)
+        quality = quality_policy.parse(request.form.get("quality") or request.args.get("quality"))
+
+        # progressive mode, the coarse cutout and every later stage are sent as server-sent events
+        if wants_stream():
+            data = image_manager.read_preview_upload(file)
+
+            if inference_queue.enabled:
+                job_id = inference_queue.enqueue_preview(g.user_id, data, file.filename, quality.value, stream=True)
+                return event_stream_response(queued_events(job_id))
+
+            return event_stream_response(image_manager.stream_image_preview_data(data, g.user_id, quality))
+
+        if inference_queue.enabled:
+            data = image_manager.read_preview_upload(file)
+            job_id = inference_queue.enqueue_preview(g.user_id, data, file.filename, quality.value)
+            return jsonify({"job_id": job_id, "status": JobStatus.QUEUED}), 202
+
+        processed_dict = image_manager.process_image_preview(file, g.user_id, quality)
     except FileTooLargeError as e:
         return jsonify({"error": str(e)}), 413
     except ImageUnclearError as e:
         return jsonify({"error": str(e)}), 422
+    except ValidationError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify(processed_dict), 201
+
+@images.route("/preview/<job_id>", methods=['GET'])
+@limiter.limit("60 per minute")
+@authorize_request
+def get_preview_job(job_id: str):
+    job = inference_queue.get_job(job_id)
+    if job is None or job.get("user_id") != g.user_id:
+        return jsonify({"error": "Resource not found."}), 404
+
+    if job["status"] == JobStatus.DONE:
+        return jsonify(job["result"]), 200
+
+    if job["status"] == JobStatus.FAILED:
+        return jsonify({"error": job.get("error")}), job.get("status_code", 500)
 
-    return jsonify(processed_dict), 201
\ No newline at end of file
+    return jsonify({"job_id": job_id, "status": job["status"]}), 202
@@ -1,10 +1,76 @@
-from flask import Blueprint, jsonify, send_from_directory
+import hashlib
+from os import getenv
+from io import BytesIO
+from typing import Callable
+from flask import Blueprint, Response, request, jsonify, send_file, send_from_directory
+from werkzeug.exceptions import NotFound
 from app.utils.limiter import limiter
+from app.utils.exceptions import ValidationError
+from app.utils.renditions import rendition_cache
+from app.utils.storage import storage, StoredObject, StorageNamespace
+from app.utils.image_store import image_store
 from app.utils.logging import get_logger
 
 uploads = Blueprint("uploads", __name__)
 logger = get_logger()
 
+# permanent images are stored under their content hash and never rewritten, temporary previews are moved away once the item is created
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+UPLOADS_TEMP_MAX_AGE = int(getenv("UPLOADS_TEMP_MAX_AGE", "300"))
+
+def stat_upload(namespace: str, key: str) -> StoredObject:
+    stored = storage.stat(namespace, key)
+    if stored is None:
+        raise NotFound()
+
+    return stored
+
+def file_etag(stored: StoredObject, *variant) -> str:
+    """
+    Returns: strong ETag from the file metadata and the served variant, the content is never read
+    """
+    return hashlib.sha1(f"{stored.key}:{stored.size}:{stored.modified}:{variant}".encode()).hexdigest()[:32]
+
+def send_stored(namespace: str, key: str, mimetype: str) -> Response:
+    path = storage.local_path(namespace, key)
+    if path is not None:
+        return send_file(path, mimetype=mimetype, etag=False)
+
+    return send_file(BytesIO(storage.get(namespace, key)), mimetype=mimetype, etag=False)
+
+def cached_response(etag: str, cache_control: str, send: Callable[[], Response]) -> Response:
+    """
+    Returns: 304 if the client already holds etag, without opening or rendering anything, the response of send otherwise
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = send()
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+def send_rendition(namespace: str, key: str) -> Response:
+    """
+    Serves the image in the width requested by ?w= and the best format the Accept header allows.
+    """
+    width = rendition_cache.parse_width(request.args.get("w"))
+    mimetype = rendition_cache.negotiate(request.accept_mimetypes)
+    if mimetype is None:
+        return jsonify({"error": "None of the accepted formats is available [Supported: " + ", ".join(rendition_cache.mimetypes) + "]"}), 406
+
+    # the ETag comes from the source, so a revalidation never renders an evicted rendition again
+    etag = file_etag(stat_upload(namespace, key), width, mimetype)
+
+    def send() -> Response:
+        path = rendition_cache.get(namespace, key, width, mimetype)
+        return send_stored(namespace, key, mimetype) if path is None else send_file(path, mimetype=mimetype, etag=False)
+
+    response = cached_response(etag, IMMUTABLE_CACHE_CONTROL, send)
+    response.vary.add("Accept")
+    return response
+
 #@uploads.route('/profile_pictures/default/<filename>.png', methods=['GET'])
 #@uploads.route('/profile_pictures/<user_id>.webp', methods=['GET'])
 #@uploads.route('/profile_pictures/<user_id>', methods=['GET'])
@@ -32,7 +98,11 @@ logger = get_logger()
 @limiter.limit("10 per minute")
 def getClothingImage(clothing_id):
     try:
-        return send_from_directory('app/static/clothing_images', f'{clothing_id}.webp')
+        return send_rendition(StorageNamespace.CLOTHING, image_store.resolve(StorageNamespace.CLOTHING, clothing_id))
+    except (FileNotFoundError, NotFound):
+        return jsonify({"error": "Resource not found."}), 404
+    except ValidationError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"An unexpected error occurred: {e}")
         return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
@@ -46,7 +116,10 @@ def getTempImage(filename):
     filename = filename.strip() + ".webp" if not filename.endswith(".webp") else filename
 
     try:
-        return send_from_directory('app/static/temp', f'{filename}')
+        etag = file_etag(stat_upload(StorageNamespace.TEMP, filename))
+        return cached_response(etag, f"public, max-age={UPLOADS_TEMP_MAX_AGE}", lambda: send_stored(StorageNamespace.TEMP, filename, "image/webp"))
+    except (FileNotFoundError, NotFound):
+        return jsonify({"error": "Resource not found."}), 404
     except Exception as e:
         logger.error(f"An unexpected error occurred: {e}")
         return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
@@ -54,10 +127,14 @@ def getTempImage(filename):
 @uploads.get('/outfit_images/<filename>')
 @limiter.limit("10 per minute")
 def get_outfit_image(filename):
-    filename = filename.strip() + ".webp" if not filename.endswith(".webp") else filename
+    image_id = filename.strip().removesuffix(".webp")
 
     try:
-        return send_from_directory('app/static/outfit_collages', f'{filename}')
+        return send_rendition(StorageNamespace.OUTFITS, image_store.resolve(StorageNamespace.OUTFITS, image_id))
+    except (FileNotFoundError, NotFound):
+        return jsonify({"error": "Resource not found."}), 404
+    except ValidationError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"An unexpected error occurred: {e}")
         return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
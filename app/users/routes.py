@@ -82,6 +82,18 @@ def create_outfit():
 
     return jsonify({"outfit": outfit.to_dict()}), 201
 
+@users.route('/me/outfits/suggestions', methods=['GET'])
+@limiter.limit('30 per minute')
+@authorize_request
+def suggest_outfits():
+    season = request.args.get("season", None, type=str)
+    tag = request.args.get("tag", None, type=str)
+    limit = min(max(request.args.get("limit", 10, type=int), 1), 100)
+    
+    suggestions = outfit_manager.suggest_outfits(g.user_id, season, tag, limit)
+    
+    return jsonify({"season": season, "tag": tag, "limit": limit, "suggestions": [{"score": score, "clothing": {category: clothing.to_dict() for category, clothing in outfit.items()}} for score, outfit in suggestions]}), 200
+
 @users.route('/<user_id>/clothing', methods=['GET'])
 @limiter.limit('5 per minute')
 @authorize_request
@@ -128,6 +140,27 @@ def create_clothing_piece():
 
     return jsonify({"clothing": clothing.to_dict()}), 201
 
+@users.route('/me/clothing/<clothing_id>/similar', methods=['GET'])
+@limiter.limit('30 per minute')
+@authorize_request
+def get_similar_clothing(clothing_id: str):
+    limit = min(max(request.args.get("limit", 10, type=int), 1), 100)
+    
+    matches = clothing_manager.get_similar_clothing(g.user_id, clothing_id, limit)
+    
+    return jsonify({"limit": limit, "clothing": [{**clothing.to_dict(), "similarity": similarity} for clothing, similarity in matches]}), 200
+
+@users.route('/me/clothing/search', methods=['GET'])
+@limiter.limit('30 per minute')
+@authorize_request
+def search_clothing():
+    query = request.args.get("q", None, type=str)
+    limit = min(max(request.args.get("limit", 10, type=int), 1), 100)
+    
+    matches = clothing_manager.search_clothing(g.user_id, query, limit)
+    
+    return jsonify({"query": query, "limit": limit, "clothing": [{**clothing.to_dict(), "similarity": similarity} for clothing, similarity in matches]}), 200
+
 @users.route('/me/username', methods=['PUT'])
 @authorize_request
 @limiter.limit('1 per hour')
@@ -0,0 +1,96 @@
+__all__ = ["MicroBatcher"]
+
+import os
+import time
+import queue
+import threading
+import traceback
+from os import getenv
+from typing import Any, Callable
+from concurrent.futures import Future
+from app.utils.logging import get_logger
+
+logger = get_logger()
+
+INFERENCE_BATCH_SIZE = int(getenv("INFERENCE_BATCH_SIZE", "8"))
+INFERENCE_BATCH_WAIT_MS = float(getenv("INFERENCE_BATCH_WAIT_MS", "5"))
+
+class MicroBatcher:
+    """
+    Collects concurrent calls for up to max_wait_ms (or until max_batch_size is reached),
+    runs batch_fn once over all collected items and hands every caller its own result.
+    batch_fn receives a list of items and has to return a list of results in the same order.
+    """
+
+    def __init__(self, name: str, batch_fn: Callable[[list], list], max_batch_size: int = INFERENCE_BATCH_SIZE, max_wait_ms: float = INFERENCE_BATCH_WAIT_MS):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queue: queue.Queue = None
+        self._thread: threading.Thread = None
+        self._pid: int = None
+        self._lock = threading.Lock()
+
+    def _ensure_running(self) -> None:
+        # the thread is started lazily and again after a fork, threads do not survive fork()
+        if self._thread is not None and self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name=f"batcher-{self.name}", daemon=True)
+                self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        future = Future()
+
+        if self.max_batch_size == 1:
+            try:
+                future.set_result(self.batch_fn([item])[0])
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        self._ensure_running()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item: Any) -> Any:
+        return self.submit(item).result()
+
+    def _collect(self) -> list[tuple[Any, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+
+            try:
+                results = list(self.batch_fn(items))
+                if len(results) != len(items):
+                    raise ValueError(f"The {self.name} batch returned {len(results)} results for {len(items)} items.")
+            except Exception as e:
+                logger.error(f"An unexpected error occurred in the {self.name} batch of {len(items)}: {e}")
+                logger.debug(traceback.format_exc())
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -5,14 +5,18 @@ import uuid
 from re import match as re_match
 from datetime import datetime
 from app.utils.database import Database
-from app.utils.exceptions import ClothingNotFoundError, ClothingImageInvalidError, ClothingNameMissingError, ClothingCategoryMissingError, ClothingColorMissingError, ClothingImageMissingError, ClothingNameTooShortError, ClothingNameTooLongError, ClothingDescriptionTooLongError, ClothingIDMissingError, ClothingSeasonsInvalidError, ClothingTagsInvalidError, ClothingValidationError
+from app.utils.exceptions import ClothingSearchQueryMissingError, ClothingNotFoundError, ClothingImageInvalidError, ClothingNameMissingError, ClothingCategoryMissingError, ClothingColorMissingError, ClothingImageMissingError, ClothingNameTooShortError, ClothingNameTooLongError, ClothingDescriptionTooLongError, ClothingIDMissingError, ClothingSeasonsInvalidError, ClothingTagsInvalidError, ClothingValidationError
 from typing import Optional
 from mysql.connector.errors import IntegrityError
 from app.models.clothing import Clothing, ClothingCategory, ClothingSeason, ClothingTags
 from app.utils.authentication_managment import authentication_manager
 from app.utils.logging import get_logger
 from app.utils.image_managment import image_manager
-import os
+from app.utils.embedding_store import embedding_store
+from app.utils.duplicate_index import duplicate_index
+from app.utils.storage import StorageNamespace
+from app.utils.image_store import image_store
+from app.utils.model_managment import model_manager
 
 logger = get_logger()
 
@@ -59,9 +63,7 @@ class ClothingManager:
                 if cursor.fetchone() is not None:
                     return
             
-            os.remove(filename + ".webp")
-        except FileNotFoundError:
-            pass
+            image_store.release(StorageNamespace.CLOTHING, filename)
         except PermissionError:
             logger.error(f"Permission denied while deleting an image: {filename}")
             logger.error(traceback.format_exc())
@@ -71,6 +73,24 @@ class ClothingManager:
             logger.error(traceback.format_exc())
             raise e
 
+    def _index_image(self, user_id: str, clothing_id: str, image_id: str) -> None:
+        """
+        Moves the embedding of the preview into the embedding store, items without one are just not searchable.
+        The perceptual hash of the stored image goes into the duplicate index.
+        """
+        try:
+            duplicate_index.put(user_id, clothing_id, duplicate_index.dhash(image_manager.load_clothing_image_by_id(image_id)))
+            
+            embedding = image_manager.pop_preview_embedding(image_id)
+            if embedding is None:
+                logger.warning(f"No preview embedding found for image {image_id}, clothing {clothing_id} is not indexed.")
+                return
+            
+            embedding_store.put(user_id, clothing_id, embedding)
+        except Exception as e:
+            logger.error(f"An unexpected error occured while indexing clothing {clothing_id}: {e}")
+            logger.error(traceback.format_exc())
+
     def create_clothing(self, user_id: str, name: str, category: str, image_id: str, color: Optional[str], seasons: Optional[list] = None, tags: Optional[list] = None, description: Optional[str] = None) -> Clothing:
         if not isinstance(name, str) or not name.strip():
             raise ClothingNameMissingError("The name is missing.")
@@ -85,7 +105,7 @@ class ClothingManager:
         if isinstance(color, str) and not re_match(color_regex, color):
             raise ClothingColorMissingError("The color is missing or invalid. It should be a hex color code (e.g., #FFFFFF).")
 
-        if not os.path.exists(os.path.join("app", "static", "temp", image_id + ".webp")):
+        if not image_manager.preview_exists(image_id, user_id):
             raise ClothingImageMissingError("The provided image file does not exist.")
         
         if category.upper() not in ClothingCategory.__members__:
@@ -126,11 +146,18 @@ class ClothingManager:
                     cursor.execute("INSERT INTO clothing_seasons(clothing_id, season) VALUES (%s, %s);", (clothing.clothing_id, season.name))
                 for tag in clothing.tags:
                     cursor.execute("INSERT INTO clothing_tags(clothing_id, tag) VALUES (%s, %s);", (clothing.clothing_id, tag.name))
+
+                # in the same transaction, the unique image_id rolls the insert back if another request used the preview first
+                image_manager.move_preview_image_to_permanent(image_id, user_id, conn=conn)
                 conn.commit()
 
-                image_manager.move_preview_image_to_permanent(image_id)
+            # the preview only leaves staging once the item is committed, a failed request can be retried with it
+            self._index_image(user_id, clothing_id, image_id)
+            image_manager.discard_preview(image_id)
         except IntegrityError as e:
             raise ClothingImageInvalidError("The provided image is already used by another clothing.")
+        except FileNotFoundError as e:
+            raise ClothingImageMissingError("The provided image file does not exist.")
         except Exception as e:
             logger.error(f"An unexpected error occurred while adding a new clothing to the database: {e}")
             logger.error(traceback.format_exc())
@@ -256,13 +283,11 @@ class ClothingManager:
                     values.append(color)
 
                 if isinstance(image_id, str):
-                    if not os.path.exists(os.path.join("app", "static", "temp", image_id + ".webp")):
+                    if not image_manager.preview_exists(image_id, user_id):
                         raise ClothingImageMissingError("The provided image file does not exist.")
                     
-                    self._delete_unused_image(image_id)
                     fields.append("image_id = %s")
                     values.append(image_id)
-                    image_manager.move_preview_image_to_permanent(image_id)
 
                 if isinstance(category, str):
                     if category.upper() not in ClothingCategory.__members__:
@@ -316,10 +341,24 @@ class ClothingManager:
                                 raise ClothingTagsInvalidError(f"The provided tag ({tag}) is not valid.")
 
                             cursor.execute("INSERT INTO clothing_tags(clothing_id, tag) VALUES (%s, %s);", (clothing_id, tag.strip().upper()))
+                
+                # stored after every validation passed, the reference is committed or rolled back with the update
+                if isinstance(image_id, str):
+                    image_manager.move_preview_image_to_permanent(image_id, user_id, conn=conn)
                             
                 conn.commit()
+            
+            if isinstance(image_id, str):
+                self._index_image(user_id, clothing_id, image_id)
+                image_manager.discard_preview(image_id)
+            
+            # the replaced image, only once nothing references it anymore
+            if isinstance(image_id, str) and image_id != result[7]:
+                self._delete_unused_image(result[7])
         except (ClothingValidationError, ClothingNotFoundError) as e:
             raise e
+        except FileNotFoundError as e:
+            raise ClothingImageMissingError("The provided image file does not exist.")
         except Exception as e:
             logger.error(f"An unexpected error occurred while updating clothing with ID {clothing_id}: {e}")
             logger.error(traceback.format_exc())
@@ -327,6 +366,90 @@ class ClothingManager:
         
         return self.get_clothing_by_id(user_id, clothing_id)
     
+    def get_clothing_by_ids(self, user_id: str, clothing_ids: list[str]) -> list[Clothing]:
+        """
+        Returns: the clothing of the user in the order of clothing_ids, with three queries regardless of the count
+        """
+        if not clothing_ids:
+            return []
+        
+        placeholders = ", ".join(["%s"] * len(clothing_ids))
+        
+        try:
+            with Database.getConnection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute(f"SELECT clothing_id, is_public, name, category, color, created_at, user_id, image_id, description FROM clothing WHERE user_id = %s AND clothing_id IN ({placeholders});", (user_id, *clothing_ids))
+                clothes = {clothing.get("clothing_id"): clothing for clothing in cursor.fetchall()}
+                
+                seasons: dict[str, list[ClothingSeason]] = {clothing_id: [] for clothing_id in clothes}
+                cursor.execute(f"SELECT clothing_id, season FROM clothing_seasons WHERE clothing_id IN ({placeholders});", tuple(clothing_ids))
+                for row in cursor.fetchall():
+                    seasons.setdefault(row.get("clothing_id"), []).append(ClothingSeason[row.get("season")])
+                
+                tags: dict[str, list[ClothingTags]] = {clothing_id: [] for clothing_id in clothes}
+                cursor.execute(f"SELECT clothing_id, tag FROM clothing_tags WHERE clothing_id IN ({placeholders});", tuple(clothing_ids))
+                for row in cursor.fetchall():
+                    tags.setdefault(row.get("clothing_id"), []).append(ClothingTags[row.get("tag")])
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while retrieving clothes by IDs for user {user_id}: {e}")
+            logger.error(traceback.format_exc())
+            raise e
+        
+        return [Clothing.from_dict(clothes[clothing_id], seasons[clothing_id], tags[clothing_id]) for clothing_id in clothing_ids if clothing_id in clothes]
+    
+    def get_wardrobe(self, user_id: str) -> list[Clothing]:
+        """
+        Returns: every clothing of the user including private ones, with three queries regardless of the count
+        """
+        try:
+            with Database.getConnection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute("SELECT clothing_id, is_public, name, category, color, created_at, user_id, image_id, description FROM clothing WHERE user_id = %s ORDER BY created_at DESC;", (user_id,))
+                clothes = cursor.fetchall()
+                
+                seasons: dict[str, list[ClothingSeason]] = {clothing.get("clothing_id"): [] for clothing in clothes}
+                cursor.execute("SELECT cs.clothing_id, cs.season FROM clothing_seasons cs JOIN clothing c ON c.clothing_id = cs.clothing_id WHERE c.user_id = %s;", (user_id,))
+                for row in cursor.fetchall():
+                    seasons.setdefault(row.get("clothing_id"), []).append(ClothingSeason[row.get("season")])
+                
+                tags: dict[str, list[ClothingTags]] = {clothing.get("clothing_id"): [] for clothing in clothes}
+                cursor.execute("SELECT ct.clothing_id, ct.tag FROM clothing_tags ct JOIN clothing c ON c.clothing_id = ct.clothing_id WHERE c.user_id = %s;", (user_id,))
+                for row in cursor.fetchall():
+                    tags.setdefault(row.get("clothing_id"), []).append(ClothingTags[row.get("tag")])
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while retrieving the wardrobe of user {user_id}: {e}")
+            logger.error(traceback.format_exc())
+            raise e
+        
+        return [Clothing.from_dict(clothing, seasons[clothing.get("clothing_id")], tags[clothing.get("clothing_id")]) for clothing in clothes]
+    
+    def _with_scores(self, user_id: str, matches: list[tuple[str, float]]) -> list[tuple[Clothing, float]]:
+        scores = dict(matches)
+        return [(clothing, scores[clothing.clothing_id]) for clothing in self.get_clothing_by_ids(user_id, [clothing_id for clothing_id, _ in matches])]
+    
+    def get_similar_clothing(self, user_id: str, clothing_id: str, limit: int = 10) -> list[tuple[Clothing, float]]:
+        """
+        Returns: [(clothing, similarity), ...] of the user's wardrobe, most similar first
+        """
+        self.get_clothing_by_id(user_id, clothing_id)
+        
+        matches = embedding_store.similar(user_id, clothing_id, limit)
+        if matches is None:
+            return []
+        
+        return self._with_scores(user_id, matches)
+    
+    def search_clothing(self, user_id: str, query: Optional[str], limit: int = 10) -> list[tuple[Clothing, float]]:
+        """
+        Returns: [(clothing, similarity), ...] matching a free text query like "navy wool coat", best match first
+        """
+        if not isinstance(query, str) or not query.strip():
+            raise ClothingSearchQueryMissingError("The search query is missing.")
+        
+        query_emb = model_manager.encode_text([query.strip()])[0]
+        
+        return self._with_scores(user_id, embedding_store.search(user_id, query_emb, limit))
+    
     def get_image_id_by_clothing_id(self, user_id: str, clothing_id: str) -> str:
         """
         Returns: image_id
@@ -354,6 +477,8 @@ class ClothingManager:
                 conn.commit()
                 
             self._delete_unused_image(image_id[0])
+            embedding_store.delete(user_id, clothing_id)
+            duplicate_index.delete(user_id, clothing_id)
         except ClothingNotFoundError as e:
             raise e
         except Exception as e:
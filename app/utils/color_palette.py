@@ -0,0 +1,98 @@
+__all__ = ["palette_extractor"]
+
+import numpy as np
+from PIL import Image
+from app.utils.kernels import kernels
+
+# sRGB (D65) -> XYZ, rows already divided by the D65 white point so Lab can use 1.0 as reference
+RGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+], dtype=np.float32) / np.array([[0.95047], [1.0], [1.08883]], dtype=np.float32)
+
+# sRGB -> linear light for every 8 bit value, avoids a power per pixel
+_srgb = np.arange(256, dtype=np.float32) / 255.0
+SRGB_TO_LINEAR = np.where(_srgb > 0.04045, ((_srgb + 0.055) / 1.055) ** 2.4, _srgb / 12.92).astype(np.float32)
+
+L_BINS = 11
+L_BIN_SIZE = 10.0
+AB_BIN_SIZE = 16.0
+AB_BINS = 16
+MERGE_DISTANCE = 12.0 # Lab distance under which two bins count as the same color
+MIN_ALPHA = 10
+
+class PaletteExtractor:
+    """
+    Alpha weighted histogram palette in Lab space.
+    Pixels are quantized into Lab bins, the heaviest bins become the palette and perceptually
+    close bins are merged, every color comes with the fraction of the garment it covers.
+    """
+
+    @staticmethod
+    def rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+        linear = SRGB_TO_LINEAR[rgb]
+        xyz = linear @ RGB_TO_XYZ.T
+
+        f = np.where(xyz > 0.008856, np.cbrt(xyz), 7.787 * xyz + 16 / 116)
+        l = 116 * f[:, 1] - 16
+        a = 500 * (f[:, 0] - f[:, 1])
+        b = 200 * (f[:, 1] - f[:, 2])
+
+        return np.stack((l, a, b), axis=1)
+
+    def extract(self, image: Image.Image, k: int = 5, size: int = 64) -> list[dict]:
+        """
+        Returns: [{"color": "#RRGGBB", "coverage": float}, ...] sorted by coverage, at most k entries
+        """
+        if image.mode != "RGBA":
+            image = image.convert("RGBA")
+
+        # nearest neighbour keeps real garment colors, filtering would invent blends of stripes and edges
+        arr = np.asarray(image.resize((size, size), Image.NEAREST)).reshape(-1, 4)
+
+        # half-transparent pixels (alpha <= MIN_ALPHA) are skipped, the rest is binned in Lab weighted by alpha
+        bin_count = L_BINS * AB_BINS * AB_BINS
+        bin_weight, bin_rgb, bin_lab = np.zeros(bin_count), np.zeros((bin_count, 3)), np.zeros((bin_count, 3))
+        kernels.lab_histogram(arr, MIN_ALPHA, SRGB_TO_LINEAR, RGB_TO_XYZ, L_BIN_SIZE, L_BINS, AB_BIN_SIZE, AB_BINS, bin_weight, bin_rgb, bin_lab)
+
+        used = np.flatnonzero(bin_weight)
+        if used.size == 0:
+            return []
+
+        bin_weight = bin_weight[used]
+        bin_rgb = bin_rgb[used] / bin_weight[:, None]
+        bin_lab = bin_lab[used] / bin_weight[:, None]
+
+        # merge neighbouring bins among the strongest candidates, heaviest first
+        candidates = np.argsort(-bin_weight)[:k * 4]
+        distances = np.linalg.norm(bin_lab[candidates, None, :] - bin_lab[None, candidates, :], axis=-1)
+
+        palette = []
+        merged = np.zeros(len(candidates), dtype=bool)
+        for i in range(len(candidates)):
+            if merged[i]:
+                continue
+
+            group = ~merged & (distances[i] < MERGE_DISTANCE)
+            merged |= group
+
+            group_weight = bin_weight[candidates[group]]
+            color = (bin_rgb[candidates[group]] * group_weight[:, None]).sum(axis=0) / group_weight.sum()
+            palette.append((group_weight.sum(), color))
+
+            if len(palette) == k:
+                break
+
+        total = bin_weight.sum()
+        palette.sort(key=lambda entry: -entry[0])
+
+        return [
+            {
+                "color": "#{:02X}{:02X}{:02X}".format(*np.clip(np.rint(color), 0, 255).astype(int)),
+                "coverage": round(float(weight / total), 4)
+            }
+            for weight, color in palette
+        ]
+
+palette_extractor = PaletteExtractor()
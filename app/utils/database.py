@@ -33,4 +33,9 @@ class Database:
                 logger.critical(f"Failed to create database connection pool: {e}")
                 exit(1)
 
-        return cls._pool.get_connection()
\ No newline at end of file
+        return cls._pool.get_connection()
+    
+    @classmethod
+    def reset_pool(cls) -> None:
+        # connections opened before a fork must not be shared with the parent, the child lazily builds its own pool
+        cls._pool = None
\ No newline at end of file
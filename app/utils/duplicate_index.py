@@ -0,0 +1,155 @@
+__all__ = ["duplicate_index"]
+
+import os
+import json
+import logging
+import threading
+import numpy as np
+from os import getenv
+from typing import Optional
+from collections import OrderedDict
+from PIL import Image
+from filelock import FileLock
+from app.utils.logging import get_logger
+
+logger = get_logger()
+logging.getLogger("filelock").setLevel(logging.WARNING)
+
+DUPLICATE_INDEX_DIR = getenv("DUPLICATE_INDEX_DIR", "data/hashes")
+DUPLICATE_MAX_DISTANCE = int(getenv("DUPLICATE_MAX_DISTANCE", "8")) # Hamming distance out of 64 bits
+HASH_SIZE = 8
+SAMPLE_FACTOR = 16 # nearest neighbour samples per hash cell and axis before the box filter
+DUPLICATE_SHARD_CACHE_SIZE = int(getenv("DUPLICATE_SHARD_CACHE_SIZE", "256")) # bucket tables kept in memory per process
+
+class DuplicateIndex:
+    """
+    dHash of every clothing image in a per-user multi-index hash table.
+    The 64 bit hash is split into max_distance + 1 disjoint chunks, two hashes within max_distance
+    share at least one chunk exactly (pigeonhole), so a lookup only verifies the items found in
+    the exact chunk buckets instead of comparing against the whole wardrobe.
+    Shards are a json file per user ({clothing_id: hex hash}), written under a file lock and swapped atomically.
+    """
+
+    def __init__(self, root: str = DUPLICATE_INDEX_DIR, max_distance: int = DUPLICATE_MAX_DISTANCE):
+        self.root = root
+        self.max_distance = max_distance
+        bounds = np.linspace(0, HASH_SIZE * HASH_SIZE, max_distance + 2).astype(int)
+        self._chunks = [(int(start), (1 << int(end - start)) - 1) for start, end in zip(bounds[:-1], bounds[1:])]
+        self._shards: OrderedDict[str, tuple[int, dict[str, int], list[dict[int, list[str]]]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def dhash(image: Image.Image) -> int:
+        """
+        Returns: 64 bit difference hash, transparent areas count as white so cutouts hash like their garment
+        """
+        # a sparse nearest sample followed by a box filter is a cheap low pass, resampling the full image costs milliseconds
+        sampled = image.convert("RGBA") if image.mode not in ("RGB", "RGBA") else image
+        sampled = sampled.resize(((HASH_SIZE + 1) * SAMPLE_FACTOR, HASH_SIZE * SAMPLE_FACTOR), Image.NEAREST)
+        small = sampled.resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX)
+
+        if small.mode == "RGBA":
+            small = Image.alpha_composite(Image.new("RGBA", small.size, (255, 255, 255, 255)), small)
+
+        pixels = np.asarray(small.convert("L"), dtype=np.int16)
+        bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+        return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+    @staticmethod
+    def to_hex(image_hash: int) -> str:
+        return f"{image_hash:016x}"
+
+    def _shard_dir(self, user_id: str) -> str:
+        return os.path.join(self.root, user_id[:2])
+
+    def _shard_path(self, user_id: str) -> str:
+        return os.path.join(self._shard_dir(user_id), f"{user_id}.json")
+
+    def _file_lock(self, user_id: str) -> FileLock:
+        os.makedirs(self._shard_dir(user_id), exist_ok=True)
+        return FileLock(os.path.join(self._shard_dir(user_id), f"{user_id}.lock"))
+
+    def _read(self, user_id: str) -> dict[str, int]:
+        try:
+            with open(self._shard_path(user_id), "r") as f:
+                return {clothing_id: int(value, 16) for clothing_id, value in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+
+    def _write(self, user_id: str, hashes: dict[str, int]) -> None:
+        path = self._shard_path(user_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({clothing_id: self.to_hex(value) for clothing_id, value in hashes.items()}, f)
+        os.replace(tmp_path, path)
+
+    def _load(self, user_id: str) -> tuple[dict[str, int], list[dict[int, list[str]]]]:
+        """
+        Returns: (clothing id -> hash, one bucket table per chunk), rebuilt whenever another process changed the shard
+        """
+        try:
+            modified = os.stat(self._shard_path(user_id)).st_mtime_ns
+        except FileNotFoundError:
+            return {}, []
+
+        with self._lock:
+            shard = self._shards.get(user_id)
+            if shard is not None and shard[0] == modified:
+                self._shards.move_to_end(user_id)
+                return shard[1], shard[2]
+
+        hashes = self._read(user_id)
+        tables: list[dict[int, list[str]]] = [{} for _ in self._chunks]
+        for clothing_id, value in hashes.items():
+            for table, (shift, mask) in zip(tables, self._chunks):
+                table.setdefault((value >> shift) & mask, []).append(clothing_id)
+
+        with self._lock:
+            self._shards[user_id] = (modified, hashes, tables)
+            self._shards.move_to_end(user_id)
+            while len(self._shards) > DUPLICATE_SHARD_CACHE_SIZE:
+                self._shards.popitem(last=False)
+        return hashes, tables
+
+    def put(self, user_id: str, clothing_id: str, image_hash: int) -> None:
+        try:
+            with self._file_lock(user_id):
+                hashes = self._read(user_id)
+                hashes[clothing_id] = image_hash
+                self._write(user_id, hashes)
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while storing the image hash of clothing {clothing_id}: {e}")
+            raise e
+
+    def delete(self, user_id: str, clothing_id: str) -> None:
+        try:
+            with self._file_lock(user_id):
+                hashes = self._read(user_id)
+                if hashes.pop(clothing_id, None) is None:
+                    return
+                self._write(user_id, hashes)
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while deleting the image hash of clothing {clothing_id}: {e}")
+            raise e
+
+    def lookup(self, user_id: str, image_hash: int, max_distance: Optional[int] = None, exclude: Optional[str] = None) -> list[tuple[str, int]]:
+        """
+        Returns: [(clothing_id, hamming distance), ...] within max_distance, closest first
+        """
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        hashes, tables = self._load(user_id)
+
+        candidates = set()
+        for table, (shift, mask) in zip(tables, self._chunks):
+            candidates.update(table.get((image_hash >> shift) & mask, ()))
+        candidates.discard(exclude)
+
+        matches = []
+        for clothing_id in candidates:
+            distance = (hashes[clothing_id] ^ image_hash).bit_count()
+            if distance <= max_distance:
+                matches.append((clothing_id, distance))
+
+        return sorted(matches, key=lambda match: match[1])
+
+duplicate_index = DuplicateIndex()
@@ -0,0 +1,193 @@
+__all__ = ["embedding_store"]
+
+import os
+import json
+import logging
+import threading
+import numpy as np
+from os import getenv
+from typing import Optional
+from collections import OrderedDict
+from filelock import FileLock
+from app.utils.logging import get_logger
+
+logger = get_logger()
+logging.getLogger("filelock").setLevel(logging.WARNING) # logs every acquire and release at debug level
+
+EMBEDDING_STORE_DIR = getenv("EMBEDDING_STORE_DIR", "data/embeddings")
+SCORE_CHUNK_ROWS = 4096 # rows upcast to float32 at a time, bounds the temporary memory of a search
+EMBEDDING_SHARD_CACHE_SIZE = int(getenv("EMBEDDING_SHARD_CACHE_SIZE", "256")) # open memmaps per process, each holds a file descriptor
+
+class EmbeddingStore:
+    """
+    FashionCLIP image embeddings of every clothing item, one normalized float16 matrix per user.
+    A shard is an index file ({user_id}.json: version + clothing ids in row order) and an immutable
+    matrix file per version that is memory-mapped by readers. Writers build the next version under a
+    file lock and swap the index atomically, so readers never see a half written matrix.
+    """
+
+    def __init__(self, root: str = EMBEDDING_STORE_DIR):
+        self.root = root
+        self._shards: OrderedDict[str, tuple[int, list[str], dict[str, int], np.ndarray]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _shard_dir(self, user_id: str) -> str:
+        return os.path.join(self.root, user_id[:2])
+
+    def _index_path(self, user_id: str) -> str:
+        return os.path.join(self._shard_dir(user_id), f"{user_id}.json")
+
+    def _matrix_path(self, user_id: str, version: int) -> str:
+        return os.path.join(self._shard_dir(user_id), f"{user_id}.{version}.npy")
+
+    def _file_lock(self, user_id: str) -> FileLock:
+        os.makedirs(self._shard_dir(user_id), exist_ok=True)
+        return FileLock(os.path.join(self._shard_dir(user_id), f"{user_id}.lock"))
+
+    @staticmethod
+    def normalize(embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        return embedding / np.linalg.norm(embedding)
+
+    def _read_index(self, user_id: str) -> Optional[dict]:
+        try:
+            with open(self._index_path(user_id), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def load(self, user_id: str) -> tuple[list[str], dict[str, int], np.ndarray]:
+        """
+        Returns: (clothing ids in row order, clothing id -> row, read only (N, D) float16 memmap)
+        """
+        for _ in range(2):
+            index = self._read_index(user_id)
+            if index is None:
+                return [], {}, np.zeros((0, 0), dtype=np.float16)
+
+            with self._lock:
+                shard = self._shards.get(user_id)
+                if shard is not None and shard[0] == index["version"]:
+                    self._shards.move_to_end(user_id)
+                    return shard[1], shard[2], shard[3]
+
+            try:
+                matrix = np.load(self._matrix_path(user_id, index["version"]), mmap_mode="r")
+            except FileNotFoundError:
+                # a writer replaced the version between reading the index and opening the matrix
+                continue
+
+            ids = index["ids"]
+            rows = {clothing_id: row for row, clothing_id in enumerate(ids)}
+            self._remember(user_id, (index["version"], ids, rows, matrix))
+            return ids, rows, matrix
+
+        raise RuntimeError(f"The embedding shard of user {user_id} changed while it was read.")
+
+    def _remember(self, user_id: str, shard: tuple[int, list[str], dict[str, int], np.ndarray]) -> None:
+        with self._lock:
+            self._shards[user_id] = shard
+            self._shards.move_to_end(user_id)
+            while len(self._shards) > EMBEDDING_SHARD_CACHE_SIZE:
+                # mmap.close() refuses while numpy exports the buffer, the mapping and its fd are closed
+                # when the evicted memmap is collected, right here unless a search still scores it
+                self._shards.popitem(last=False)
+
+    def _write(self, user_id: str, version: int, ids: list[str], matrix: np.ndarray) -> None:
+        path = self._matrix_path(user_id, version + 1)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, matrix.astype(np.float16))
+        os.replace(tmp_path, path)
+
+        index_path = self._index_path(user_id)
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": version + 1, "ids": ids}, f)
+        os.replace(tmp_path, index_path)
+
+        # open memmaps of the old version stay valid, the inode lives until they are closed
+        try:
+            os.remove(self._matrix_path(user_id, version))
+        except FileNotFoundError:
+            pass
+
+    def _read_for_update(self, user_id: str) -> tuple[int, list[str], np.ndarray]:
+        index = self._read_index(user_id)
+        if index is None:
+            return 0, [], None
+        return index["version"], index["ids"], np.load(self._matrix_path(user_id, index["version"]))
+
+    def put(self, user_id: str, clothing_id: str, embedding: np.ndarray) -> None:
+        embedding = self.normalize(embedding).astype(np.float16)
+
+        try:
+            with self._file_lock(user_id):
+                version, ids, matrix = self._read_for_update(user_id)
+
+                if clothing_id in ids:
+                    matrix[ids.index(clothing_id)] = embedding
+                else:
+                    ids = ids + [clothing_id]
+                    matrix = embedding[None, :] if matrix is None else np.vstack((matrix, embedding[None, :]))
+
+                self._write(user_id, version, ids, matrix)
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while storing the embedding of clothing {clothing_id}: {e}")
+            raise e
+
+    def delete(self, user_id: str, clothing_id: str) -> None:
+        try:
+            with self._file_lock(user_id):
+                version, ids, matrix = self._read_for_update(user_id)
+                if clothing_id not in ids:
+                    return
+
+                row = ids.index(clothing_id)
+                self._write(user_id, version, ids[:row] + ids[row + 1:], np.delete(matrix, row, axis=0))
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while deleting the embedding of clothing {clothing_id}: {e}")
+            raise e
+
+    @staticmethod
+    def score(matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """
+        Returns: cosine similarity of every row with the normalized query
+        """
+        scores = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), SCORE_CHUNK_ROWS):
+            scores[start:start + SCORE_CHUNK_ROWS] = matrix[start:start + SCORE_CHUNK_ROWS].astype(np.float32) @ query
+        return scores
+
+    def search(self, user_id: str, query: np.ndarray, limit: int = 10, exclude: Optional[str] = None) -> list[tuple[str, float]]:
+        """
+        Returns: [(clothing_id, similarity), ...] best match first
+        """
+        ids, rows, matrix = self.load(user_id)
+        if not ids:
+            return []
+
+        scores = self.score(matrix, self.normalize(query))
+        if exclude in rows:
+            scores[rows[exclude]] = -np.inf
+
+        limit = min(limit, len(ids) - (exclude in rows))
+        if limit <= 0:
+            return []
+
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+
+        return [(ids[row], round(float(scores[row]), 4)) for row in top]
+
+    def similar(self, user_id: str, clothing_id: str, limit: int = 10) -> Optional[list[tuple[str, float]]]:
+        """
+        Returns: the most similar items of the same user, None if the item has no embedding
+        """
+        ids, rows, matrix = self.load(user_id)
+        if clothing_id not in rows:
+            return None
+
+        return self.search(user_id, matrix[rows[clothing_id]], limit, exclude=clothing_id)
+
+embedding_store = EmbeddingStore()
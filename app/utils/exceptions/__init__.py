@@ -16,7 +16,7 @@ from app.utils.exceptions.base import (
     UserNotFoundError
 )
 
-from app.utils.exceptions.validation import UnsupportedFileTypeError, FileTooLargeError, ImageUnclearError
+from app.utils.exceptions.validation import UnsupportedFileTypeError, FileTooLargeError, ImageUnclearError, PreviewQualityInvalidError, ImageDimensionsTooLargeError, RenditionWidthInvalidError
 from app.utils.exceptions.clothing import (
     ClothingIDMissingError,
     ClothingNameMissingError,
@@ -28,7 +28,8 @@ from app.utils.exceptions.clothing import (
     ClothingDescriptionTooLongError,
     ClothingImageInvalidError,
     ClothingSeasonsInvalidError,
-    ClothingTagsInvalidError
+    ClothingTagsInvalidError,
+    ClothingSearchQueryMissingError
 )
 from app.utils.exceptions.outfits import (
     OutfitIDMissingError,
@@ -77,6 +78,9 @@ __all__ = [
     "UnsupportedFileTypeError",
     "FileTooLargeError",
     "ImageUnclearError",
+    "PreviewQualityInvalidError",
+    "ImageDimensionsTooLargeError",
+    "RenditionWidthInvalidError",
     "ClothingNameMissingError",
     "ClothingCategoryMissingError",
     "ClothingColorMissingError",
@@ -88,6 +92,7 @@ __all__ = [
     "ClothingImageInvalidError",
     "ClothingSeasonsInvalidError",
     "ClothingTagsInvalidError",
+    "ClothingSearchQueryMissingError",
     "OutfitValidationError",
     "OutfitNotFoundError",
     "OutfitIDMissingError",
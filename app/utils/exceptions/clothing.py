@@ -42,4 +42,8 @@ class ClothingSeasonsInvalidError(ClothingValidationError):
 
 class ClothingTagsInvalidError(ClothingValidationError):
     def __init__(self, message="Clothing tags are invalid"):
+        super().__init__(message)
+
+class ClothingSearchQueryMissingError(ClothingValidationError):
+    def __init__(self, message="Clothing search query is missing"):
         super().__init__(message)
\ No newline at end of file
@@ -10,4 +10,16 @@ class FileTooLargeError(ValidationError):
 
 class ImageUnclearError(ValidationError):
     def __init__(self, message="Image is unclear"):
+        super().__init__(message)
+
+class PreviewQualityInvalidError(ValidationError):
+    def __init__(self, message="Invalid preview quality [Supported: fast, balanced, best]"):
+        super().__init__(message)
+
+class ImageDimensionsTooLargeError(FileTooLargeError):
+    def __init__(self, message="Image dimensions are too large"):
+        super().__init__(message)
+
+class RenditionWidthInvalidError(ValidationError):
+    def __init__(self, message="Invalid rendition width, it has to be a positive integer"):
         super().__init__(message)
\ No newline at end of file
@@ -0,0 +1,196 @@
+__all__ = ["image_gc", "GCReport", "REFERENCES"]
+
+import time
+import hashlib
+import numpy as np
+from os import getenv
+from typing import Iterator
+from dataclasses import dataclass
+from app.utils.database import Database
+from app.utils.storage import storage, StorageNamespace
+from app.utils.image_store import image_store
+from app.utils.logging import get_logger
+
+logger = get_logger()
+
+IMAGE_GC_BATCH = int(getenv("IMAGE_GC_BATCH", "5000")) # rows read and files listed per batch
+IMAGE_GC_PAUSE = float(getenv("IMAGE_GC_PAUSE", "0.05")) # seconds between two batches
+IMAGE_GC_GRACE = int(getenv("IMAGE_GC_GRACE", "3600")) # files younger than this at the start of the mark are never collected
+
+# namespace -> (table, primary key), the image_id of every row keeps its file alive
+REFERENCES = {
+    StorageNamespace.CLOTHING: ("clothing", "clothing_id"),
+    StorageNamespace.OUTFITS: ("outfits", "outfit_id"),
+}
+
+@dataclass
+class GCReport:
+    namespace: str
+    live_images: int = 0
+    refs_orphaned: int = 0
+    refs_released: int = 0
+    files_scanned: int = 0
+    files_garbage: int = 0
+    bytes_reclaimable: int = 0
+    files_deleted: int = 0
+    bytes_reclaimed: int = 0
+    duration: float = 0.0
+
+class ImageGarbageCollector:
+    """
+    Mark and sweep collection of stored images no row references anymore.
+    The mark streams the image_ids of a table in keyset paginated batches into a sorted array of 64 bit
+    hashes (8 bytes per image, a few MB for millions of rows). Image refs whose image_id is not in it are
+    released, then the content hashes of the remaining blobs are marked the same way and the namespace is
+    listed in batches, every file is looked up with a binary search. A hash collision can only keep garbage
+    alive, never collect a live image, and anything that arrived shortly before the mark is left alone since
+    its row may not be committed yet.
+    """
+
+    def __init__(self, batch_size: int = IMAGE_GC_BATCH, pause: float = IMAGE_GC_PAUSE, grace: int = IMAGE_GC_GRACE):
+        self.batch_size = batch_size
+        self.pause = pause
+        self.grace = grace
+
+    @staticmethod
+    def _hash(values: list[str]) -> np.ndarray:
+        return np.fromiter((int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big") for value in values), dtype=np.uint64, count=len(values))
+
+    def _paginate(self, query: str, params: tuple = ()) -> Iterator[list[tuple]]:
+        """
+        Returns: batches of rows, query selects the pagination key first and ends in "{key} > %s ORDER BY {key} LIMIT %s",
+        so every batch is an index range scan no matter how far in it is
+        """
+        last = ""
+        while True:
+            with Database.getConnection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(query, (*params, last, self.batch_size))
+                rows = cursor.fetchall()
+
+            if rows:
+                yield rows
+
+            if len(rows) < self.batch_size:
+                return
+            last = rows[-1][0]
+            time.sleep(self.pause)
+
+    def _mark(self, query: str, params: tuple = ()) -> np.ndarray:
+        """
+        Returns: sorted hashes of the second column of every row
+        """
+        chunks = [self._hash([row[1] for row in rows]) for rows in self._paginate(query, params)]
+        if not chunks:
+            return np.empty(0, dtype=np.uint64)
+
+        return np.unique(np.concatenate(chunks))
+
+    def mark(self, namespace: str) -> np.ndarray:
+        """
+        Returns: sorted hashes of every image_id referenced from the table behind namespace
+        """
+        table, primary_key = REFERENCES[namespace]
+        return self._mark(f"SELECT {primary_key}, image_id FROM {table} WHERE {primary_key} > %s ORDER BY {primary_key} LIMIT %s;")
+
+    @staticmethod
+    def _is_live(live: np.ndarray, hashes: np.ndarray) -> np.ndarray:
+        if live.size == 0:
+            return np.zeros(hashes.shape, dtype=bool)
+
+        positions = np.minimum(np.searchsorted(live, hashes), live.size - 1)
+        return live[positions] == hashes
+
+    def _release_orphaned_refs(self, namespace: str, live: np.ndarray, cutoff: float, report: GCReport, dry_run: bool) -> dict[str, int]:
+        """
+        Returns: with dry_run, content hash -> number of its refs a real run would release, empty otherwise
+        """
+        released: dict[str, int] = {}
+        query = "SELECT r.image_id, UNIX_TIMESTAMP(r.created_at), r.content_hash, b.size FROM image_refs r JOIN image_blobs b ON b.namespace = r.namespace AND b.content_hash = r.content_hash WHERE r.namespace = %s AND r.image_id > %s ORDER BY r.image_id LIMIT %s;"
+        for rows in self._paginate(query, (namespace,)):
+            is_live = self._is_live(live, self._hash([row[0] for row in rows]))
+            for (image_id, created_at, content_hash, size), keep in zip(rows, is_live):
+                if keep or float(created_at) >= cutoff:
+                    continue
+
+                report.refs_orphaned += 1
+                if dry_run:
+                    released[content_hash] = released.get(content_hash, 0) + 1
+                    continue
+
+                report.refs_released += 1
+                if image_store.release(namespace, image_id):
+                    # the last reference took the file with it, the sweep below will not see it anymore
+                    report.files_garbage += 1
+                    report.bytes_reclaimable += size
+                    report.files_deleted += 1
+                    report.bytes_reclaimed += size
+
+        return released
+
+    def _mark_blobs(self, namespace: str, released: dict[str, int]) -> np.ndarray:
+        """
+        Returns: sorted hashes of the content hashes that still have a reference
+        A dry run leaves the orphaned refs in the table, released holds them so their blobs are not marked either.
+        """
+        if not released:
+            return self._mark("SELECT content_hash, content_hash FROM image_blobs WHERE namespace = %s AND content_hash > %s ORDER BY content_hash LIMIT %s;", (namespace,))
+
+        chunks = []
+        for rows in self._paginate("SELECT content_hash, refcount FROM image_blobs WHERE namespace = %s AND content_hash > %s ORDER BY content_hash LIMIT %s;", (namespace,)):
+            chunks.append(self._hash([content_hash for content_hash, refcount in rows if refcount > released.get(content_hash, 0)]))
+        if not chunks:
+            return np.empty(0, dtype=np.uint64)
+
+        return np.unique(np.concatenate(chunks))
+
+    def collect(self, namespace: str, dry_run: bool = False) -> GCReport:
+        """
+        Returns: report of the garbage found, with dry_run nothing is released or deleted and only the reclaimable bytes are reported
+        """
+        report = GCReport(namespace)
+        started = time.monotonic()
+        cutoff = time.time() - self.grace
+
+        try:
+            live = self.mark(namespace)
+            report.live_images = int(live.size)
+            released = self._release_orphaned_refs(namespace, live, cutoff, report, dry_run)
+
+            # files are named by content hash, images from before content addressing by their image_id
+            blobs = self._mark_blobs(namespace, released)
+            live = np.unique(np.concatenate((live, blobs)))
+
+            cursor = None
+            while True:
+                objects, cursor = storage.scan(namespace, cursor, self.batch_size)
+                report.files_scanned += len(objects)
+
+                if objects:
+                    is_live = self._is_live(live, self._hash([stored.key.rsplit(".", 1)[0] for stored in objects]))
+                    for stored, keep in zip(objects, is_live):
+                        if keep or stored.modified >= cutoff:
+                            continue
+
+                        report.files_garbage += 1
+                        report.bytes_reclaimable += stored.size
+                        if not dry_run and storage.delete(namespace, stored.key):
+                            report.files_deleted += 1
+                            report.bytes_reclaimed += stored.size
+
+                if cursor is None:
+                    break
+                time.sleep(self.pause)
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while collecting garbage in {namespace}: {e}")
+            raise e
+        finally:
+            report.duration = time.monotonic() - started
+
+        logger.info(f"Image GC of {namespace}{' (dry run)' if dry_run else ''}: {report.live_images} live images, {report.refs_orphaned} orphaned refs ({report.refs_released} released), {report.files_scanned} files scanned, {report.files_garbage} garbage ({report.bytes_reclaimable} bytes), {report.files_deleted} deleted ({report.bytes_reclaimed} bytes) in {report.duration:.2f}s.")
+        return report
+
+    def collect_all(self, dry_run: bool = False) -> list[GCReport]:
+        return [self.collect(namespace, dry_run) for namespace in REFERENCES]
+
+image_gc = ImageGarbageCollector()
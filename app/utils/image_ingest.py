@@ -0,0 +1,123 @@
+__all__ = ["image_ingest"]
+
+import filetype
+from os import getenv
+from io import BytesIO
+from PIL import Image, UnidentifiedImageError
+from werkzeug.datastructures import FileStorage
+from app.utils.exceptions import UnsupportedFileTypeError, FileTooLargeError, ImageDimensionsTooLargeError
+from app.utils.logging import get_logger
+
+logger = get_logger()
+
+PREVIEW_MAX_UPLOAD_BYTES = 4 * 1024 * 1024
+PREVIEW_MAX_PIXELS = int(getenv("PREVIEW_MAX_PIXELS", "40000000")) # checked from the header, before anything is decoded
+PREVIEW_WORKING_SIZE = int(getenv("PREVIEW_WORKING_SIZE", "1024")) # segmentation, color and CLIP run at this size, the stored cutout keeps the full resolution
+
+SUPPORTED_MIME_TYPES = ("image/jpeg", "image/png")
+CUTOUT_MIN_TRANSPARENT = 0.02 # share of fully transparent pixels for an upload to count as already cut out
+CUTOUT_MIN_OPAQUE = 0.02
+SNIFF_BYTES = 261 # filetype never needs more than this
+WEBP_MAX_SIZE = 16383 # longest side a WEBP can store
+CHUNK_SIZE = 64 * 1024
+
+class ImageIngest:
+    """
+    Bounded memory intake of preview uploads.
+    The upload is streamed in chunks and rejected as soon as it exceeds the size limit, the type comes from
+    the magic bytes instead of the filename and the pixel count is checked from the header before anything is decoded.
+    """
+
+    def __init__(self, max_bytes: int = PREVIEW_MAX_UPLOAD_BYTES, max_pixels: int = PREVIEW_MAX_PIXELS, working_size: int = PREVIEW_WORKING_SIZE):
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.working_size = working_size
+
+    def read_upload(self, file: FileStorage) -> bytes:
+        """
+        Returns: the raw upload, at most max_bytes long
+        """
+        if not isinstance(file, FileStorage):
+            raise UnsupportedFileTypeError("The file provided is not a supported image type. Supported types are PNG, JPG, and JPEG.")
+
+        data = bytearray()
+        sniffed = False
+        while True:
+            chunk = file.stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+
+            data += chunk
+            if len(data) > self.max_bytes:
+                raise FileTooLargeError(f"File is too large (max {self.max_bytes // (1024 * 1024)}MB)")
+
+            # wrong types are rejected before the rest of the upload is read
+            if not sniffed and len(data) >= SNIFF_BYTES:
+                self._check_type(data)
+                sniffed = True
+
+        if not sniffed:
+            self._check_type(data)
+
+        return bytes(data)
+
+    @staticmethod
+    def _check_type(data: bytearray) -> None:
+        kind = filetype.guess(bytes(data[:SNIFF_BYTES]))
+        if kind is None or kind.mime not in SUPPORTED_MIME_TYPES:
+            raise UnsupportedFileTypeError("The file provided is not a supported image type. Supported types are PNG, JPG, and JPEG.")
+
+    def decode(self, data: bytes) -> Image.Image:
+        """
+        Returns: RGB image (RGBA if the upload has transparency) at full resolution, only shrunk where WEBP could not store it
+        """
+        try:
+            # only the header is parsed here, the pixel data is decoded by convert() below
+            image = Image.open(BytesIO(data))
+        except UnidentifiedImageError:
+            raise UnsupportedFileTypeError("The file provided is not a supported image type. Supported types are PNG, JPG, and JPEG.")
+        except Image.DecompressionBombError:
+            raise ImageDimensionsTooLargeError(f"Image dimensions are too large (max {self.max_pixels} pixels)")
+
+        width, height = image.size
+        if width * height > self.max_pixels:
+            raise ImageDimensionsTooLargeError(f"Image dimensions are too large ({width}x{height}, max {self.max_pixels} pixels)")
+
+        if image.format == "JPEG" and max(width, height) > WEBP_MAX_SIZE:
+            # DCT scaling decodes at 1/2, 1/4 or 1/8 directly, never below the requested size
+            image.draft("RGB", (WEBP_MAX_SIZE, WEBP_MAX_SIZE))
+
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+        image.thumbnail((WEBP_MAX_SIZE, WEBP_MAX_SIZE), Image.LANCZOS)
+
+        logger.debug(f"Decoded {width}x{height} upload to {image.width}x{image.height}.")
+        return image
+
+    def to_working_size(self, image: Image.Image) -> Image.Image:
+        """
+        Returns: copy of the image no larger than working_size on its longest side, the image itself if it already fits
+        """
+        if max(image.size) <= self.working_size:
+            return image
+
+        working = image.copy()
+        working.thumbnail((self.working_size, self.working_size), Image.BILINEAR)
+        return working
+
+    @staticmethod
+    def has_cutout_alpha(image: Image.Image) -> bool:
+        """
+        Returns: whether the alpha channel already separates a foreground from a transparent background
+        """
+        if image.mode != "RGBA":
+            return False
+
+        histogram = image.getchannel("A").histogram()
+        pixels = image.width * image.height
+        transparent = sum(histogram[:10]) / pixels
+        opaque = sum(histogram[246:]) / pixels
+
+        return transparent >= CUTOUT_MIN_TRANSPARENT and opaque >= CUTOUT_MIN_OPAQUE
+
+image_ingest = ImageIngest()
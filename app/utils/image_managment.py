@@ -1,152 +1,344 @@
-__all__ = ["image_manager"]
+__all__ = ["image_manager", "PreviewStage"]
 
 import traceback
+import base64
 import uuid
-import os
-from typing import Optional
-from app.utils.exceptions import ImageUnclearError, UnsupportedFileTypeError, FileTooLargeError
+from typing import Optional, Iterator, Generator
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.exceptions import ImageUnclearError
 from werkzeug.datastructures import FileStorage
+from mysql.connector import MySQLConnection
 from PIL import Image
 from io import BytesIO
-from backgroundremover import bg
+from app.utils.model_managment import model_manager
+from app.utils.batching import MicroBatcher
+from app.utils.preview_cache import preview_cache, CachedPreview
+from app.utils.color_palette import palette_extractor
+from app.utils.image_ingest import image_ingest
+from app.utils.preview_quality import quality_policy, PreviewQuality
+from app.utils.duplicate_index import duplicate_index
+from app.utils.kernels import kernels
+from app.utils.storage import storage, StorageNamespace
+from app.utils.preview_staging import preview_staging
+from app.utils.image_store import image_store
 from app.utils.logging import get_logger
-from app.models.clothing import ClothingCategory
 
-from transformers import AutoTokenizer
-from timm import create_model
-from sklearn.cluster import KMeans
-
-from fashion_clip.fashion_clip import FashionCLIP
-import torch
 import numpy as np
 
-fclip = FashionCLIP("fashion-clip")
-
 logger = get_logger()
 
-CATEGORIES = [category.value for category in ClothingCategory]
+COARSE_PREVIEW_SIZE = 256
+
+class PreviewPipeline:
+    SEGMENTATION = "segmentation"
+    EXISTING_ALPHA = "existing_alpha"
+
+class PreviewStage:
+    COARSE = "coarse"
+    FOREGROUND = "foreground"
+    PALETTE = "palette"
+    ATTRIBUTES = "attributes"
+    DONE = "done"
 
 class ImageManager:
     
-    def process_image_preview(self, file: FileStorage) -> dict:
-        if not isinstance(file, FileStorage) or not isinstance(file.filename, str) or not file.filename.endswith((".png", ".jpg", ".jpeg")):
-            raise UnsupportedFileTypeError("The file provided is not a supported image type. Supported types are PNG, JPG, and JPEG.")
+    def __init__(self):
+        self._image_writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-writer")
+        self._clip_batcher = MicroBatcher("fashion-clip", self._encode_images)
+    
+    def process_image_preview(self, file: FileStorage, user_id: str, quality: PreviewQuality = quality_policy.default) -> dict:
+        return self.process_image_preview_data(self.read_preview_upload(file), user_id, quality)
+    
+    def read_preview_upload(self, file: FileStorage) -> bytes:
+        return image_ingest.read_upload(file)
+    
+    def process_image_preview_data(self, data: bytes, user_id: str, quality: PreviewQuality = quality_policy.default) -> dict:
+        image_id = str(uuid.uuid4())
         
-        if len(file.read()) > 4*1024*1024:
-            raise FileTooLargeError("File is too large (max 4MB)")
+        # identical uploads (retries, re-uploads) are served from the cache and share one in-flight computation
+        preview, was_cached = preview_cache.get_or_compute(preview_cache.key(data, quality.value), lambda: self._compute_preview(data, quality))
+        if was_cached:
+            logger.debug(f"Preview {image_id} served from cache.")
         
-        file.seek(0)
+        # the write overlaps the duplicate lookup, but the image_id only goes out once the preview is staged
+        written = self._image_writer.submit(self._write_preview, preview, image_id, user_id)
+        duplicates = self._find_duplicates(preview.result, user_id)
+        written.result()
         
+        return {
+            "image_url": f"https://api.clothing-booth.com/uploads/temp/{image_id}.webp",
+            "image_id": image_id,
+            **preview.result,
+            "image_duplicates": duplicates
+        }
+    
+    def stream_image_preview_data(self, data: bytes, user_id: str, quality: PreviewQuality = quality_policy.default) -> Iterator[tuple[str, dict]]:
+        """
+        Progressive variant of process_image_preview_data, every pipeline stage is handed out as soon as it finished.
+        Returns: (event, payload) pairs, coarse -> foreground -> palette -> attributes -> done
+        """
         image_id = str(uuid.uuid4())
-        image_path = f"app/static/temp/" + image_id + ".webp"
-        processed_image = self._extract_foreground(file)
+        image_url = f"https://api.clothing-booth.com/uploads/temp/{image_id}.webp"
+        
+        key = preview_cache.key(data, quality.value)
+        preview = preview_cache.get(key)
+        
+        if preview is None:
+            stages = self._preview_stages(data, quality, progressive=True)
+            while True:
+                try:
+                    stage, payload = next(stages)
+                except StopIteration as finished:
+                    preview = finished.value
+                    break
+                
+                if stage == PreviewStage.FOREGROUND:
+                    # the client loads the refined image right away, so it is written before the event goes out
+                    self._stage_preview(image_id, user_id, payload.pop("webp"))
+                    payload.update({"image_url": image_url, "image_id": image_id})
+                
+                yield stage, payload
+            
+            preview_cache.put(key, preview)
+            if preview.embedding is not None:
+                self._attach_embedding(image_id, preview.embedding)
+        else:
+            logger.debug(f"Preview {image_id} served from cache.")
+            self._write_preview(preview, image_id, user_id)
         
-        processed_image.save(image_path, format="WEBP")
+        yield PreviewStage.DONE, {
+            "image_url": image_url,
+            "image_id": image_id,
+            **preview.result,
+            "image_duplicates": self._find_duplicates(preview.result, user_id)
+        }
+    
+    def _find_duplicates(self, result: dict, user_id: str) -> list[dict]:
+        """
+        Returns: [{"clothing_id": str, "distance": int}, ...] clothing of the user that most likely shows the same garment, closest first
+        """
+        # the hash is user independent and cached with the preview, entries cached before it existed have none
+        if "image_hash" not in result:
+            return []
         
-        dominant_hexcode = self._extract_dominant_color(processed_image)
+        matches = duplicate_index.lookup(user_id, int(result["image_hash"], 16))
+        return [{"clothing_id": clothing_id, "distance": distance} for clothing_id, distance in matches]
+    
+    def _compute_preview(self, data: bytes, quality: PreviewQuality) -> CachedPreview:
+        stages = self._preview_stages(data, quality)
+        while True:
+            try:
+                next(stages)
+            except StopIteration as finished:
+                return finished.value
+    
+    def _preview_stages(self, data: bytes, quality: PreviewQuality, progressive: bool = False) -> Generator[tuple[str, dict], None, CachedPreview]:
+        """
+        Yields: (stage, payload) after every step, the coarse stage only if progressive
+        Returns: the finished CachedPreview
+        """
+        # decoded once at full resolution for the stored cutout, segmentation, color and CLIP share one working size copy
+        original = image_ingest.decode(data)
+        image = image_ingest.to_working_size(original)
+        
+        # uploads that were already cut out on the device skip segmentation and matting entirely
+        if image_ingest.has_cutout_alpha(image):
+            pipeline = PreviewPipeline.EXISTING_ALPHA
+            processed_image = self._crop_to_alpha(image)
+            stored_image = self._crop_to_alpha(original)
+        else:
+            pipeline = PreviewPipeline.SEGMENTATION
+            mask = None
+            
+            if progressive:
+                # the u2net mask is needed for the refined cutout anyway, the coarse one only adds a small naive cutout
+                mask = model_manager.segmentation.predict_mask(image)
+                yield PreviewStage.COARSE, self._coarse_preview(image, mask)
+            
+            cutout, box = self._extract_foreground(image, quality, mask)
+            processed_image = self._crop_to_alpha(cutout)
+            stored_image = self._apply_cutout(original, image, cutout, box)
+        
+        image_hash = duplicate_index.to_hex(duplicate_index.dhash(processed_image))
+        
+        webp = BytesIO()
+        stored_image.save(webp, format="WEBP")
+        yield PreviewStage.FOREGROUND, {"webp": webp.getvalue()}
+        
+        palette = self._extract_palette(processed_image)
+        dominant_hexcode = palette[0]["color"] if palette else "#000000"
         logger.info(dominant_hexcode)
+        yield PreviewStage.PALETTE, {"image_color": dominant_hexcode, "image_palette": palette}
         
-        clothing_category = self._extract_clothing_category(image_path)
-        logger.info(clothing_category)
+        image_emb = self._encode_image(processed_image)
+        attributes = model_manager.label_bank.classify(image_emb)
+        logger.info(attributes["category"])
         
-        return {
-            "image_url": f"https://api.clothing-booth.com/uploads/temp/{image_id}.webp",
-            "image_id": image_id,
+        result = {
             "image_color": dominant_hexcode,
-            "image_category": clothing_category,
-            "image_seasons": [],
-            "image_tags": []
+            "image_palette": palette,
+            "image_category": attributes["category"].value,
+            "image_seasons": [season.name for season in attributes["seasons"]],
+            "image_tags": [tag.name for tag in attributes["tags"]],
+            "image_confidences": attributes["confidences"],
+            "image_quality": quality.value,
+            "image_pipeline": pipeline,
+            "image_hash": image_hash
         }
+        yield PreviewStage.ATTRIBUTES, {key: result[key] for key in ("image_category", "image_seasons", "image_tags", "image_confidences")}
+        
+        return CachedPreview(webp=webp.getvalue(), result=result, embedding=np.asarray(image_emb, dtype=np.float16).tobytes())
     
-    def _extract_clothing_category(self, image_path: str) -> str:
-        image_emb = fclip.encode_images([image_path], batch_size=1)
-        text_emb = fclip.encode_text(CATEGORIES, batch_size=1)
+    def _coarse_preview(self, image: Image.Image, mask: Image.Image) -> dict:
+        """
+        Returns: {"image_data": small WEBP data uri, "image_category": provisional category}
+        """
+        small = image.copy()
+        small.thumbnail((COARSE_PREVIEW_SIZE, COARSE_PREVIEW_SIZE), Image.BILINEAR)
         
-        sims = (image_emb @ text_emb.T).squeeze(0)
-        best_idx = int(np.argmax(sims))
-        predicted_category = CATEGORIES[best_idx]
+        coarse = self._crop_to_alpha(model_manager.segmentation.segment(small, alpha_matting=False, mask=mask))
         
-        return predicted_category
+        webp = BytesIO()
+        coarse.save(webp, format="WEBP", quality=60)
         
-    def _extract_dominant_color(self, image: Image.Image) -> str:
-        arr = np.array(image.resize((100, 100)))
+        return {
+            "image_data": "data:image/webp;base64," + base64.b64encode(webp.getvalue()).decode(),
+            "image_category": self._extract_clothing_attributes(coarse)["category"].value,
+        }
+    
+    @staticmethod
+    def _crop_to_alpha(image: Image.Image) -> Image.Image:
+        """
+        Returns: the image cropped to its visible pixels, unchanged if there are none
+        """
+        bbox = kernels.alpha_bbox(np.asarray(image.getchannel("A")))
+        return image if bbox is None else image.crop(bbox)
+    
+    def _write_preview(self, preview: CachedPreview, image_id: str, user_id: str) -> None:
+        # the embedding sidecar is picked up by pop_preview_embedding once the item is created
+        self._stage_preview(image_id, user_id, preview.webp, preview.embedding)
+    
+    def _stage_preview(self, image_id: str, user_id: str, webp: bytes, embedding: Optional[bytes] = None) -> None:
+        try:
+            preview_staging.stage(image_id, user_id, webp, embedding)
+        except Exception as e:
+            logger.error(f"An unexpected error occured while staging the preview {image_id}: {e}")
+            logger.error(traceback.format_exc())
+            raise e
+    
+    def _attach_embedding(self, image_id: str, embedding: bytes) -> None:
+        try:
+            preview_staging.attach_embedding(image_id, embedding)
+        except Exception as e:
+            logger.error(f"An unexpected error occured while saving the embedding of the preview {image_id}: {e}")
+            logger.error(traceback.format_exc())
+    
+    def preview_exists(self, image_id: str, user_id: str) -> bool:
+        return preview_staging.is_staged(image_id, user_id)
+    
+    def discard_preview(self, image_id: str) -> None:
+        """
+        Removes a preview from staging once the item it became is committed, a failure only leaves it to the janitor.
+        """
+        try:
+            preview_staging.remove(image_id)
+        except Exception as e:
+            logger.error(f"An unexpected error occured while removing the staged preview {image_id}: {e}")
+            logger.error(traceback.format_exc())
+    
+    def pop_preview_embedding(self, image_id: str) -> Optional[np.ndarray]:
+        """
+        Returns: the FashionCLIP embedding computed for the preview, None if there is none
+        """
+        embedding = preview_staging.pop_embedding(image_id)
+        if embedding is None:
+            return None
         
-        rgb = arr[:, :, :3].reshape(-1, 3)
-        alpha = arr[:, :, 3].reshape(-1)
-
-        mask = alpha > 10 # remove half-transparent pixels
-        rgb = rgb[mask]
+        return np.frombuffer(embedding, dtype=np.float16)
+    
+    def _encode_images(self, images: list[Image.Image]) -> list[np.ndarray]:
+        inputs = model_manager.fashion_clip.preprocess(images=images, return_tensors="np")
+        image_emb = model_manager.backend.encode_images(inputs["pixel_values"].astype(np.float32))
         
-        if len(rgb) == 0:
-            return "#000000"
+        return list(image_emb)
+    
+    def _encode_image(self, image: Image.Image) -> np.ndarray:
+        return self._clip_batcher(image)
+    
+    def _extract_clothing_attributes(self, image: Image.Image) -> dict:
+        image_emb = self._encode_image(image)
         
-        dominant_color = tuple(KMeans(n_clusters=1, random_state=0).fit(rgb).cluster_centers_[0].astype(int))
-        dominant_color_hex = '#{:02X}{:02X}{:02X}'.format(*dominant_color)
+        return model_manager.label_bank.classify(image_emb)
         
-        return dominant_color_hex
+    def _extract_palette(self, image: Image.Image) -> list[dict]:
+        """
+        Returns: [{"color": "#RRGGBB", "coverage": float}, ...], the first entry is the primary swatch
+        """
+        return palette_extractor.extract(image)
 
-    def _extract_foreground(self, file: Optional[FileStorage]) -> Image.Image:
+    def _extract_foreground(self, image: Image.Image, quality: PreviewQuality = PreviewQuality.BEST, mask: Optional[Image.Image] = None) -> tuple[Image.Image, tuple[int, int, int, int]]:
+        """
+        Returns: (RGBA cutout, box of the image it covers), the box is smaller than the frame when only the region of interest was segmented
+        """
+        settings = dict(quality_policy.settings(quality))
+        
         try:
-            image = Image.open(file)
-            image = image.convert("RGBA")
-            
-            pngImage = BytesIO()
-            image.save(pngImage, format="PNG")
-            pngImage.seek(0)
-            
             try:
-                without_background = bg.remove(pngImage.read(), model_name="u2net_cloth_segm",
-                                        alpha_matting=True,
-                                        alpha_matting_foreground_threshold=200, # 240
-                                        alpha_matting_background_threshold=10, #30 # 10
-                                        alpha_matting_erode_structure_size=13, #5 # 10
-                                        alpha_matting_base_size=512, # 1000
-                                        )
+                if settings.pop("roi", False):
+                    return model_manager.segmentation.segment_roi(image, coarse_mask=mask, **settings)
+                
+                return model_manager.segmentation.segment(image, mask=mask, **settings), (0, 0, image.width, image.height)
             except ValueError as e:
                 raise ImageUnclearError("The provided image does not contain a foreground.")
             except Exception as e:
                 logger.error(f"An unexpected error occured while removing the background of an image: {e}")
                 logger.error(traceback.format_exc())
                 raise e
-
-            new_image = Image.open(BytesIO(without_background))
-            
-            alpha = new_image.getchannel("A")
-            bbox = alpha.getbbox()
-            
-            cropped_image = new_image.crop(bbox)
-            
-            return cropped_image
         except Exception as e:
             logger.error(f"An unexpected error occured while removing the background of an image: {e}")
             logger.error(traceback.format_exc())
             raise e
+    
+    def _apply_cutout(self, original: Image.Image, image: Image.Image, cutout: Image.Image, box: tuple[int, int, int, int]) -> Image.Image:
+        """
+        Scales the alpha of a cutout made on the working size image up onto the full resolution original.
+        Returns: the stored cutout, cropped to its visible pixels
+        """
+        if original is image:
+            return self._crop_to_alpha(cutout)
+        
+        scale = original.width / image.width
+        full_box = tuple(min(round(value * scale), limit) for value, limit in zip(box, original.size * 2))
+        
+        stored = original.crop(full_box).convert("RGB")
+        stored.putalpha(cutout.getchannel("A").resize(stored.size, Image.BILINEAR))
+        return self._crop_to_alpha(stored)
 
-    def move_preview_image_to_permanent(self, filename: Optional[str], is_clothing: bool = True) -> str:
+    def move_preview_image_to_permanent(self, filename: Optional[str], user_id: str, is_clothing: bool = True, conn: Optional[MySQLConnection] = None) -> str:
+        """
+        Copies the staged preview into permanent storage, it stays staged until discard_preview() is called after the commit.
+        :param conn: transaction of the row that uses the image, its reference is only kept if that commits
+        Raises: FileNotFoundError if the preview is not staged for user_id, e.g. expired or already used
+        """
         if not filename:
             raise ValueError("Filename cannot be empty.")
         
-        if not filename.endswith(".webp"):
-            filename = filename + ".webp"
+        image_id = filename[:-len(".webp")] if filename.endswith(".webp") else filename
         
         try:
-            src = f"app/static/temp/{filename}"
-            dst = f"app/static/clothing_images/{filename}" if is_clothing else f"app/static/profile_pictures/{filename}"
-            if not os.path.exists(src):
-                raise FileNotFoundError(f"The temporary image {src} does not exist.")
-            os.rename(src, dst)
-            return dst
+            namespace = StorageNamespace.CLOTHING if is_clothing else StorageNamespace.PROFILE_PICTURES
+            content_hash = image_store.add(namespace, image_id, preview_staging.read(image_id, user_id), conn)
+            return f"{namespace}/{image_store.blob_key(content_hash)}"
         except FileNotFoundError as e:
             logger.error(f"File not found: {e}")
             raise e
         except Exception as e:
             logger.error(f"An unexpected error occurred while moving the image: {e}")
             raise e
-            
-    # ! DELETION of old temp images
     
-    def save_outfit_preview(self, preview_file: FileStorage) -> tuple[str, str]:
+    def save_outfit_preview(self, preview_file: FileStorage, conn: Optional[MySQLConnection] = None) -> tuple[str, str]:
         """
+        :param conn: transaction of the outfit that uses the collage, its reference is only kept if that commits
         Returns: (public_url, image_id)
         """
         
@@ -160,38 +352,35 @@ class ImageManager:
         max_size = (1024, 1024)
         img.thumbnail(max_size, Image.Resampling.LANCZOS)
 
-        alpha = img.getchannel("A")
-        bbox = alpha.getbbox()
-        if bbox:
-            img = img.crop(bbox)
+        img = self._crop_to_alpha(img)
 
         filename = str(uuid.uuid4())
-        path = f"app/static/outfit_collages/{filename}.webp"
-        img.save(path, "WEBP")  # optional: quality=85, method=6
+        webp = BytesIO()
+        img.save(webp, "WEBP")  # optional: quality=85, method=6
+        image_store.add(StorageNamespace.OUTFITS, filename, webp.getvalue(), conn)
 
         public_url = f"https://api.clothing-booth.com/uploads/outfit_collages/{filename}.webp"
         return public_url, filename
     
     def load_clothing_image_by_id(self, image_id: str) -> Image.Image:
-        image_path = os.path.join(
-            "app/static/clothing_images",
-            f"{image_id}.webp"
-        )
-
-        if not os.path.exists(image_path):
+        try:
+            data = storage.get(StorageNamespace.CLOTHING, image_store.resolve(StorageNamespace.CLOTHING, image_id))
+        except FileNotFoundError:
             raise FileNotFoundError("Image file missing")
 
-        return Image.open(image_path)
+        return Image.open(BytesIO(data))
     
-    def generate_outfit_preview(self, items: list[dict]) -> tuple[str, str]:
+    def generate_outfit_preview(self, items: list[dict], conn: Optional[MySQLConnection] = None) -> tuple[str, str]:
         """
+        :param conn: transaction of the outfit that uses the collage, its reference is only kept if that commits
         Returns: (public_url, image_id)
         """
         
         canvas_width = 1024
         canvas_height = 1024
 
-        canvas = Image.new("RGBA", (canvas_width, canvas_height), (255, 255, 255, 0))
+        # composited as a plain array, converted to an image once at the end
+        canvas = np.zeros((canvas_height, canvas_width, 4), dtype=np.uint8)
         
         items.sort(key=lambda x: x["item"]["z"])
 
@@ -203,16 +392,18 @@ class ImageManager:
             )
         
         filename = str(uuid.uuid4())
-        path = f"app/static/outfit_collages/{filename}.webp"
-        canvas.save(path, "WEBP")
+        webp = BytesIO()
+        Image.fromarray(canvas, "RGBA").save(webp, "WEBP")
+        image_store.add(StorageNamespace.OUTFITS, filename, webp.getvalue(), conn)
         
         public_url = f"https://api.clothing-booth.com/uploads/outfit_collages/{filename}.webp"
         return public_url, filename
         
-    def _place_item(self, canvas: Image.Image, item_data: dict, image_id: str):
-        image = self.load_clothing_image_by_id(image_id)
+    def _place_item(self, canvas: np.ndarray, item_data: dict, image_id: str):
+        image = self.load_clothing_image_by_id(image_id).convert("RGBA")
+        canvas_height, canvas_width = canvas.shape[:2]
         
-        target_width = item_data["scale"] * canvas.width
+        target_width = item_data["scale"] * canvas_width
 
         aspect = image.height / image.width
         target_height = target_width * aspect
@@ -221,15 +412,16 @@ class ImageManager:
         
         image = image.rotate(-item_data["rotation"], expand=True)
         
-        center_x = item_data["x"] * canvas.width
-        center_y = item_data["y"] * canvas.height
+        center_x = item_data["x"] * canvas_width
+        center_y = item_data["y"] * canvas_height
         
         paste_x = int(center_x - image.width / 2)
         paste_y = int(center_y - image.height / 2)
         
-        canvas.paste(image, (paste_x, paste_y), image)
+        # "over" compositing, pasting with the item as its own mask squared the alpha of soft edges on the transparent canvas
+        kernels.composite_over(canvas, np.asarray(image), paste_x, paste_y)
     
     def delete_outfit_preview(self, image_id: str):
-        os.remove(f"app/static/outfit_collages/{image_id}.webp")
+        image_store.release(StorageNamespace.OUTFITS, image_id)
     
 image_manager = ImageManager()
\ No newline at end of file
@@ -0,0 +1,170 @@
+__all__ = ["image_store"]
+
+import hashlib
+import threading
+import traceback
+from typing import Optional
+from collections import OrderedDict
+from mysql.connector import MySQLConnection
+from app.utils.database import Database
+from app.utils.storage import storage
+from app.utils.logging import get_logger
+
+logger = get_logger()
+
+RESOLVE_CACHE_SIZE = 10000
+
+class ImageStore:
+    """
+    Content addressed permanent images with reference counting.
+    Every image_id (the id clothing and outfits refer to) is a row in image_refs pointing at a blob in image_blobs,
+    the file of a blob is stored once per namespace as "{sha256}.webp" and deleted when its last reference goes.
+    Images stored before content addressing have no ref and stay at "{image_id}.webp".
+    """
+
+    def __init__(self):
+        self._resolved: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ensure_table_exists(self) -> None:
+        with Database.getConnection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                            CREATE TABLE IF NOT EXISTS image_blobs(
+                            namespace VARCHAR(32) NOT NULL,
+                            content_hash CHAR(64) NOT NULL,
+                            size INT NOT NULL,
+                            refcount INT NOT NULL DEFAULT 0,
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                            PRIMARY KEY (namespace, content_hash)
+                            );
+                            """)
+            cursor.execute("""
+                            CREATE TABLE IF NOT EXISTS image_refs(
+                            image_id VARCHAR(36) PRIMARY KEY,
+                            namespace VARCHAR(32) NOT NULL,
+                            content_hash CHAR(64) NOT NULL,
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                            FOREIGN KEY (namespace, content_hash) REFERENCES image_blobs(namespace, content_hash)
+                            );
+                            """)
+            conn.commit()
+
+    @staticmethod
+    def blob_key(content_hash: str) -> str:
+        return f"{content_hash}.webp"
+
+    def add(self, namespace: str, image_id: str, data: bytes, conn: Optional[MySQLConnection] = None) -> str:
+        """
+        Stores data as image_id, the file is only written if no other image has the same content.
+        :param conn: open transaction of the row that references the image, the ref is committed or rolled back with it
+        and the blob row stays locked until then. Without one the ref is committed right away.
+        A new file whose transaction is rolled back is left to the garbage collector.
+        Returns: content hash
+        """
+        content_hash = hashlib.sha256(data).hexdigest()
+
+        try:
+            if conn is not None:
+                self._add(conn.cursor(), namespace, image_id, content_hash, data)
+                return content_hash
+
+            with Database.getConnection() as conn:
+                self._add(conn.cursor(), namespace, image_id, content_hash, data)
+                conn.commit()
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while storing the image {image_id}: {e}")
+            logger.error(traceback.format_exc())
+            raise e
+
+        self._remember(image_id, self.blob_key(content_hash))
+        return content_hash
+
+    def _add(self, cursor, namespace: str, image_id: str, content_hash: str, data: bytes) -> None:
+        # locks the blob row, a concurrent release of the same content waits until this commits
+        cursor.execute("INSERT INTO image_blobs(namespace, content_hash, size, refcount) VALUES (%s, %s, %s, 1) ON DUPLICATE KEY UPDATE refcount = refcount + 1;", (namespace, content_hash, len(data)))
+        cursor.execute("INSERT INTO image_refs(image_id, namespace, content_hash) VALUES (%s, %s, %s);", (image_id, namespace, content_hash))
+
+        if storage.stat(namespace, self.blob_key(content_hash)) is None:
+            storage.put(namespace, self.blob_key(content_hash), data)
+        else:
+            logger.debug(f"Image {image_id} deduplicated onto {namespace}/{content_hash}.")
+
+    def release(self, namespace: str, image_id: str) -> bool:
+        """
+        Drops the reference of image_id, the file goes with the last reference to its content.
+        Returns: whether a file was deleted
+        """
+        with self._lock:
+            self._resolved.pop(image_id, None)
+
+        try:
+            with Database.getConnection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT content_hash FROM image_refs WHERE image_id = %s AND namespace = %s FOR UPDATE;", (image_id, namespace))
+                ref = cursor.fetchone()
+
+                if ref is None:
+                    return storage.delete(namespace, f"{image_id}.webp")
+
+                content_hash = ref[0]
+                cursor.execute("DELETE FROM image_refs WHERE image_id = %s;", (image_id,))
+                cursor.execute("UPDATE image_blobs SET refcount = refcount - 1 WHERE namespace = %s AND content_hash = %s;", (namespace, content_hash))
+                cursor.execute("DELETE FROM image_blobs WHERE namespace = %s AND content_hash = %s AND refcount <= 0;", (namespace, content_hash))
+                unreferenced = cursor.rowcount > 0
+                conn.commit()
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while releasing the image {image_id}: {e}")
+            logger.error(traceback.format_exc())
+            raise e
+
+        return unreferenced and self._purge(namespace, content_hash)
+
+    def _purge(self, namespace: str, content_hash: str) -> bool:
+        """
+        Returns: whether the file of an unreferenced blob was deleted, not if it was added again in the meantime
+        """
+        with Database.getConnection() as conn:
+            cursor = conn.cursor()
+            # the locking read also locks the gap of a missing row, an add of the same content waits until the file is gone
+            cursor.execute("SELECT refcount FROM image_blobs WHERE namespace = %s AND content_hash = %s FOR UPDATE;", (namespace, content_hash))
+            if cursor.fetchone() is not None:
+                conn.commit()
+                return False
+
+            deleted = storage.delete(namespace, self.blob_key(content_hash))
+            conn.commit()
+            return deleted
+
+    def _remember(self, image_id: str, key: str) -> None:
+        with self._lock:
+            self._resolved[image_id] = key
+            self._resolved.move_to_end(image_id)
+            while len(self._resolved) > RESOLVE_CACHE_SIZE:
+                self._resolved.popitem(last=False)
+
+    def resolve(self, namespace: str, image_id: str) -> str:
+        """
+        Returns: storage key of the file behind image_id, cached since an image_id never changes its content
+        Ids without a ref (images stored before content addressing, or none yet) are looked up again every time,
+        /images/preview hands out an image_id before the transaction of its clothing writes the ref.
+        """
+        with self._lock:
+            key = self._resolved.get(image_id)
+            if key is not None:
+                self._resolved.move_to_end(image_id)
+                return key
+
+        with Database.getConnection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT content_hash FROM image_refs WHERE image_id = %s AND namespace = %s;", (image_id, namespace))
+            ref = cursor.fetchone()
+
+        if ref is None:
+            return f"{image_id}.webp"
+
+        key = self.blob_key(ref[0])
+        self._remember(image_id, key)
+        return key
+
+image_store = ImageStore()
@@ -0,0 +1,151 @@
+__all__ = ["InferenceBackend", "TorchBackend", "OnnxBackend"]
+
+import os
+import threading
+import numpy as np
+import torch
+from abc import ABC, abstractmethod
+from typing import Optional
+from app.utils.logging import get_logger
+
+logger = get_logger()
+
+ONNX_OPSET = 17
+
+class InferenceBackend(ABC):
+    """
+    Runs the forward passes of the segmentation and CLIP image models on already preprocessed numpy batches.
+    """
+    name = "base"
+
+    @abstractmethod
+    def segment(self, inputs: np.ndarray) -> np.ndarray:
+        """
+        :param inputs: (B, 3, 320, 320) float32, preprocessed like backgroundremover's detect.preprocess
+        :return: (B, 320, 320) float32 raw u2net prediction (d1)
+        """
+
+    @abstractmethod
+    def encode_images(self, pixel_values: np.ndarray) -> np.ndarray:
+        """
+        :param pixel_values: (B, 3, 224, 224) float32 from the CLIPProcessor
+        :return: (B, D) float32 image embeddings
+        """
+
+class TorchBackend(InferenceBackend):
+    name = "torch"
+
+    def __init__(self, segmentation_net: Optional[torch.nn.Module] = None, clip_model: Optional[torch.nn.Module] = None, device: str = "cpu"):
+        self.segmentation_net = segmentation_net
+        self.clip_model = clip_model
+        self.device = device
+
+    def segment(self, inputs: np.ndarray) -> np.ndarray:
+        with torch.inference_mode():
+            prediction = self.segmentation_net(torch.from_numpy(inputs).to(self.device))[0][:, 0, :, :]
+        return prediction.cpu().numpy()
+
+    def encode_images(self, pixel_values: np.ndarray) -> np.ndarray:
+        with torch.inference_mode():
+            embeddings = self.clip_model.get_image_features(pixel_values=torch.from_numpy(pixel_values).to(self.device))
+        return embeddings.cpu().numpy()
+
+class _SegmentationExport(torch.nn.Module):
+    def __init__(self, net: torch.nn.Module):
+        super().__init__()
+        self.net = net
+
+    def forward(self, image):
+        return self.net(image)[0][:, 0, :, :]
+
+class _ClipImageExport(torch.nn.Module):
+    def __init__(self, clip_model: torch.nn.Module):
+        super().__init__()
+        self.clip_model = clip_model
+
+    def forward(self, pixel_values):
+        return self.clip_model.get_image_features(pixel_values=pixel_values)
+
+class OnnxBackend(InferenceBackend):
+    """
+    ONNX Runtime graphs exported from the torch models, optionally with dynamic int8 quantization.
+    Sessions own native thread pools that do not survive fork(), so they are created lazily per process.
+    """
+    name = "onnx"
+
+    def __init__(self, model_dir: str, model_version: str, quantize: bool = False, num_threads: int = 2):
+        self.model_dir = model_dir
+        self.model_version = model_version[:16]
+        self.quantize = quantize
+        self.num_threads = num_threads
+        self._sessions: dict = {}
+        self._pid: int = None
+        self._lock = threading.Lock()
+
+    def _path(self, model: str, quantized: bool = False) -> str:
+        suffix = ".int8.onnx" if quantized else ".onnx"
+        return os.path.join(self.model_dir, f"{model}_{self.model_version}{suffix}")
+
+    def export(self, torch_backend: TorchBackend) -> None:
+        """
+        Exports (and quantizes) every graph that does not exist yet for this model version.
+        """
+        os.makedirs(self.model_dir, exist_ok=True)
+
+        exports = {
+            "segmentation": (_SegmentationExport(torch_backend.segmentation_net), torch.zeros(1, 3, 320, 320), "image", "mask"),
+            "clip_image": (_ClipImageExport(torch_backend.clip_model), torch.zeros(1, 3, 224, 224), "pixel_values", "embedding"),
+        }
+
+        for model, (module, example, input_name, output_name) in exports.items():
+            path = self._path(model)
+            if not os.path.exists(path):
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                torch.onnx.export(module.eval(), (example,), tmp_path,
+                                  input_names=[input_name],
+                                  output_names=[output_name],
+                                  dynamic_axes={input_name: {0: "batch"}, output_name: {0: "batch"}},
+                                  opset_version=ONNX_OPSET)
+                os.replace(tmp_path, path)
+                logger.info(f"Exported {model} to {path}.")
+
+            quantized_path = self._path(model, quantized=True)
+            if self.quantize and not os.path.exists(quantized_path):
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+
+                tmp_path = f"{quantized_path}.{os.getpid()}.tmp"
+                quantize_dynamic(path, tmp_path, weight_type=QuantType.QInt8)
+                os.replace(tmp_path, quantized_path)
+                logger.info(f"Quantized {model} to {quantized_path}.")
+
+    def _session(self, model: str):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._sessions = {}
+                    self._pid = os.getpid()
+
+        session = self._sessions.get(model)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(model)
+                if session is None:
+                    import onnxruntime
+
+                    options = onnxruntime.SessionOptions()
+                    options.intra_op_num_threads = self.num_threads
+                    options.inter_op_num_threads = 1
+                    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+                    path = self._path(model, quantized=self.quantize)
+                    session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+                    self._sessions[model] = session
+                    logger.info(f"ONNX Runtime session for {path} created.")
+
+        return session
+
+    def segment(self, inputs: np.ndarray) -> np.ndarray:
+        return self._session("segmentation").run(None, {"image": inputs.astype(np.float32, copy=False)})[0]
+
+    def encode_images(self, pixel_values: np.ndarray) -> np.ndarray:
+        return self._session("clip_image").run(None, {"pixel_values": pixel_values.astype(np.float32, copy=False)})[0]
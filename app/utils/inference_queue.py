@@ -0,0 +1,217 @@
+__all__ = ["inference_queue"]
+
+import json
+import time
+import uuid
+from os import getenv
+from typing import Optional, Iterator
+from redis import Redis
+from app.utils.logging import get_logger
+
+logger = get_logger()
+
+INFERENCE_QUEUE_ENABLED = getenv("INFERENCE_QUEUE_ENABLED", "False").lower() == "true"
+INFERENCE_JOB_TTL = int(getenv("INFERENCE_JOB_TTL", "3600"))
+INFERENCE_STREAM_TIMEOUT = int(getenv("INFERENCE_STREAM_TIMEOUT", "120")) # longest wait for the next event of a streamed job
+INFERENCE_HEARTBEAT_TTL = int(getenv("INFERENCE_HEARTBEAT_TTL", "30")) # a worker that has not beaten for this long is considered dead
+INFERENCE_MAX_ATTEMPTS = int(getenv("INFERENCE_MAX_ATTEMPTS", "3")) # a job that crashed this many workers is failed instead of requeued
+
+QUEUE_KEY = "inference:queue"
+JOB_KEY = "inference:job:{}"
+PAYLOAD_KEY = "inference:job:{}:payload"
+EVENTS_KEY = "inference:job:{}:events"
+PROCESSING_KEY = "inference:processing:{}"
+HEARTBEAT_KEY = "inference:consumer:{}"
+CONSUMERS_KEY = "inference:consumers"
+
+class JobStatus:
+    QUEUED = "queued"
+    PROCESSING = "processing"
+    DONE = "done"
+    FAILED = "failed"
+
+class InferenceQueue:
+    """
+    Redis list based job queue between the API tier and the inference workers (inference_worker.py).
+
+    A job is moved into the processing list of the worker that took it and only removed from there by ack(),
+    requeue_stale() puts the jobs of workers whose heartbeat expired back onto the queue.
+    """
+
+    def __init__(self, redis_uri: str = getenv("REDIS_URI", "redis://localhost:6379"), enabled: bool = INFERENCE_QUEUE_ENABLED):
+        self.redis_uri = redis_uri
+        self.enabled = enabled
+        self._redis: Redis = None
+
+    @property
+    def redis(self) -> Redis:
+        if self._redis is None:
+            self._redis = Redis.from_url(self.redis_uri)
+        return self._redis
+
+    def enqueue_preview(self, user_id: str, data: bytes, filename: str, quality: str, stream: bool = False) -> str:
+        """
+        Returns: job_id
+        """
+        job_id = str(uuid.uuid4())
+
+        pipe = self.redis.pipeline()
+        pipe.hset(JOB_KEY.format(job_id), mapping={
+            "status": JobStatus.QUEUED,
+            "user_id": user_id,
+            "filename": filename,
+            "quality": quality,
+            "stream": int(stream),
+            "created_at": time.time(),
+        })
+        pipe.expire(JOB_KEY.format(job_id), INFERENCE_JOB_TTL)
+        pipe.set(PAYLOAD_KEY.format(job_id), data, ex=INFERENCE_JOB_TTL)
+        pipe.lpush(QUEUE_KEY, job_id)
+        pipe.execute()
+
+        logger.debug(f"Queued preview job {job_id} for user {user_id}.")
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        job = self.redis.hgetall(JOB_KEY.format(job_id))
+        if not job:
+            return None
+
+        job = {key.decode(): value.decode() for key, value in job.items()}
+        if "result" in job:
+            job["result"] = json.loads(job["result"])
+        if "status_code" in job:
+            job["status_code"] = int(job["status_code"])
+        job["stream"] = job.get("stream") == "1"
+
+        return job
+
+    def depth(self) -> int:
+        return self.redis.llen(QUEUE_KEY)
+
+    def next_job(self, consumer: str, timeout: int = 5) -> Optional[tuple[str, dict, bytes]]:
+        """
+        Blocks until a job is available and moves it into the processing list of the consumer.
+        Returns: (job_id, job, payload) or None on timeout
+        """
+        item = self.redis.blmove(QUEUE_KEY, PROCESSING_KEY.format(consumer), timeout, "RIGHT", "LEFT")
+        if item is None:
+            return None
+
+        job_id = item.decode()
+        payload = self.redis.get(PAYLOAD_KEY.format(job_id))
+        job = self.get_job(job_id)
+
+        if job is None or payload is None:
+            logger.warning(f"Preview job {job_id} expired before it was picked up.")
+            self.redis.lrem(PROCESSING_KEY.format(consumer), 1, job_id)
+            return None
+
+        pipe = self.redis.pipeline()
+        pipe.hset(JOB_KEY.format(job_id), "status", JobStatus.PROCESSING)
+        pipe.hincrby(JOB_KEY.format(job_id), "attempts", 1)
+        pipe.execute()
+        return job_id, job, payload
+
+    def ack(self, consumer: str, job_id: str) -> None:
+        """
+        Removes a finished job from the processing list of the consumer, call it after complete() or fail().
+        """
+        pipe = self.redis.pipeline()
+        pipe.lrem(PROCESSING_KEY.format(consumer), 1, job_id)
+        pipe.delete(PAYLOAD_KEY.format(job_id))
+        pipe.execute()
+
+    def heartbeat(self, consumer: str) -> None:
+        pipe = self.redis.pipeline()
+        pipe.sadd(CONSUMERS_KEY, consumer)
+        pipe.set(HEARTBEAT_KEY.format(consumer), 1, ex=INFERENCE_HEARTBEAT_TTL)
+        pipe.execute()
+
+    def unregister(self, consumer: str) -> None:
+        """
+        Called by a worker that stops cleanly, anything still in its processing list goes back onto the queue.
+        """
+        self.redis.delete(HEARTBEAT_KEY.format(consumer))
+        self._requeue_consumer(consumer)
+
+    def requeue_stale(self) -> int:
+        """
+        Puts the jobs of every consumer without a live heartbeat back onto the queue.
+        Returns: number of jobs requeued
+        """
+        requeued = 0
+        for consumer in self.redis.smembers(CONSUMERS_KEY):
+            consumer = consumer.decode()
+            if not self.redis.exists(HEARTBEAT_KEY.format(consumer)):
+                requeued += self._requeue_consumer(consumer)
+
+        return requeued
+
+    def _requeue_consumer(self, consumer: str) -> int:
+        requeued = 0
+        while True:
+            # onto the consuming end, the job has been waiting longer than anything else on the queue
+            item = self.redis.lmove(PROCESSING_KEY.format(consumer), QUEUE_KEY, "RIGHT", "RIGHT")
+            if item is None:
+                break
+
+            job_id = item.decode()
+            job = self.get_job(job_id)
+            if job is None or int(job.get("attempts", 0)) >= INFERENCE_MAX_ATTEMPTS:
+                self.redis.lrem(QUEUE_KEY, 1, job_id)
+                if job is not None:
+                    logger.error(f"Preview job {job_id} crashed {job['attempts']} workers, giving up.")
+                    self.fail(job_id, "An unexpected error occurred.", 500)
+                    if job["stream"]:
+                        self.publish_event(job_id, "error", {"error": "An unexpected error occurred.", "status_code": 500})
+                continue
+
+            self.redis.hset(JOB_KEY.format(job_id), "status", JobStatus.QUEUED)
+            requeued += 1
+            logger.warning(f"Requeued preview job {job_id} of the dead worker {consumer}.")
+
+        self.redis.srem(CONSUMERS_KEY, consumer)
+        return requeued
+
+    def complete(self, job_id: str, result: dict) -> None:
+        self.redis.hset(JOB_KEY.format(job_id), mapping={
+            "status": JobStatus.DONE,
+            "result": json.dumps(result),
+        })
+
+    def fail(self, job_id: str, message: str, status_code: int = 500) -> None:
+        self.redis.hset(JOB_KEY.format(job_id), mapping={
+            "status": JobStatus.FAILED,
+            "error": message,
+            "status_code": status_code,
+        })
+
+    def publish_event(self, job_id: str, event: str, payload: dict) -> None:
+        """
+        Appends a progress event of a streamed job, the API worker holding the client connection pops it in events().
+        """
+        pipe = self.redis.pipeline()
+        pipe.rpush(EVENTS_KEY.format(job_id), json.dumps({"event": event, "data": payload}))
+        pipe.expire(EVENTS_KEY.format(job_id), INFERENCE_JOB_TTL)
+        pipe.execute()
+
+    def events(self, job_id: str, timeout: int = INFERENCE_STREAM_TIMEOUT) -> Iterator[tuple[str, dict]]:
+        """
+        Blocks for the events of a streamed job until it is done or failed.
+        Returns: (event, payload) pairs
+        """
+        while True:
+            item = self.redis.blpop([EVENTS_KEY.format(job_id)], timeout=timeout)
+            if item is None:
+                yield "error", {"error": "The preview took too long.", "status_code": 504}
+                return
+
+            message = json.loads(item[1])
+            yield message["event"], message["data"]
+
+            if message["event"] in ("done", "error"):
+                self.redis.delete(EVENTS_KEY.format(job_id))
+                return
+
+inference_queue = InferenceQueue()
@@ -0,0 +1,199 @@
+__all__ = ["kernels"]
+
+import logging
+import numpy as np
+from os import getenv
+from typing import Optional
+from app.utils.logging import get_logger
+
+logger = get_logger()
+logging.getLogger("numba").setLevel(logging.WARNING) # logs every compiler pass at debug level
+
+KERNELS_JIT = getenv("KERNELS_JIT", "True").lower() == "true"
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# every kernel exists twice: an explicit loop that numba compiles into a single pass without temporaries,
+# and a vectorized NumPy version with the same results that runs when numba is missing or disabled
+
+def _alpha_bbox_loop(alpha, threshold):
+    height, width = alpha.shape
+    left, top, right, bottom = width, height, -1, -1
+    for y in range(height):
+        # both scans stop at the first hit, the right one also at the edge found so far
+        first = -1
+        for x in range(width):
+            if alpha[y, x] > threshold:
+                first = x
+                break
+        if first < 0:
+            continue
+
+        left = min(left, first)
+        top = min(top, y)
+        bottom = y
+        for x in range(width - 1, max(right, first - 1), -1):
+            if alpha[y, x] > threshold:
+                right = x
+                break
+    return left, top, right + 1, bottom + 1
+
+def _alpha_bbox_numpy(alpha, threshold):
+    above = alpha > threshold
+    rows = np.flatnonzero(above.any(axis=1))
+    if rows.size == 0:
+        return alpha.shape[1], alpha.shape[0], 0, 0
+    columns = np.flatnonzero(above[rows[0]:rows[-1] + 1].any(axis=0))
+    return int(columns[0]), int(rows[0]), int(columns[-1]) + 1, int(rows[-1]) + 1
+
+def _lab_histogram_loop(pixels, min_alpha, srgb_to_linear, rgb_to_xyz, l_bin_size, l_bins, ab_bin_size, ab_bins, weight, rgb_sum, lab_sum):
+    for i in range(pixels.shape[0]):
+        alpha = pixels[i, 3]
+        if alpha <= min_alpha:
+            continue
+        w = alpha / 255.0
+
+        r, g, b = srgb_to_linear[pixels[i, 0]], srgb_to_linear[pixels[i, 1]], srgb_to_linear[pixels[i, 2]]
+        x = rgb_to_xyz[0, 0] * r + rgb_to_xyz[0, 1] * g + rgb_to_xyz[0, 2] * b
+        y = rgb_to_xyz[1, 0] * r + rgb_to_xyz[1, 1] * g + rgb_to_xyz[1, 2] * b
+        z = rgb_to_xyz[2, 0] * r + rgb_to_xyz[2, 1] * g + rgb_to_xyz[2, 2] * b
+        fx = x ** (1.0 / 3.0) if x > 0.008856 else 7.787 * x + 16.0 / 116.0
+        fy = y ** (1.0 / 3.0) if y > 0.008856 else 7.787 * y + 16.0 / 116.0
+        fz = z ** (1.0 / 3.0) if z > 0.008856 else 7.787 * z + 16.0 / 116.0
+
+        l = 116.0 * fy - 16.0
+        a = 500.0 * (fx - fy)
+        bb = 200.0 * (fy - fz)
+
+        l_index = min(max(int(np.floor(l / l_bin_size)), 0), l_bins - 1)
+        a_index = min(max(int(np.floor((a + 128.0) / ab_bin_size)), 0), ab_bins - 1)
+        b_index = min(max(int(np.floor((bb + 128.0) / ab_bin_size)), 0), ab_bins - 1)
+        index = (l_index * ab_bins + a_index) * ab_bins + b_index
+
+        weight[index] += w
+        for channel in range(3):
+            rgb_sum[index, channel] += pixels[i, channel] * w
+        lab_sum[index, 0] += l * w
+        lab_sum[index, 1] += a * w
+        lab_sum[index, 2] += bb * w
+
+def _lab_histogram_numpy(pixels, min_alpha, srgb_to_linear, rgb_to_xyz, l_bin_size, l_bins, ab_bin_size, ab_bins, weight, rgb_sum, lab_sum):
+    visible = pixels[:, 3] > min_alpha
+    if not visible.any():
+        return
+
+    rgb = pixels[visible, :3]
+    w = pixels[visible, 3].astype(np.float32) / 255.0
+
+    xyz = srgb_to_linear[rgb] @ rgb_to_xyz.T
+    f = np.where(xyz > 0.008856, np.cbrt(xyz), 7.787 * xyz + 16 / 116)
+    lab = np.stack((116 * f[:, 1] - 16, 500 * (f[:, 0] - f[:, 1]), 200 * (f[:, 1] - f[:, 2])), axis=1)
+
+    l_index = np.clip(lab[:, 0] // l_bin_size, 0, l_bins - 1).astype(np.intp)
+    a_index = np.clip((lab[:, 1] + 128) // ab_bin_size, 0, ab_bins - 1).astype(np.intp)
+    b_index = np.clip((lab[:, 2] + 128) // ab_bin_size, 0, ab_bins - 1).astype(np.intp)
+    bins = (l_index * ab_bins + a_index) * ab_bins + b_index
+
+    weight += np.bincount(bins, weights=w, minlength=len(weight))
+    for channel in range(3):
+        rgb_sum[:, channel] += np.bincount(bins, weights=rgb[:, channel] * w, minlength=len(weight))
+        lab_sum[:, channel] += np.bincount(bins, weights=lab[:, channel] * w, minlength=len(weight))
+
+def _composite_over_loop(canvas, item, x, y):
+    canvas_height, canvas_width = canvas.shape[0], canvas.shape[1]
+    for row in range(max(0, -y), min(item.shape[0], canvas_height - y)):
+        for column in range(max(0, -x), min(item.shape[1], canvas_width - x)):
+            source = item[row, column]
+            if source[3] == 0:
+                continue
+
+            target = canvas[y + row, x + column]
+            # garments are mostly fully opaque or fully transparent, only the matted edge needs blending
+            if source[3] == 255:
+                for channel in range(4):
+                    target[channel] = source[channel]
+                continue
+
+            source_alpha = source[3] / 255.0
+            target_alpha = target[3] / 255.0 * (1.0 - source_alpha)
+            out_alpha = source_alpha + target_alpha
+            for channel in range(3):
+                target[channel] = np.uint8((source[channel] * source_alpha + target[channel] * target_alpha) / out_alpha + 0.5)
+            target[3] = np.uint8(out_alpha * 255.0 + 0.5)
+
+def _composite_over_numpy(canvas, item, x, y):
+    top, left = max(0, -y), max(0, -x)
+    bottom, right = min(item.shape[0], canvas.shape[0] - y), min(item.shape[1], canvas.shape[1] - x)
+    if bottom <= top or right <= left:
+        return
+
+    source = item[top:bottom, left:right].astype(np.float32)
+    target = canvas[y + top:y + bottom, x + left:x + right]
+
+    source_alpha = source[..., 3:] / 255.0
+    target_alpha = target[..., 3:].astype(np.float32) / 255.0 * (1.0 - source_alpha)
+    out_alpha = source_alpha + target_alpha
+
+    color = (source[..., :3] * source_alpha + target[..., :3] * target_alpha) / np.maximum(out_alpha, 1e-6)
+    target[..., :3] = np.where(source_alpha > 0, np.rint(color), target[..., :3])
+    target[..., 3:] = np.rint(out_alpha * 255.0)
+
+class ImageKernels:
+    """
+    Per-pixel routines of the image pipeline, JIT compiled with numba when it is available.
+    The compiled versions make a single pass over the pixels and write into caller provided buffers.
+    """
+
+    def __init__(self, jit: bool = KERNELS_JIT):
+        self.jit = jit and numba is not None
+        if jit and numba is None:
+            logger.warning("numba is not installed, image kernels fall back to NumPy.")
+
+        if self.jit:
+            compile = numba.njit(cache=True, nogil=True)
+            self._alpha_bbox = compile(_alpha_bbox_loop)
+            self._lab_histogram = compile(_lab_histogram_loop)
+            self._composite_over = compile(_composite_over_loop)
+        else:
+            self._alpha_bbox = _alpha_bbox_numpy
+            self._lab_histogram = _lab_histogram_numpy
+            self._composite_over = _composite_over_numpy
+
+    def alpha_bbox(self, alpha: np.ndarray, threshold: int = 0) -> Optional[tuple[int, int, int, int]]:
+        """
+        Returns: (left, top, right, bottom) of every value above threshold in a 2D uint8 array, None if there is none
+        """
+        left, top, right, bottom = self._alpha_bbox(alpha, threshold)
+        if right <= left:
+            return None
+        return int(left), int(top), int(right), int(bottom)
+
+    def lab_histogram(self, pixels: np.ndarray, min_alpha: int, srgb_to_linear: np.ndarray, rgb_to_xyz: np.ndarray, l_bin_size: float, l_bins: int, ab_bin_size: float, ab_bins: int, weight: np.ndarray, rgb_sum: np.ndarray, lab_sum: np.ndarray) -> None:
+        """
+        Accumulates the alpha weight, weighted RGB and weighted Lab of all (N, 4) uint8 pixels above min_alpha into
+        their Lab bin, weight is (bins,) and the sums are (bins, 3) float64 buffers
+        """
+        self._lab_histogram(pixels, min_alpha, srgb_to_linear, rgb_to_xyz, float(l_bin_size), l_bins, float(ab_bin_size), ab_bins, weight, rgb_sum, lab_sum)
+
+    def composite_over(self, canvas: np.ndarray, item: np.ndarray, x: int, y: int) -> None:
+        """
+        Draws the (h, w, 4) uint8 item over the (H, W, 4) uint8 canvas in place with its top left corner at (x, y), clipped to the canvas
+        """
+        self._composite_over(canvas, item, int(x), int(y))
+
+    def warm_up(self) -> None:
+        """
+        Compiles every kernel, numba otherwise does it on the first call of each.
+        """
+        alpha = np.zeros((2, 2), dtype=np.uint8)
+        pixels = np.zeros((2, 4), dtype=np.uint8)
+        canvas = np.zeros((2, 2, 4), dtype=np.uint8)
+
+        self.alpha_bbox(alpha)
+        self.lab_histogram(pixels, 0, np.zeros(256, dtype=np.float32), np.eye(3, dtype=np.float32), 10.0, 1, 16.0, 1, np.zeros(1), np.zeros((1, 3)), np.zeros((1, 3)))
+        self.composite_over(canvas, canvas.copy(), 0, 0)
+
+kernels = ImageKernels()
@@ -0,0 +1,123 @@
+__all__ = ["label_bank"]
+
+import os
+import hashlib
+import threading
+import numpy as np
+from os import getenv
+from fashion_clip.fashion_clip import FashionCLIP
+from app.models.clothing import ClothingCategory, ClothingSeason, ClothingTags
+from app.utils.logging import get_logger
+
+logger = get_logger()
+
+MODEL_CACHE_DIR = getenv("MODEL_CACHE_DIR", "cache")
+ATTRIBUTE_THRESHOLD = float(getenv("ATTRIBUTE_THRESHOLD", "0.35"))
+
+LABEL_PROMPTS = {
+    "category": {
+        ClothingCategory.JACKET: "a jacket",
+        ClothingCategory.TOP: "a top",
+        ClothingCategory.BOTTOM: "a pair of pants",
+        ClothingCategory.FOOTWEAR: "a pair of shoes",
+    },
+    "seasons": {
+        ClothingSeason.SPRING: "clothing for spring",
+        ClothingSeason.SUMMER: "clothing for summer",
+        ClothingSeason.AUTUMN: "clothing for autumn",
+        ClothingSeason.WINTER: "clothing for winter",
+    },
+    "tags": {
+        ClothingTags.CASUAL: "casual clothing",
+        ClothingTags.FORMAL: "formal clothing",
+        ClothingTags.SPORTS: "sports clothing",
+        ClothingTags.VINTAGE: "vintage clothing",
+    },
+}
+
+class LabelEmbeddingBank:
+    """
+    Normalized FashionCLIP text embeddings of every category, season and tag prompt.
+    Built once per model version and cached on disk, so a preview only needs to encode the image.
+    """
+
+    def __init__(self, prompts: dict = LABEL_PROMPTS, cache_dir: str = MODEL_CACHE_DIR):
+        self.prompts = prompts
+        self.cache_dir = cache_dir
+        self.labels: list = [label for group in prompts.values() for label in group]
+        self.groups: dict[str, slice] = {}
+        self.matrix: np.ndarray = None
+        self.logit_scale: float = 100.0
+        self._lock = threading.Lock()
+
+        start = 0
+        for group, labels in prompts.items():
+            self.groups[group] = slice(start, start + len(labels))
+            start += len(labels)
+
+    @property
+    def loaded(self) -> bool:
+        return self.matrix is not None
+
+    def _cache_path(self, model_hash: str) -> str:
+        prompts = "|".join(prompt for group in self.prompts.values() for prompt in group.values())
+        prompts_hash = hashlib.sha256(prompts.encode()).hexdigest()[:12]
+        return os.path.join(self.cache_dir, f"label_embeddings_{model_hash[:16]}_{prompts_hash}.npy")
+
+    def load(self, fashion_clip: FashionCLIP) -> None:
+        with self._lock:
+            if self.matrix is not None:
+                return
+
+            self.logit_scale = float(fashion_clip.model.logit_scale.exp().item())
+            path = self._cache_path(fashion_clip.model_hash)
+
+            if os.path.exists(path):
+                self.matrix = np.load(path)
+                logger.debug(f"Label embeddings loaded from {path}.")
+                return
+
+            prompts = [prompt for group in self.prompts.values() for prompt in group.values()]
+            embeddings = fashion_clip.encode_text(prompts, batch_size=len(prompts)).astype(np.float32)
+            embeddings /= np.linalg.norm(embeddings, axis=-1, keepdims=True)
+
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    np.save(f, embeddings)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"Could not cache label embeddings at {path}: {e}")
+
+            self.matrix = embeddings
+            logger.info(f"Label embeddings built for {len(prompts)} labels.")
+
+    def classify(self, image_embedding: np.ndarray) -> dict:
+        """
+        Scores one image embedding against all label groups with a single matrix multiply.
+        Returns: {"category": ClothingCategory, "seasons": [...], "tags": [...], "confidences": {group: {label: probability}}}
+        """
+        image_embedding = np.asarray(image_embedding, dtype=np.float32).reshape(-1)
+        image_embedding = image_embedding / np.linalg.norm(image_embedding)
+
+        logits = self.logit_scale * (self.matrix @ image_embedding)
+
+        result = {"confidences": {}}
+        for group, group_slice in self.groups.items():
+            group_logits = logits[group_slice]
+            probabilities = np.exp(group_logits - group_logits.max())
+            probabilities /= probabilities.sum()
+
+            labels = self.labels[group_slice]
+            result["confidences"][group] = {label.name: round(float(p), 4) for label, p in zip(labels, probabilities)}
+
+            order = np.argsort(-probabilities)
+            if group == "category":
+                result[group] = labels[order[0]]
+            else:
+                result[group] = [labels[i] for i in order if i == order[0] or probabilities[i] >= ATTRIBUTE_THRESHOLD]
+
+        return result
+
+label_bank = LabelEmbeddingBank()
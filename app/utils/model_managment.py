@@ -0,0 +1,171 @@
+__all__ = ["model_manager"]
+
+import gc
+import os
+import hashlib
+import threading
+import torch
+import numpy as np
+from os import getenv
+from fashion_clip.fashion_clip import FashionCLIP
+from app.utils.segmentation_engine import segmentation_engine, SegmentationEngine
+from app.utils.label_embeddings import label_bank, LabelEmbeddingBank, MODEL_CACHE_DIR
+from app.utils.inference_backends import InferenceBackend, TorchBackend, OnnxBackend
+from app.utils.kernels import kernels
+from app.utils.inference_queue import INFERENCE_QUEUE_ENABLED
+from app.utils.logging import get_logger
+
+logger = get_logger()
+
+FASHION_CLIP_MODEL = "fashion-clip"
+FASHION_CLIP_REPOSITORY = "patrickjohncyh/fashion-clip" # what FashionCLIP("fashion-clip") loads, the text tower alone is loaded from it
+CLIP_CONTEXT_LENGTH = 77
+INFERENCE_THREADS = int(getenv("INFERENCE_THREADS", "2"))
+INFERENCE_BACKEND = getenv("INFERENCE_BACKEND", "torch").lower() # torch | onnx
+INFERENCE_QUANTIZE = getenv("INFERENCE_QUANTIZE", "False").lower() == "true"
+
+class ModelManager:
+    """
+    Owns the lifecycle of the ML models.
+    Models are loaded lazily on first use, or once in the gunicorn master through preload()
+    so the forked workers share the weights copy-on-write and only re-initialize torch threading in after_fork().
+    """
+
+    def __init__(self, num_threads: int = INFERENCE_THREADS):
+        self.num_threads = num_threads
+        self._fashion_clip: FashionCLIP = None
+        self._backend: InferenceBackend = None
+        self._text_model = None
+        self._tokenizer = None
+        self._threads_configured = False
+        self._lock = threading.Lock()
+
+    def _configure_threads(self, num_threads: int) -> None:
+        torch.set_num_threads(num_threads)
+        self._threads_configured = True
+
+    def _load_models(self) -> None:
+        if self._fashion_clip is None:
+            self._fashion_clip = FashionCLIP(FASHION_CLIP_MODEL)
+            self._fashion_clip.model.eval()
+            logger.info(f"FashionCLIP model {FASHION_CLIP_MODEL} loaded.")
+
+        label_bank.load(self._fashion_clip)
+        segmentation_engine.load()
+
+        if self._backend is None:
+            # no reference to the net is held here, _create_backend may release it
+            self._backend = self._create_backend(segmentation_engine.load())
+            segmentation_engine.backend = self._backend
+
+        # compiled here so preloaded workers inherit the machine code instead of compiling on their first request
+        kernels.warm_up()
+
+    def _create_backend(self, segmentation_net: torch.nn.Module) -> InferenceBackend:
+        torch_backend = TorchBackend(segmentation_net=segmentation_net, clip_model=self._fashion_clip.model, device=self._fashion_clip.device)
+
+        if INFERENCE_BACKEND == "torch":
+            return torch_backend
+
+        if INFERENCE_BACKEND != "onnx":
+            raise ValueError(f"Unknown INFERENCE_BACKEND {INFERENCE_BACKEND}, use torch or onnx.")
+
+        model_version = hashlib.sha256(f"{self._fashion_clip.model_hash}-{segmentation_engine.model_name}".encode()).hexdigest()
+        backend = OnnxBackend(os.path.join(MODEL_CACHE_DIR, "onnx"), model_version, quantize=INFERENCE_QUANTIZE, num_threads=self.num_threads)
+        backend.export(torch_backend)
+
+        # the graphs replace u2net and the CLIP image tower, keeping the torch modules would double resident memory
+        segmentation_engine.release()
+        self._fashion_clip.model.vision_model = None
+        self._fashion_clip.model.visual_projection = None
+        del torch_backend, segmentation_net
+        gc.collect()
+
+        logger.info(f"Using ONNX Runtime inference backend (int8: {INFERENCE_QUANTIZE}), torch image models released.")
+        return backend
+
+    def load(self) -> None:
+        with self._lock:
+            if not self._threads_configured:
+                self._configure_threads(self.num_threads)
+
+            self._load_models()
+
+    def preload(self) -> None:
+        """
+        Called in the gunicorn master before the workers are forked.
+        Torch runs single threaded here so no thread pool exists that the children would inherit in a broken state.
+        """
+        with self._lock:
+            self._configure_threads(1)
+            self._load_models()
+
+            # keep the garbage collector from touching (and therefore copying) the preloaded objects in the workers
+            gc.collect()
+            gc.freeze()
+
+        logger.info("Models preloaded in master process.")
+
+    def after_fork(self) -> None:
+        with self._lock:
+            self._configure_threads(self.num_threads)
+
+            try:
+                torch.set_num_interop_threads(1)
+            except RuntimeError:
+                pass
+
+        logger.debug(f"Torch threads re-initialized after fork ({self.num_threads} threads).")
+
+    def _load_text_model(self) -> None:
+        from transformers import CLIPTextModelWithProjection, CLIPTokenizer
+
+        with self._lock:
+            if not self._threads_configured:
+                self._configure_threads(self.num_threads)
+
+            if self._text_model is None:
+                self._tokenizer = CLIPTokenizer.from_pretrained(FASHION_CLIP_REPOSITORY)
+                self._text_model = CLIPTextModelWithProjection.from_pretrained(FASHION_CLIP_REPOSITORY).eval()
+                logger.info(f"FashionCLIP text model {FASHION_CLIP_REPOSITORY} loaded.")
+
+    def encode_text(self, texts: list[str]) -> np.ndarray:
+        """
+        Returns: (N, D) FashionCLIP text embeddings, same space as the image embeddings
+        With the inference queue enabled the API tier never runs the image models, so only the text tower is loaded for this.
+        """
+        if self._fashion_clip is not None or not INFERENCE_QUEUE_ENABLED:
+            return self.fashion_clip.encode_text(texts, batch_size=len(texts))
+
+        if self._text_model is None:
+            self._load_text_model()
+
+        inputs = self._tokenizer(texts, padding="max_length", max_length=CLIP_CONTEXT_LENGTH, truncation=True, return_tensors="pt")
+        with torch.inference_mode():
+            return self._text_model(**inputs).text_embeds.cpu().numpy()
+
+    @property
+    def fashion_clip(self) -> FashionCLIP:
+        if self._fashion_clip is None or not self._threads_configured:
+            self.load()
+        return self._fashion_clip
+
+    @property
+    def segmentation(self) -> SegmentationEngine:
+        if not segmentation_engine.loaded or not self._threads_configured:
+            self.load()
+        return segmentation_engine
+
+    @property
+    def backend(self) -> InferenceBackend:
+        if self._backend is None or not self._threads_configured:
+            self.load()
+        return self._backend
+
+    @property
+    def label_bank(self) -> LabelEmbeddingBank:
+        if not label_bank.loaded or not self._threads_configured:
+            self.load()
+        return label_bank
+
+model_manager = ModelManager()
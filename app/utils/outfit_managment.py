@@ -3,16 +3,20 @@ __all__ = ["outfit_manager"]
 import traceback
 import uuid
 import json
+import numpy as np
 from datetime import datetime
 from app.utils.database import Database
 from app.utils.exceptions import OutfitNotFoundError, OutfitNameTooShortError, OutfitNameTooLongError, OutfitDescriptionTooLongError, OutfitNameMissingError, OutfitClothingIDsMissingError, OutfitClothingIDInvalidError, OutfitSeasonsInvalidError, OutfitTagsInvalidError, OutfitIDMissingError, OutfitPermissionError, OutfitLimitInvalidError, OutfitOffsetInvalidError, OutfitValidationError, OutfitPublicMissingError, OutfitFavoriteMissingError, OutfitSceneMissingError, OutfitSceneInvalidError, OutfitPreviewInvalidError
 from typing import Optional
 from mysql.connector.errors import IntegrityError
 from app.models.outfit import Outfit, OutfitTags, OutfitSeason, CanvasPlacement
+from app.models.clothing import Clothing, ClothingTags
 from app.utils.helpers import helper
 from app.utils.authentication_managment import authentication_manager
 from app.utils.clothing_managment import clothing_manager
 from app.utils.image_managment import image_manager
+from app.utils.embedding_store import embedding_store
+from app.utils.outfit_suggestions import outfit_suggestion_engine, SUGGESTION_CATEGORIES
 from app.utils.logging import get_logger
 
 logger = get_logger()
@@ -236,49 +240,43 @@ class OutfitManager:
             
             clothing_canvas.append(CanvasPlacement(clothing_id=clothing_id, x=item["x"], y=item["y"], z=item["z"], scale=item["scale"], rotation=item["rotation"]))
         
-        _, image_id =image_manager.generate_outfit_preview(items=validated_items)
-
-        outfit = Outfit(
-            outfit_id=outfit_id,
-            is_public=is_public,
-            is_favorite=is_favorite,
-            name=name,
-            created_at=datetime.now(),
-            updated_at=datetime.now(),
-            user_id=user_id,
-            scene=clothing_canvas,
-            image_id=image_id,
-            seasons=seasons,
-            tags=tags,
-            description=description
-        )
+        with Database.getConnection() as conn:
+            # the collage is referenced in this transaction, a rollback leaves its file to the garbage collector
+            _, image_id = image_manager.generate_outfit_preview(items=validated_items, conn=conn)
+
+            outfit = Outfit(
+                outfit_id=outfit_id,
+                is_public=is_public,
+                is_favorite=is_favorite,
+                name=name,
+                created_at=datetime.now(),
+                updated_at=datetime.now(),
+                user_id=user_id,
+                scene=clothing_canvas,
+                image_id=image_id,
+                seasons=seasons,
+                tags=tags,
+                description=description
+            )
 
-        try:
-            with Database.getConnection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO outfits(outfit_id, is_public, is_favorite, name, user_id, image_id, description)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s);
-                """, (
-                    outfit_id, is_public, is_favorite, name, user_id, image_id, description, 
-                ))
-
-                if outfit.seasons:
-                    for season in outfit.seasons:
-                        cursor.execute("INSERT INTO outfit_seasons(outfit_id, season) VALUES (%s, %s);", (outfit_id, season.name))
-                if outfit.tags:
-                    for tag in outfit.tags:
-                        cursor.execute("INSERT INTO outfit_tags(outfit_id, tag) VALUES (%s, %s);", (outfit_id, tag.name))
-                for item in clothing_canvas:
-                    cursor.execute("INSERT INTO outfit_clothing(outfit_id, clothing_id, position_x, position_y, z_index, scale, rotation) VALUES (%s, %s, %s, %s, %s, %s, %s);", (outfit_id, item.clothing_id, item.x, item.y, item.z, item.scale, item.rotation))
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO outfits(outfit_id, is_public, is_favorite, name, user_id, image_id, description)
+                VALUES (%s, %s, %s, %s, %s, %s, %s);
+            """, (
+                outfit_id, is_public, is_favorite, name, user_id, image_id, description, 
+            ))
+
+            if outfit.seasons:
+                for season in outfit.seasons:
+                    cursor.execute("INSERT INTO outfit_seasons(outfit_id, season) VALUES (%s, %s);", (outfit_id, season.name))
+            if outfit.tags:
+                for tag in outfit.tags:
+                    cursor.execute("INSERT INTO outfit_tags(outfit_id, tag) VALUES (%s, %s);", (outfit_id, tag.name))
+            for item in clothing_canvas:
+                cursor.execute("INSERT INTO outfit_clothing(outfit_id, clothing_id, position_x, position_y, z_index, scale, rotation) VALUES (%s, %s, %s, %s, %s, %s, %s);", (outfit_id, item.clothing_id, item.x, item.y, item.z, item.scale, item.rotation))
 
-                conn.commit()
-        except Exception as e:
-            try:
-                image_manager.delete_outfit_preview(image_id)
-            except Exception:
-                pass
-            raise
+            conn.commit()
 
         return outfit
     
@@ -417,6 +415,66 @@ class OutfitManager:
 
         return outfit_list, total_outfits
         
+    def suggest_outfits(self, user_id: str, season: Optional[str] = None, tag: Optional[str] = None, limit: int = 10) -> list[tuple[float, dict[str, Clothing]]]:
+        """
+        Returns: [(score, {category: clothing}), ...] best first, the jacket is left out where the outfit works better without one
+        """
+        if season is not None:
+            if not isinstance(season, str) or season.strip().upper() not in OutfitSeason.__members__:
+                raise OutfitSeasonsInvalidError(f"The provided season ({season}) is not valid.")
+            season = season.strip().upper()
+
+        if tag is not None:
+            if not isinstance(tag, str) or tag.strip().upper() not in OutfitTags.__members__:
+                raise OutfitTagsInvalidError(f"The provided tag ({tag}) is not valid.")
+            tag = tag.strip().upper()
+
+        if not isinstance(limit, int) or limit <= 0 or limit > 100:
+            raise OutfitLimitInvalidError("The limit must be a positive integer and cannot exceed 100.")
+
+        try:
+            wardrobe = [clothing for clothing in clothing_manager.get_wardrobe(user_id) if clothing.category in SUGGESTION_CATEGORIES]
+            if not wardrobe:
+                return []
+
+            categories = np.array([SUGGESTION_CATEGORIES.index(clothing.category) for clothing in wardrobe])
+            colors = outfit_suggestion_engine.hex_to_lab([clothing.color for clothing in wardrobe])
+            context = np.array([self._context_fit(clothing, season, tag) for clothing in wardrobe], dtype=np.float32)
+
+            # items that were never indexed only contribute their colors and context
+            ids, rows, matrix = embedding_store.load(user_id)
+            embeddings = np.zeros((len(wardrobe), matrix.shape[1] if ids else 1), dtype=np.float32)
+            for index, clothing in enumerate(wardrobe):
+                if clothing.clothing_id in rows:
+                    embeddings[index] = matrix[rows[clothing.clothing_id]]
+
+            ranked = outfit_suggestion_engine.rank(categories, embeddings, colors, context, limit)
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while suggesting outfits for user {user_id}: {e}")
+            logger.error(traceback.format_exc())
+            raise e
+
+        return [
+            (score, {wardrobe[item].category.value: wardrobe[item] for item in combination if item >= 0})
+            for score, combination in ranked
+        ]
+
+    @staticmethod
+    def _context_fit(clothing: Clothing, season: Optional[str], tag: Optional[str]) -> float:
+        """
+        Returns: 1 if the item matches, 0.5 if it does not say, 0 if it is meant for something else, averaged over season and tag
+        """
+        fits = []
+        if season is not None:
+            seasons = [item.name for item in clothing.seasons or []]
+            fits.append(0.5 if not seasons else float(season in seasons))
+        # outfit tags like BEACH have no clothing counterpart and say nothing about single items
+        if tag is not None and tag in ClothingTags.__members__:
+            tags = [item.name for item in clothing.tags or []]
+            fits.append(0.5 if not tags else float(tag in tags))
+
+        return sum(fits) / len(fits) if fits else 0.5
+
     def update_outfit(self, token: str, outfit_id: str, name: Optional[str] = None, is_public: Optional[bool] = None, seasons: Optional[list[str]] = None, tags: Optional[list[str]] = None, clothing_ids: Optional[list[str]] = None, description: Optional[str] = None) -> Outfit:
         user_id = authentication_manager.get_user_id_from_token(token)
         
@@ -528,7 +586,7 @@ class OutfitManager:
         try:
             with Database.getConnection() as conn:
                 cursor = conn.cursor()
-                cursor.execute("SELECT user_id FROM outfits WHERE outfit_id = %s AND user_id = %s;", (outfit_id, user_id))
+                cursor.execute("SELECT image_id FROM outfits WHERE outfit_id = %s AND user_id = %s;", (outfit_id, user_id))
                 result = cursor.fetchone()
 
                 if result is None:
@@ -539,6 +597,8 @@ class OutfitManager:
                 cursor.execute("DELETE FROM outfit_clothing WHERE outfit_id = %s;", (outfit_id,))
                 cursor.execute("DELETE FROM outfits WHERE outfit_id = %s;", (outfit_id,))
                 conn.commit()
+            
+            image_manager.delete_outfit_preview(result[0])
         except OutfitNotFoundError as e:
             raise e
         except Exception as e:
@@ -0,0 +1,146 @@
+__all__ = ["outfit_suggestion_engine", "SUGGESTION_CATEGORIES"]
+
+import numpy as np
+from os import getenv
+from typing import Optional
+from app.models.clothing import ClothingCategory
+from app.utils.color_palette import palette_extractor
+
+# the jacket is an optional layer, every other slot has to be filled
+SUGGESTION_CATEGORIES = (ClothingCategory.JACKET, ClothingCategory.TOP, ClothingCategory.BOTTOM, ClothingCategory.FOOTWEAR)
+OPTIONAL_CATEGORIES = (ClothingCategory.JACKET,)
+
+SUGGESTION_CANDIDATES = int(getenv("SUGGESTION_CANDIDATES", "24")) # per category after pruning, bounds the grid to candidates^4
+CONTEXT_WEIGHT = 1.0
+STYLE_WEIGHT = 1.0
+COLOR_WEIGHT = 0.5
+NEUTRAL_CHROMA = 12.0 # Lab chroma below which a color goes with everything
+NEUTRAL_COLOR = "#808080"
+
+class OutfitSuggestionEngine:
+    """
+    Ranks JACKET/TOP/BOTTOM/FOOTWEAR combinations of a wardrobe.
+    Items are pruned per category by a prior of their context fit plus their best compatibility with every other
+    category, the remaining candidates are scored as one broadcast grid: mean context fit + mean pairwise compatibility,
+    where compatibility combines the CLIP embedding similarity (style) and the hue relation of the main colors (color harmony).
+    """
+
+    def __init__(self, candidates: int = SUGGESTION_CANDIDATES):
+        self.candidates = candidates
+
+    @staticmethod
+    def hex_to_lab(colors: list[Optional[str]]) -> np.ndarray:
+        """
+        Returns: (N, 3) Lab colors, items without a color count as a neutral gray
+        """
+        colors = [color or NEUTRAL_COLOR for color in colors]
+        rgb = np.array([[int(color[i:i + 2], 16) for i in (1, 3, 5)] for color in colors], dtype=np.uint8).reshape(-1, 3)
+        return palette_extractor.rgb_to_lab(rgb)
+
+    @staticmethod
+    def color_harmony(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+        """
+        :param first: (A, 3) Lab colors
+        :param second: (B, 3) Lab colors
+        Returns: (A, B) harmony in [0, 1], neutrals go with everything, analogous and complementary hues score higher than the rest
+        """
+        chroma_first = np.hypot(first[:, 1], first[:, 2])[:, None]
+        chroma_second = np.hypot(second[:, 1], second[:, 2])[None, :]
+        hue_first = np.arctan2(first[:, 2], first[:, 1])[:, None]
+        hue_second = np.arctan2(second[:, 2], second[:, 1])[None, :]
+
+        hue_distance = np.abs(np.angle(np.exp(1j * (hue_first - hue_second))))
+        harmony = np.select([hue_distance < np.pi / 6, hue_distance > 5 * np.pi / 6], [1.0, 0.8], default=0.4)
+
+        neutral = (chroma_first < NEUTRAL_CHROMA) | (chroma_second < NEUTRAL_CHROMA)
+        return np.where(neutral, 0.9, harmony)
+
+    def compatibility(self, first: np.ndarray, second: np.ndarray, embeddings: np.ndarray, colors: np.ndarray) -> np.ndarray:
+        """
+        Returns: (A, B) style + color compatibility of the items first and second
+        """
+        style = embeddings[first] @ embeddings[second].T
+        harmony = self.color_harmony(colors[first], colors[second])
+        return STYLE_WEIGHT * style + COLOR_WEIGHT * harmony
+
+    def _priors(self, members: list[np.ndarray], embeddings: np.ndarray, colors: np.ndarray, context: np.ndarray) -> list[np.ndarray]:
+        """
+        Returns: per category, context fit of every item plus its mean best compatibility with the other categories,
+        an item only scores well in a combination if it has a good partner in every other slot
+        """
+        best = [[] for _ in members]
+        for first in range(len(members)):
+            for second in range(first + 1, len(members)):
+                if len(members[first]) == 0 or len(members[second]) == 0:
+                    continue
+
+                compatibility = self.compatibility(members[first], members[second], embeddings, colors)
+                best[first].append(compatibility.max(axis=1))
+                best[second].append(compatibility.max(axis=0))
+
+        return [CONTEXT_WEIGHT * context[indices] + (np.mean(partners, axis=0) if partners else 0.0) for indices, partners in zip(members, best)]
+
+    def _prune(self, indices: np.ndarray, prior: Optional[np.ndarray]) -> np.ndarray:
+        if len(indices) <= self.candidates:
+            return indices
+        return indices[np.argpartition(-prior, self.candidates - 1)[:self.candidates]]
+
+    def rank(self, categories: np.ndarray, embeddings: np.ndarray, colors: np.ndarray, context: np.ndarray, limit: int = 10) -> list[tuple[float, tuple[int, ...]]]:
+        """
+        :param categories: (N,) index into SUGGESTION_CATEGORIES per item, -1 for items that never take part
+        :param embeddings: (N, D) normalized image embeddings, zero rows for items without one
+        :param colors: (N, 3) Lab main color per item
+        :param context: (N,) fit of every item for the requested season / tag in [0, 1]
+        Returns: [(score, item index per category or -1 for an empty optional slot), ...] best first
+        """
+        members = [np.flatnonzero(categories == category_index) for category_index in range(len(SUGGESTION_CATEGORIES))]
+        # ties in context fit alone would leave an arbitrary subset, the prior also knows which items go together
+        priors = self._priors(members, embeddings, colors, context) if any(len(indices) > self.candidates for indices in members) else [None] * len(members)
+
+        slots = []
+        for category, indices, prior in zip(SUGGESTION_CATEGORIES, members, priors):
+            indices = self._prune(indices, prior)
+            if category in OPTIONAL_CATEGORIES:
+                indices = np.append(indices, -1)
+            if len(indices) == 0:
+                return []
+            slots.append(indices)
+
+        present = [slot >= 0 for slot in slots]
+        grid_shape = tuple(len(slot) for slot in slots)
+
+        def expand(values: np.ndarray, axes: tuple[int, ...]) -> np.ndarray:
+            shape = [1] * len(slots)
+            for axis in axes:
+                shape[axis] = grid_shape[axis]
+            return values.reshape(shape)
+
+        context_sum = np.zeros(grid_shape, dtype=np.float32)
+        item_count = np.zeros(grid_shape, dtype=np.float32)
+        for axis, slot in enumerate(slots):
+            context_sum = context_sum + expand(np.where(present[axis], context[slot], 0.0).astype(np.float32), (axis,))
+            item_count = item_count + expand(present[axis].astype(np.float32), (axis,))
+
+        pair_sum = np.zeros(grid_shape, dtype=np.float32)
+        pair_count = np.zeros(grid_shape, dtype=np.float32)
+        for first in range(len(slots)):
+            for second in range(first + 1, len(slots)):
+                both = present[first][:, None] & present[second][None, :]
+                compatibility = np.where(both, self.compatibility(slots[first], slots[second], embeddings, colors), 0.0).astype(np.float32)
+
+                pair_sum = pair_sum + expand(compatibility, (first, second))
+                pair_count = pair_count + expand(both.astype(np.float32), (first, second))
+
+        scores = (CONTEXT_WEIGHT * context_sum / item_count + pair_sum / np.maximum(pair_count, 1)).ravel()
+
+        limit = min(limit, scores.size)
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+
+        combinations = np.stack(np.unravel_index(top, grid_shape), axis=1)
+        return [
+            (round(float(scores[flat]), 4), tuple(int(slots[axis][position]) for axis, position in enumerate(combination)))
+            for flat, combination in zip(top, combinations)
+        ]
+
+outfit_suggestion_engine = OutfitSuggestionEngine()
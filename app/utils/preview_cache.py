@@ -0,0 +1,177 @@
+__all__ = ["preview_cache", "CachedPreview"]
+
+import json
+import time
+import hashlib
+import threading
+from os import getenv
+from typing import Callable, Optional
+from dataclasses import dataclass
+from collections import OrderedDict
+from concurrent.futures import Future
+from redis import Redis, RedisError
+from app.utils.logging import get_logger
+
+logger = get_logger()
+
+PREVIEW_CACHE_SIZE = int(getenv("PREVIEW_CACHE_SIZE", "128"))
+PREVIEW_CACHE_TTL = int(getenv("PREVIEW_CACHE_TTL", "86400")) # 0 disables the redis tier
+PREVIEW_CACHE_LOCK_TTL = 60
+
+CACHE_KEY = "preview:cache:{}"
+LOCK_KEY = "preview:lock:{}"
+
+@dataclass
+class CachedPreview:
+    webp: bytes
+    result: dict
+    embedding: Optional[bytes] = None # float16 FashionCLIP image embedding, kept for the embedding store
+
+class PreviewCache:
+    """
+    Content addressed cache of processed previews (hash of the raw upload -> WEBP + extracted attributes).
+    A local LRU sits in front of an optional redis tier, identical uploads that arrive concurrently
+    share one computation (per process via futures, across processes via a redis lock).
+    """
+
+    def __init__(self, max_entries: int = PREVIEW_CACHE_SIZE, redis_uri: str = getenv("REDIS_URI", "redis://localhost:6379"), redis_ttl: int = PREVIEW_CACHE_TTL):
+        self.max_entries = max_entries
+        self.redis_uri = redis_uri
+        self.redis_ttl = redis_ttl
+        self._entries: OrderedDict[str, CachedPreview] = OrderedDict()
+        self._in_flight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._redis: Redis = None
+
+    @property
+    def redis(self) -> Optional[Redis]:
+        if self.redis_ttl <= 0:
+            return None
+        if self._redis is None:
+            self._redis = Redis.from_url(self.redis_uri)
+        return self._redis
+
+    @staticmethod
+    def key(data: bytes, variant: str = "") -> str:
+        """
+        Returns: sha256 of the upload, suffixed with the variant (e.g. the quality tier) it was processed with
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        return f"{digest}:{variant}" if variant else digest
+
+    def _get_local(self, key: str) -> Optional[CachedPreview]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _put_local(self, key: str, entry: CachedPreview) -> None:
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[CachedPreview]:
+        entry = self._get_local(key)
+        if entry is not None or self.redis is None:
+            return entry
+
+        try:
+            cached = self.redis.hgetall(CACHE_KEY.format(key))
+        except RedisError as e:
+            logger.warning(f"Preview cache lookup failed: {e}")
+            return None
+
+        if not cached:
+            return None
+
+        entry = CachedPreview(webp=cached[b"webp"], result=json.loads(cached[b"result"]), embedding=cached.get(b"embedding"))
+        self._put_local(key, entry)
+        return entry
+
+    def put(self, key: str, entry: CachedPreview) -> None:
+        self._put_local(key, entry)
+
+        if self.redis is None:
+            return
+
+        try:
+            pipe = self.redis.pipeline()
+            mapping = {"webp": entry.webp, "result": json.dumps(entry.result)}
+            if entry.embedding is not None:
+                mapping["embedding"] = entry.embedding
+
+            pipe.hset(CACHE_KEY.format(key), mapping=mapping)
+            pipe.expire(CACHE_KEY.format(key), self.redis_ttl)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Preview cache store failed: {e}")
+
+    def _acquire_or_wait(self, key: str) -> tuple[Optional[CachedPreview], bool]:
+        """
+        Returns: (entry another process computed, whether this process holds the lock)
+        """
+        try:
+            deadline = time.monotonic() + PREVIEW_CACHE_LOCK_TTL
+            while time.monotonic() < deadline:
+                if self.redis.set(LOCK_KEY.format(key), 1, nx=True, ex=PREVIEW_CACHE_LOCK_TTL):
+                    return None, True
+
+                time.sleep(0.1)
+                entry = self.get(key)
+                if entry is not None:
+                    return entry, False
+        except RedisError as e:
+            logger.warning(f"Preview cache lock failed: {e}")
+
+        return None, False
+
+    def get_or_compute(self, key: str, compute: Callable[[], CachedPreview]) -> tuple[CachedPreview, bool]:
+        """
+        Returns: (entry, was_cached)
+        """
+        entry = self.get(key)
+        if entry is not None:
+            return entry, True
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not is_leader:
+            return future.result(), True
+
+        holds_lock = False
+        try:
+            if self.redis is not None:
+                entry, holds_lock = self._acquire_or_wait(key)
+            was_cached = entry is not None
+
+            if entry is None:
+                entry = compute()
+                self.put(key, entry)
+
+            future.set_result(entry)
+            return entry, was_cached
+        except Exception as e:
+            future.set_exception(e)
+            raise e
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+            if holds_lock:
+                try:
+                    self.redis.delete(LOCK_KEY.format(key))
+                except RedisError:
+                    pass
+
+preview_cache = PreviewCache()
@@ -0,0 +1,132 @@
+__all__ = ["preview_staging"]
+
+import time
+from os import getenv
+from typing import Optional
+from redis import Redis
+from app.utils.storage import storage, StorageNamespace
+from app.utils.logging import get_logger
+
+logger = get_logger()
+
+PREVIEW_STAGING_TTL = int(getenv("PREVIEW_STAGING_TTL", "86400"))
+
+STAGED_KEY = "preview:staged:{}"
+EXPIRY_KEY = "preview:staged:expiry" # sorted set image_id -> expires_at, the files outlive the hash
+
+class PreviewStaging:
+    """
+    Previews waiting to become clothing images, shared by every API node.
+    The files sit in the temp namespace of the storage backend, redis holds the index (image_id -> owner, expiry),
+    so a preview processed on one node can be created or updated from any other one.
+    """
+
+    def __init__(self, redis_uri: str = getenv("REDIS_URI", "redis://localhost:6379"), ttl: int = PREVIEW_STAGING_TTL):
+        self.redis_uri = redis_uri
+        self.ttl = ttl
+        self._redis: Redis = None
+
+    @property
+    def redis(self) -> Redis:
+        if self._redis is None:
+            self._redis = Redis.from_url(self.redis_uri)
+        return self._redis
+
+    def stage(self, image_id: str, user_id: str, webp: bytes, embedding: Optional[bytes] = None) -> None:
+        """
+        Stores the preview and registers it, the index entry is written last so it never points at missing files.
+        Raises: ValueError without a user_id, only the user a preview was staged for can use it
+        """
+        if not user_id:
+            raise ValueError("A preview can only be staged for a user.")
+
+        if embedding is not None:
+            storage.put(StorageNamespace.TEMP, f"{image_id}.emb", embedding)
+        storage.put(StorageNamespace.TEMP, f"{image_id}.webp", webp)
+
+        expires_at = time.time() + self.ttl
+        pipe = self.redis.pipeline()
+        pipe.hset(STAGED_KEY.format(image_id), mapping={"owner": user_id, "expires_at": expires_at})
+        pipe.expire(STAGED_KEY.format(image_id), self.ttl)
+        pipe.zadd(EXPIRY_KEY, {image_id: expires_at})
+        pipe.execute()
+
+        logger.debug(f"Staged preview {image_id} for user {user_id}.")
+
+    def attach_embedding(self, image_id: str, embedding: bytes) -> None:
+        """
+        Adds the embedding of a preview that was staged before it was computed (streamed previews).
+        """
+        storage.put(StorageNamespace.TEMP, f"{image_id}.emb", embedding)
+
+    def owner(self, image_id: str) -> Optional[str]:
+        """
+        Returns: the user the preview was staged for, None if it is not staged or expired
+        """
+        owner = self.redis.hget(STAGED_KEY.format(image_id), "owner")
+        return None if owner is None else owner.decode()
+
+    def is_staged(self, image_id: str, user_id: str) -> bool:
+        owner = self.owner(image_id)
+        return owner is not None and owner == user_id
+
+    def read(self, image_id: str, user_id: str) -> bytes:
+        """
+        Copies the staged preview out of staging, it stays staged until remove() so a failed promotion can be retried.
+        Returns: the WEBP of the preview
+        Raises: FileNotFoundError if the preview is not staged for user_id
+        """
+        if not self.is_staged(image_id, user_id):
+            raise FileNotFoundError(f"The preview {image_id} is not staged for user {user_id}.")
+
+        try:
+            return storage.get(StorageNamespace.TEMP, f"{image_id}.webp")
+        except FileNotFoundError as e:
+            raise e
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while reading the preview {image_id}: {e}")
+            raise e
+
+    def remove(self, image_id: str) -> None:
+        """
+        Takes a preview out of staging once the item using it is committed, the unique image_id
+        of the clothing row keeps two requests from committing the same preview.
+        """
+        self.discard(image_id)
+        storage.delete(StorageNamespace.TEMP, f"{image_id}.webp")
+        storage.delete(StorageNamespace.TEMP, f"{image_id}.emb")
+
+        logger.debug(f"Promoted preview {image_id}.")
+
+    def pop_expired(self, limit: int, now: Optional[float] = None) -> list[str]:
+        """
+        Returns: up to limit image_ids whose staging expired, removed from the expiry index
+        """
+        now = time.time() if now is None else now
+        image_ids = self.redis.zrangebyscore(EXPIRY_KEY, "-inf", now, start=0, num=limit)
+        if image_ids:
+            self.redis.zrem(EXPIRY_KEY, *image_ids)
+        return [image_id.decode() for image_id in image_ids]
+
+    def discard(self, image_id: str) -> None:
+        """
+        Unregisters a preview whose files were removed before it expired.
+        """
+        pipe = self.redis.pipeline()
+        pipe.delete(STAGED_KEY.format(image_id))
+        pipe.zrem(EXPIRY_KEY, image_id)
+        pipe.execute()
+
+    def pop_embedding(self, image_id: str) -> Optional[bytes]:
+        """
+        Returns: the embedding sidecar of a promoted preview, removed from staging, None if there is none
+        """
+        try:
+            embedding = storage.get(StorageNamespace.TEMP, f"{image_id}.emb")
+        except FileNotFoundError:
+            return None
+
+        storage.delete(StorageNamespace.TEMP, f"{image_id}.emb")
+        return embedding
+
+preview_staging = PreviewStaging()
@@ -0,0 +1,235 @@
+__all__ = ["rendition_cache"]
+
+import os
+import time
+import logging
+import threading
+from os import getenv
+from typing import Optional
+from io import BytesIO
+from PIL import Image
+from filelock import FileLock, Timeout
+from app.utils.exceptions import RenditionWidthInvalidError
+from app.utils.storage import storage, PARTIAL_WRITE_GRACE
+from app.utils.logging import get_logger
+
+logger = get_logger()
+logging.getLogger("filelock").setLevel(logging.WARNING)
+
+try:
+    import pillow_avif # registers the AVIF codec with Pillow
+except ImportError:
+    pillow_avif = None
+
+RENDITION_CACHE_DIR = getenv("RENDITION_CACHE_DIR", "cache/renditions")
+RENDITION_CACHE_MAX_BYTES = int(getenv("RENDITION_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+RENDITION_WIDTHS = (128, 256, 512)
+EVICTION_TARGET = 0.9 # share of the budget the cache is trimmed to, so eviction does not run on every write
+
+# in order of preference, AVIF only where the codec is installed
+FORMATS = {
+    "image/avif": ("AVIF", ".avif", {"quality": 60}),
+    "image/webp": ("WEBP", ".webp", {"quality": 80}),
+    "image/png": ("PNG", ".png", {"optimize": False}),
+}
+SOURCE_MIMETYPE = "image/webp"
+
+class RenditionCache:
+    """
+    Downscaled and re-encoded variants of the stored images, generated on first request.
+    Requested widths snap up to the next rendition so arbitrary values cannot fill the cache, anything
+    above the largest rendition is the original. Renditions live on disk, a hit refreshes the mtime
+    and the least recently used files are evicted once the cache grows past its byte budget.
+    """
+
+    def __init__(self, root: str = RENDITION_CACHE_DIR, max_bytes: int = RENDITION_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        Image.init()
+        self.mimetypes = [mimetype for mimetype, (name, _, _) in FORMATS.items() if name in Image.SAVE]
+        self._written_bytes = None # estimate of this process, corrected whenever eviction scans the directory
+        self._evicting = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def parse_width(value: Optional[str]) -> Optional[int]:
+        """
+        Returns: the rendition width for a requested width, None for the original
+        """
+        if value is None or value == "":
+            return None
+
+        try:
+            width = int(value)
+        except ValueError:
+            raise RenditionWidthInvalidError()
+        if width <= 0:
+            raise RenditionWidthInvalidError()
+
+        return next((rendition for rendition in RENDITION_WIDTHS if rendition >= width), None)
+
+    def negotiate(self, accept) -> Optional[str]:
+        """
+        :param accept: werkzeug MIMEAccept of the request
+        Returns: the best supported mimetype, None if the client accepts none of them
+        """
+        if not accept:
+            return SOURCE_MIMETYPE
+
+        # wildcards keep getting the source format, AVIF only goes to clients that name it
+        if "image/avif" in self.mimetypes and any(value == "image/avif" and quality > 0 for value, quality in accept):
+            return "image/avif"
+
+        return accept.best_match([mimetype for mimetype in self.mimetypes if mimetype != "image/avif"])
+
+    def _path(self, namespace: str, key: str, width: Optional[int], mimetype: str) -> str:
+        name = os.path.splitext(key)[0]
+        return os.path.join(self.root, namespace, storage.shard(key).split("/")[0], f"{name}.{width or 'original'}{FORMATS[mimetype][1]}")
+
+    def get(self, namespace: str, key: str, width: Optional[int], mimetype: str) -> Optional[str]:
+        """
+        Returns: local path of the rendition, None where the stored image already is the requested variant
+        """
+        if width is None and mimetype == SOURCE_MIMETYPE:
+            return None
+
+        path = self._path(namespace, key, width, mimetype)
+        try:
+            # the mtime is the recency of the least recently used eviction
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            pass
+
+        try:
+            self._render(storage.get(namespace, key), path, width, mimetype)
+        except FileNotFoundError as e:
+            raise e
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while rendering {namespace}/{key} at width {width} as {mimetype}: {e}")
+            raise e
+
+        return path
+
+    def _render(self, source: bytes, path: str, width: Optional[int], mimetype: str) -> None:
+        format_name, _, options = FORMATS[mimetype]
+
+        with Image.open(BytesIO(source)) as image:
+            image.load()
+            if width is not None and image.width > width:
+                image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # concurrent renders of the same variant are harmless, the last rename wins
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            image.save(tmp_path, format=format_name, **options)
+
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        logger.debug(f"Rendered {path} ({size} bytes).")
+
+        with self._lock:
+            if self._written_bytes is not None:
+                self._written_bytes += size
+            # unknown until the first scan, which is the eviction run itself
+            over_budget = self._written_bytes is None or self._written_bytes > self.max_bytes
+
+        if over_budget:
+            self._evict_in_background()
+
+    def _evict_in_background(self) -> None:
+        """
+        Scanning the cache walks every rendition on disk, so it never runs in the request that crossed the budget.
+        """
+        with self._lock:
+            if self._evicting:
+                return
+            self._evicting = True
+
+        threading.Thread(target=self._run_eviction, name="rendition-eviction", daemon=True).start()
+
+    def _run_eviction(self) -> None:
+        try:
+            self.evict()
+        except Exception:
+            pass # logged by evict
+        finally:
+            with self._lock:
+                self._evicting = False
+
+    def _usage(self, before: float) -> tuple[int, list[tuple[float, int, str]], list[tuple[int, str]]]:
+        """
+        Returns: (total bytes, [(mtime, size, path), ...] of every rendition, [(size, path), ...] of the temporary files
+        last modified before the given timestamp), renders still being written count towards the total but are never evicted
+        """
+        total, files, stale = 0, [], []
+        if not os.path.isdir(self.root):
+            return total, files, stale
+
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.startswith("."):
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                total += stat.st_size
+
+                if filename.endswith(".tmp"):
+                    if stat.st_mtime < before:
+                        stale.append((stat.st_size, path))
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        return total, files, stale
+
+    def evict(self) -> int:
+        """
+        Returns: bytes freed, the least recently used renditions go first until the cache is below its target size
+        """
+        os.makedirs(self.root, exist_ok=True)
+        freed = 0
+
+        # one process scans and deletes at a time, the others skip instead of waiting
+        lock = FileLock(os.path.join(self.root, ".evict.lock"))
+        try:
+            lock.acquire(timeout=0)
+        except Timeout:
+            return freed
+
+        try:
+            total, files, stale = self._usage(time.time() - PARTIAL_WRITE_GRACE)
+            target = self.max_bytes * EVICTION_TARGET
+
+            # a render that died before its rename left its temporary file behind
+            for size, path in stale:
+                try:
+                    os.remove(path)
+                    freed += size
+                except FileNotFoundError:
+                    pass
+
+            for _, size, path in sorted(files):
+                if total - freed <= target:
+                    break
+                try:
+                    os.remove(path)
+                    freed += size
+                except FileNotFoundError:
+                    pass
+
+            with self._lock:
+                self._written_bytes = total - freed
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while evicting renditions: {e}")
+            raise e
+        finally:
+            lock.release()
+
+        if freed:
+            logger.info(f"Evicted {freed} bytes of renditions, {total - freed} bytes remain.")
+        return freed
+
+rendition_cache = RenditionCache()
@@ -0,0 +1,157 @@
+__all__ = ["segmentation_engine"]
+
+import threading
+import numpy as np
+import torch
+from os import getenv
+from typing import Optional
+from PIL import Image
+from backgroundremover import bg
+from backgroundremover.u2net import detect
+from app.utils.batching import MicroBatcher
+from app.utils.inference_backends import InferenceBackend, TorchBackend
+from app.utils.kernels import kernels
+from app.utils.logging import get_logger
+
+logger = get_logger()
+
+SEGMENTATION_MODEL = "u2net_cloth_segm"
+SEGMENTATION_ROI_PADDING = float(getenv("SEGMENTATION_ROI_PADDING", "0.08")) # fraction of the box added on every side
+SEGMENTATION_ROI_MAX_COVERAGE = 0.6 # above this share of the frame the crop saves less than the second pass costs
+
+class SegmentationEngine:
+    """
+    Keeps the u2net weights resident for the lifetime of the worker instead of
+    letting backgroundremover reload them on every bg.remove call.
+    Loading and torch threading is coordinated by the model_manager.
+    """
+
+    def __init__(self, model_name: str = SEGMENTATION_MODEL):
+        self.model_name = model_name
+        self._net: torch.nn.Module = None
+        self._released = False
+        self.backend: InferenceBackend = None
+        self._lock = threading.Lock()
+        self._batcher = MicroBatcher("u2net", self.predict_masks)
+
+    @property
+    def loaded(self) -> bool:
+        return self._net is not None or self._released
+
+    def load(self) -> Optional[torch.nn.Module]:
+        """
+        Returns: the u2net module, None once it was released in favour of an exported backend
+        """
+        if self._net is None and not self._released:
+            with self._lock:
+                if self._net is None and not self._released:
+                    net = bg.get_model(self.model_name)
+                    net.eval()
+                    for parameter in net.parameters():
+                        parameter.requires_grad_(False)
+
+                    self._net = net
+                    if self.backend is None:
+                        self.backend = TorchBackend(segmentation_net=net)
+                    logger.info(f"Segmentation model {self.model_name} loaded.")
+
+        return self._net
+
+    def release(self) -> None:
+        """
+        Drops the torch weights, the backend set on the engine has to run the forward pass without them.
+        """
+        with self._lock:
+            self._net = None
+            self._released = True
+
+    def predict_masks(self, images: list[Image.Image]) -> list[Image.Image]:
+        """
+        Runs one forward pass over all images.
+        Returns: 320x320 "L" masks, same as backgroundremover's detect.predict
+        """
+        self.load()
+        inputs = np.stack([detect.preprocess(np.asarray(image))["image"].numpy() for image in images]).astype(np.float32)
+
+        prediction = self.backend.segment(inputs)
+
+        # normalized per image like detect.norm_pred, not over the whole batch
+        minimum = prediction.min(axis=(1, 2), keepdims=True)
+        maximum = prediction.max(axis=(1, 2), keepdims=True)
+        prediction = (prediction - minimum) / (maximum - minimum)
+        masks = (prediction * 255).astype(np.uint8)
+
+        return [Image.fromarray(mask, mode="L") for mask in masks]
+
+    def predict_mask(self, image: Image.Image) -> Image.Image:
+        return self._batcher(image)
+
+    def segment(self, image: Image.Image, alpha_matting: bool = True, foreground_threshold: int = 200, background_threshold: int = 10, erode_structure_size: int = 13, base_size: int = 512, roi: bool = False, mask: Optional[Image.Image] = None) -> Image.Image:
+        """
+        :param mask: u2net mask of the whole image if it was already predicted
+        Returns: RGBA cutout of the given image, only of the region of interest if roi is set
+        """
+        if roi:
+            return self.segment_roi(image, alpha_matting, foreground_threshold, background_threshold, erode_structure_size, base_size, coarse_mask=mask)[0]
+
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+
+        if mask is None:
+            mask = self.predict_mask(image)
+
+        return self._cutout(image, mask, alpha_matting, foreground_threshold, background_threshold, erode_structure_size, base_size)
+
+    def segment_roi(self, image: Image.Image, alpha_matting: bool = True, foreground_threshold: int = 200, background_threshold: int = 10, erode_structure_size: int = 13, base_size: int = 512, padding: float = SEGMENTATION_ROI_PADDING, coarse_mask: Optional[Image.Image] = None) -> tuple[Image.Image, tuple[int, int, int, int]]:
+        """
+        Two passes: the coarse mask of the whole frame locates the garment, segmentation and matting
+        then run again on the padded crop only. Cropped to its alpha bbox the cutout matches segment().
+        Returns: (RGBA cutout of the crop, crop box in image coordinates)
+        """
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+
+        if coarse_mask is None:
+            coarse_mask = self.predict_mask(image)
+        box = self.find_roi(image.size, coarse_mask, background_threshold, padding)
+
+        full_frame = (0, 0, image.width, image.height)
+        if box is None or (box[2] - box[0]) * (box[3] - box[1]) > SEGMENTATION_ROI_MAX_COVERAGE * image.width * image.height:
+            return self._cutout(image, coarse_mask, alpha_matting, foreground_threshold, background_threshold, erode_structure_size, base_size), full_frame
+
+        crop = image.crop(box)
+
+        # matting keeps the pixel density of the full frame, so only the cropped area is paid for
+        crop_base_size = max(1, round(base_size * max(crop.size) / max(image.size)))
+
+        return self._cutout(crop, self.predict_mask(crop), alpha_matting, foreground_threshold, background_threshold, erode_structure_size, crop_base_size), box
+
+    @staticmethod
+    def find_roi(size: tuple[int, int], mask: Image.Image, threshold: int, padding: float) -> Optional[tuple[int, int, int, int]]:
+        """
+        Returns: padded bounding box of everything above threshold in the mask, scaled to size, or None for an empty mask
+        """
+        bbox = kernels.alpha_bbox(np.asarray(mask), threshold)
+        if bbox is None:
+            return None
+
+        scale_x, scale_y = size[0] / mask.width, size[1] / mask.height
+        left, top, right, bottom = bbox[0] * scale_x, bbox[1] * scale_y, bbox[2] * scale_x, bbox[3] * scale_y
+        pad_x, pad_y = (right - left) * padding, (bottom - top) * padding
+
+        return (
+            max(0, int(left - pad_x)),
+            max(0, int(top - pad_y)),
+            min(size[0], int(np.ceil(right + pad_x))),
+            min(size[1], int(np.ceil(bottom + pad_y))),
+        )
+
+    @staticmethod
+    def _cutout(image: Image.Image, mask: Image.Image, alpha_matting: bool, foreground_threshold: int, background_threshold: int, erode_structure_size: int, base_size: int) -> Image.Image:
+        if alpha_matting:
+            # alpha_matting_cutout thumbnails the image in place
+            return bg.alpha_matting_cutout(image.copy(), mask, foreground_threshold, background_threshold, erode_structure_size, base_size)
+
+        return bg.naive_cutout(image, mask)
+
+segmentation_engine = SegmentationEngine()
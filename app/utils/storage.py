@@ -0,0 +1,317 @@
+__all__ = ["storage", "Storage", "StoredObject", "StorageNamespace", "LocalStorage", "S3Storage"]
+
+import os
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from os import getenv
+from typing import Optional, Iterator
+from dataclasses import dataclass
+from app.utils.logging import get_logger
+
+logger = get_logger()
+
+STORAGE_BACKEND = getenv("STORAGE_BACKEND", "local") # local or s3
+STORAGE_ROOT = getenv("STORAGE_ROOT", "app/static")
+STORAGE_S3_BUCKET = getenv("STORAGE_S3_BUCKET", "clothing-booth")
+STORAGE_S3_ENDPOINT = getenv("STORAGE_S3_ENDPOINT") # e.g. a local MinIO, unset for AWS
+STORAGE_S3_REGION = getenv("STORAGE_S3_REGION")
+PARTIAL_WRITE_GRACE = 3600 # seconds, a temporary file older than this belongs to a write that is never going to finish
+
+class StorageNamespace:
+    CLOTHING = "clothing_images"
+    TEMP = "temp"
+    OUTFITS = "outfit_collages"
+    PROFILE_PICTURES = "profile_pictures"
+    DEFAULT_PROFILE_PICTURES = "profile_pictures/default" # the shipped pictures a user can pick instead of an upload
+
+@dataclass
+class StoredObject:
+    key: str
+    size: int
+    modified: float # unix timestamp
+
+class Storage(ABC):
+    """
+    Flat key value store of image files, grouped into namespaces.
+    Keys are file names like "{image_id}.webp", where and how they are laid out is up to the backend.
+    """
+    name = "base"
+
+    @staticmethod
+    def shard(key: str) -> str:
+        """
+        Returns: two level prefix ("ab/cd") derived from the key, so no directory or prefix holds more than a fraction of the files
+        """
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return f"{digest[:2]}/{digest[2:4]}"
+
+    @abstractmethod
+    def put(self, namespace: str, key: str, data: bytes) -> None:
+        """
+        Replaces the key atomically, readers see either the old or the new content
+        """
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> bytes:
+        """
+        Raises: FileNotFoundError if the key does not exist
+        """
+
+    @abstractmethod
+    def stat(self, namespace: str, key: str) -> Optional[StoredObject]:
+        """
+        Returns: size and modification time without reading the content, None if the key does not exist
+        """
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str) -> bool:
+        """
+        Returns: whether something was deleted
+        """
+
+    @abstractmethod
+    def move(self, namespace: str, key: str, target_namespace: str, target_key: str) -> None:
+        """
+        Raises: FileNotFoundError if the source does not exist
+        """
+
+    def local_path(self, namespace: str, key: str) -> Optional[str]:
+        """
+        Returns: a path on this node the file can be sent from directly, None where the backend has none
+        """
+        return None
+
+    @abstractmethod
+    def scan(self, namespace: str, cursor: Optional[str] = None, limit: int = 1000) -> tuple[list[StoredObject], Optional[str]]:
+        """
+        Lists a namespace in batches, pass the returned cursor back in for the next one.
+        Returns: (at most limit objects, cursor of the next batch or None once the namespace is exhausted)
+        """
+
+    def purge_partial_writes(self, namespace: str, before: float) -> list[StoredObject]:
+        """
+        Deletes what writes that never finished (the process died between writing and renaming) left behind, scan() does not list it.
+        Returns: the deleted leftovers, those modified after before may still be written, none where writes are atomic
+        """
+        return []
+
+class LocalStorage(Storage):
+    """
+    Files on the local disk, {root}/{namespace}/{ab}/{cd}/{key}.
+    Files written before sharding still sit flat in {root}/{namespace}/{key} and are found there as a fallback.
+    """
+    name = "local"
+
+    def __init__(self, root: str = STORAGE_ROOT):
+        self.root = root
+
+    def _path(self, namespace: str, key: str) -> str:
+        return os.path.join(self.root, namespace, self.shard(key), key)
+
+    def _legacy_path(self, namespace: str, key: str) -> str:
+        return os.path.join(self.root, namespace, key)
+
+    def _existing_path(self, namespace: str, key: str) -> Optional[str]:
+        for path in (self._path(namespace, key), self._legacy_path(namespace, key)):
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def put(self, namespace: str, key: str, data: bytes) -> None:
+        path = self._path(namespace, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # written under a temporary name so a half written file is never served
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, namespace: str, key: str) -> bytes:
+        path = self._existing_path(namespace, key)
+        if path is None:
+            raise FileNotFoundError(f"{namespace}/{key} does not exist.")
+
+        with open(path, "rb") as f:
+            return f.read()
+
+    def stat(self, namespace: str, key: str) -> Optional[StoredObject]:
+        for path in (self._path(namespace, key), self._legacy_path(namespace, key)):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            return StoredObject(key, stat.st_size, stat.st_mtime)
+        return None
+
+    def delete(self, namespace: str, key: str) -> bool:
+        deleted = False
+        for path in (self._path(namespace, key), self._legacy_path(namespace, key)):
+            try:
+                os.remove(path)
+                deleted = True
+            except FileNotFoundError:
+                pass
+        return deleted
+
+    def move(self, namespace: str, key: str, target_namespace: str, target_key: str) -> None:
+        source = self._existing_path(namespace, key)
+        if source is None:
+            raise FileNotFoundError(f"{namespace}/{key} does not exist.")
+
+        target = self._path(target_namespace, target_key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(source, target)
+        # modified is when the file arrived in the namespace, like the copy on S3, garbage collection relies on it
+        os.utime(target)
+
+    def local_path(self, namespace: str, key: str) -> Optional[str]:
+        return self._existing_path(namespace, key)
+
+    @staticmethod
+    def _listdir(path: str) -> list[str]:
+        try:
+            return sorted(os.listdir(path))
+        except FileNotFoundError:
+            return []
+
+    def _walk(self, namespace: str, after: Optional[str]) -> Iterator[tuple[str, str]]:
+        """
+        Returns: (relative path, path) of every file in a stable order, sharded ones ("ab/cd/key") first, legacy flat ones ("key") after
+        """
+        base = os.path.join(self.root, namespace)
+        after_parts = after.split("/") if after is not None and "/" in after else None
+        legacy_after = after if after is not None and "/" not in after else None
+
+        if legacy_after is None:
+            for first in self._listdir(base):
+                if len(first) != 2 or (after_parts is not None and first < after_parts[0]):
+                    continue
+                for second in self._listdir(os.path.join(base, first)):
+                    if after_parts is not None and (first, second) < tuple(after_parts[:2]):
+                        continue
+                    for key in self._listdir(os.path.join(base, first, second)):
+                        relative = f"{first}/{second}/{key}"
+                        if key.endswith(".tmp") or (after_parts is not None and (first, second, key) <= tuple(after_parts)):
+                            continue
+                        yield relative, os.path.join(base, first, second, key)
+
+        for key in self._listdir(base):
+            if len(key) == 2 or key.endswith(".tmp") or (legacy_after is not None and key <= legacy_after):
+                continue
+            path = os.path.join(base, key)
+            if os.path.isfile(path):
+                yield key, path
+
+    def scan(self, namespace: str, cursor: Optional[str] = None, limit: int = 1000) -> tuple[list[StoredObject], Optional[str]]:
+        objects, last = [], None
+        for relative, path in self._walk(namespace, cursor):
+            if len(objects) >= limit:
+                return objects, last
+
+            last = relative
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            objects.append(StoredObject(os.path.basename(path), stat.st_size, stat.st_mtime))
+
+        return objects, None
+
+    def purge_partial_writes(self, namespace: str, before: float) -> list[StoredObject]:
+        partial = []
+        for directory, _, filenames in os.walk(os.path.join(self.root, namespace)):
+            for filename in filenames:
+                if not filename.endswith(".tmp"):
+                    continue
+
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                    if stat.st_mtime >= before:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                partial.append(StoredObject(filename, stat.st_size, stat.st_mtime))
+
+        return partial
+
+class S3Storage(Storage):
+    """
+    Objects in an S3 compatible bucket, {namespace}/{ab}/{cd}/{key}.
+    The endpoint can point at any S3 compatible server, e.g. a local MinIO for development and tests.
+    """
+    name = "s3"
+
+    def __init__(self, bucket: str = STORAGE_S3_BUCKET, endpoint_url: Optional[str] = STORAGE_S3_ENDPOINT, region: Optional[str] = STORAGE_S3_REGION):
+        import boto3 # only needed with this backend
+
+        self.bucket = bucket
+        self._client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{namespace}/{self.shard(key)}/{key}"
+
+    @staticmethod
+    def _is_missing(error: Exception) -> bool:
+        response = getattr(error, "response", None) or {}
+        return response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def put(self, namespace: str, key: str, data: bytes) -> None:
+        self._client.put_object(Bucket=self.bucket, Key=self._key(namespace, key), Body=data)
+
+    def get(self, namespace: str, key: str) -> bytes:
+        try:
+            return self._client.get_object(Bucket=self.bucket, Key=self._key(namespace, key))["Body"].read()
+        except Exception as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(f"{namespace}/{key} does not exist.")
+            raise e
+
+    def stat(self, namespace: str, key: str) -> Optional[StoredObject]:
+        try:
+            head = self._client.head_object(Bucket=self.bucket, Key=self._key(namespace, key))
+        except Exception as e:
+            if self._is_missing(e):
+                return None
+            raise e
+
+        return StoredObject(key, head["ContentLength"], head["LastModified"].timestamp())
+
+    def delete(self, namespace: str, key: str) -> bool:
+        # S3 deletes are idempotent and do not say whether the object existed
+        if self.stat(namespace, key) is None:
+            return False
+
+        self._client.delete_object(Bucket=self.bucket, Key=self._key(namespace, key))
+        return True
+
+    def move(self, namespace: str, key: str, target_namespace: str, target_key: str) -> None:
+        try:
+            self._client.copy_object(Bucket=self.bucket, Key=self._key(target_namespace, target_key), CopySource={"Bucket": self.bucket, "Key": self._key(namespace, key)})
+        except Exception as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(f"{namespace}/{key} does not exist.")
+            raise e
+
+        self._client.delete_object(Bucket=self.bucket, Key=self._key(namespace, key))
+
+    def scan(self, namespace: str, cursor: Optional[str] = None, limit: int = 1000) -> tuple[list[StoredObject], Optional[str]]:
+        arguments = {"Bucket": self.bucket, "Prefix": f"{namespace}/", "MaxKeys": limit}
+        if cursor is not None:
+            arguments["ContinuationToken"] = cursor
+
+        page = self._client.list_objects_v2(**arguments)
+        objects = [StoredObject(item["Key"].rsplit("/", 1)[-1], item["Size"], item["LastModified"].timestamp()) for item in page.get("Contents", [])]
+        return objects, page.get("NextContinuationToken") if page.get("IsTruncated") else None
+
+def create_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    if backend == "local":
+        return LocalStorage()
+    if backend == "s3":
+        return S3Storage()
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend}, use local or s3.")
+
+storage = create_storage()
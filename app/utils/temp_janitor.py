@@ -0,0 +1,222 @@
+__all__ = ["temp_janitor", "JanitorStats"]
+
+import time
+import heapq
+import threading
+from os import getenv
+from typing import Optional, Iterator
+from dataclasses import dataclass, asdict
+from redis import RedisError
+from app.utils.storage import storage, StorageNamespace, StoredObject, PARTIAL_WRITE_GRACE
+from app.utils.preview_staging import preview_staging, PREVIEW_STAGING_TTL
+from app.utils.logging import get_logger
+
+logger = get_logger()
+
+TEMP_JANITOR_INTERVAL = int(getenv("TEMP_JANITOR_INTERVAL", "600")) # seconds between two sweeps
+TEMP_JANITOR_BATCH = int(getenv("TEMP_JANITOR_BATCH", "500")) # files listed or deleted per batch
+TEMP_JANITOR_PAUSE = float(getenv("TEMP_JANITOR_PAUSE", "0.05")) # seconds between two batches
+TEMP_MAX_AGE = int(getenv("TEMP_MAX_AGE", str(PREVIEW_STAGING_TTL)))
+TEMP_MAX_BYTES = int(getenv("TEMP_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+EVICTION_TARGET = 0.9 # share of the budget the namespace is trimmed to
+
+LOCK_KEY = "janitor:temp:lock"
+STATS_KEY = "janitor:temp:stats"
+
+@dataclass
+class JanitorStats:
+    files_scanned: int = 0
+    files_expired: int = 0
+    files_evicted: int = 0
+    bytes_reclaimed: int = 0
+    bytes_remaining: int = 0
+    duration: float = 0.0
+
+class TempJanitor:
+    """
+    Removes abandoned previews from the temp namespace.
+    A sweep first deletes the previews whose staging expired and the leftovers of writes that never finished,
+    then lists the namespace in batches to catch files older than max_age the index does not know about, and finally
+    evicts the least recently written previews until the namespace fits its byte budget. Batches are separated by a pause so the sweep never saturates the disk.
+    """
+
+    def __init__(self, max_age: int = TEMP_MAX_AGE, max_bytes: int = TEMP_MAX_BYTES, batch_size: int = TEMP_JANITOR_BATCH, pause: float = TEMP_JANITOR_PAUSE, interval: int = TEMP_JANITOR_INTERVAL):
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.pause = pause
+        self.interval = interval
+        self.totals = JanitorStats()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _image_id(key: str) -> str:
+        return key.rsplit(".", 1)[0]
+
+    def _delete(self, key: str, size: int) -> bool:
+        try:
+            return storage.delete(StorageNamespace.TEMP, key)
+        except Exception as e:
+            logger.warning(f"Could not delete temporary file {key} ({size} bytes): {e}")
+            return False
+
+    def _expire_staged(self, stats: JanitorStats, now: float) -> None:
+        while True:
+            image_ids = preview_staging.pop_expired(self.batch_size, now)
+            for image_id in image_ids:
+                for key in (f"{image_id}.webp", f"{image_id}.emb"):
+                    stored = storage.stat(StorageNamespace.TEMP, key)
+                    if stored is not None and self._delete(key, stored.size):
+                        stats.files_expired += 1
+                        stats.bytes_reclaimed += stored.size
+
+            if len(image_ids) < self.batch_size:
+                return
+            time.sleep(self.pause)
+
+    def _purge_partial_writes(self, stats: JanitorStats, now: float) -> None:
+        for stored in storage.purge_partial_writes(StorageNamespace.TEMP, now - PARTIAL_WRITE_GRACE):
+            stats.files_expired += 1
+            stats.bytes_reclaimed += stored.size
+
+    def _objects(self) -> Iterator[StoredObject]:
+        """
+        Returns: every file of the temp namespace, listed in batches with a pause in between
+        """
+        cursor = None
+        while True:
+            objects, cursor = storage.scan(StorageNamespace.TEMP, cursor, self.batch_size)
+            yield from objects
+
+            if cursor is None:
+                return
+            time.sleep(self.pause)
+
+    def _scan(self, stats: JanitorStats, now: float) -> int:
+        """
+        Deletes the files older than max_age while streaming through the namespace.
+        Returns: bytes of the files that are young enough to stay
+        """
+        total = 0
+        for stored in self._objects():
+            stats.files_scanned += 1
+
+            if now - stored.modified > self.max_age:
+                if self._delete(stored.key, stored.size):
+                    stats.files_expired += 1
+                    stats.bytes_reclaimed += stored.size
+                continue
+
+            total += stored.size
+
+        return total
+
+    def _oldest(self, excess: int) -> list[StoredObject]:
+        """
+        Returns: the least recently written files that add up to at least excess bytes, oldest first
+        Only the files that have to go are held in memory, a newer file replaces the newest candidate once it is not needed anymore.
+        """
+        candidates: list[tuple[float, int, str]] = [] # max heap on the modification time
+        covered = 0
+
+        for stored in self._objects():
+            if covered >= excess and stored.modified >= -candidates[0][0]:
+                continue
+
+            heapq.heappush(candidates, (-stored.modified, stored.size, stored.key))
+            covered += stored.size
+            while covered - candidates[0][1] >= excess:
+                covered -= heapq.heappop(candidates)[1]
+
+        return [StoredObject(key, size, -modified) for modified, size, key in sorted(candidates, reverse=True)]
+
+    def _evict(self, stats: JanitorStats, total: int) -> None:
+        if total > self.max_bytes:
+            deleted = 0
+
+            for stored in self._oldest(total - int(self.max_bytes * EVICTION_TARGET)):
+                image_id = self._image_id(stored.key)
+                if stored.key.endswith(".webp"):
+                    # unregistered first, a promotion in the meantime then fails cleanly instead of missing its file
+                    preview_staging.discard(image_id)
+                    embedding = storage.stat(StorageNamespace.TEMP, f"{image_id}.emb")
+                    if embedding is not None and self._delete(embedding.key, embedding.size):
+                        stats.files_evicted += 1
+                        stats.bytes_reclaimed += embedding.size
+                        total -= embedding.size
+
+                if self._delete(stored.key, stored.size):
+                    stats.files_evicted += 1
+                    stats.bytes_reclaimed += stored.size
+                    total -= stored.size
+
+                deleted += 1
+                if deleted % self.batch_size == 0:
+                    time.sleep(self.pause)
+
+        stats.bytes_remaining = total
+
+    def sweep(self) -> JanitorStats:
+        """
+        Returns: what this sweep scanned and reclaimed
+        """
+        stats = JanitorStats()
+        started = time.monotonic()
+        now = time.time()
+
+        try:
+            self._expire_staged(stats, now)
+            self._purge_partial_writes(stats, now)
+            self._evict(stats, self._scan(stats, now))
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while sweeping temporary files: {e}")
+            raise e
+        finally:
+            stats.duration = time.monotonic() - started
+            self._record(stats)
+
+        return stats
+
+    def _record(self, stats: JanitorStats) -> None:
+        with self._lock:
+            for field, value in asdict(stats).items():
+                if field != "bytes_remaining":
+                    setattr(self.totals, field, getattr(self.totals, field) + value)
+            self.totals.bytes_remaining = stats.bytes_remaining
+
+        logger.info(f"Temp sweep: {stats.files_scanned} files scanned, {stats.files_expired} expired, {stats.files_evicted} evicted, {stats.bytes_reclaimed} bytes reclaimed, {stats.bytes_remaining} bytes remain ({stats.duration:.2f}s).")
+
+        # cluster wide counters, every node sweeps now and then
+        try:
+            pipe = preview_staging.redis.pipeline()
+            pipe.hincrby(STATS_KEY, "sweeps", 1)
+            pipe.hincrby(STATS_KEY, "files_expired", stats.files_expired)
+            pipe.hincrby(STATS_KEY, "files_evicted", stats.files_evicted)
+            pipe.hincrby(STATS_KEY, "bytes_reclaimed", stats.bytes_reclaimed)
+            pipe.hset(STATS_KEY, "bytes_remaining", stats.bytes_remaining)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Could not record the temp sweep metrics: {e}")
+
+    def sweep_if_due(self) -> Optional[JanitorStats]:
+        """
+        Returns: the stats of the sweep, None if another node swept within the interval
+        """
+        try:
+            if not preview_staging.redis.set(LOCK_KEY, 1, nx=True, ex=self.interval):
+                return None
+        except RedisError as e:
+            logger.warning(f"Temp janitor lock failed: {e}")
+            return None
+
+        return self.sweep()
+
+    def run(self, stopping: threading.Event) -> None:
+        while not stopping.is_set():
+            try:
+                self.sweep_if_due()
+            except Exception:
+                pass # already logged, the next interval tries again
+            stopping.wait(self.interval)
+
+temp_janitor = TempJanitor()
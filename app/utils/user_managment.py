@@ -1,11 +1,11 @@
 __all__ = ["user_manager"]
 
 import traceback
-import os
 from typing import Optional
 from app.utils.database import Database
 from app.utils.exceptions import PasswordMissingError, SignInNameMissingError, EmailInvalidError, PasswordTooShortError, UsernameTooLongError, EmailMissingError, UsernameTooShortError, UsernameMissingError, ProfilePictureInvalidError, EmailAlreadyInUseError, UsernameAlreadyInUseError, AuthCredentialsWrongError, UserNotFoundError
 from app.utils.helpers import helper
+from app.utils.storage import storage, StorageNamespace
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
 from mysql.connector.errors import IntegrityError
@@ -59,7 +59,7 @@ class UserManager:
         if len(password) < 8:
             raise PasswordTooShortError("Password must be at least 8 characters long.")
 
-        if profile_picture is not None and profile_picture not in os.listdir("app/static/profile_pictures/default/"):
+        if profile_picture is not None and storage.stat(StorageNamespace.DEFAULT_PROFILE_PICTURES, profile_picture) is None:
             raise ProfilePictureInvalidError("Profile picture must be from the default options.")
         
         hashed_password = PasswordHasher().hash(password)
@@ -170,7 +170,7 @@ class UserManager:
     """
                 
     def getUserProfilePicture(self, userID: str) -> str:
-        if not path.exists(f"static/profile_pictures/{userID}.webp"):
+        if storage.stat(StorageNamespace.PROFILE_PICTURES, f"{userID}.webp") is None:
             with Database.getConnection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("SELECT profile_picture FROM users WHERE user_id = %s;", (userID, ))
@@ -194,7 +194,9 @@ class UserManager:
         try:
             image = Image.open(file.stream)
             image.thumbnail((300, 300))
-            image.save(f"app/static/profile_pictures/{userID}.webp", optimize=True, quality=95, format="webp")
+            webp = BytesIO()
+            image.save(webp, optimize=True, quality=95, format="webp")
+            storage.put(StorageNamespace.PROFILE_PICTURES, f"{userID}.webp", webp.getvalue())
             
             with Database.getConnection() as conn:
                 cursor = conn.cursor()
@@ -210,8 +212,9 @@ class UserManager:
     def setDefaultProfilePicture(self, profilePicture: str, token: str) -> User:
         userID = authentication_manager.retrieveUserIDByToken(token)
         
-        if profilePicture not in os.listdir("app/static/profile_pictures/default/"):
-            raise UserProfilePictureNotFoundError("The provided profile picture is available. Please choose one of the following: " + ", ".join(os.listdir("app/static/profile_pictures/default/")))
+        if storage.stat(StorageNamespace.DEFAULT_PROFILE_PICTURES, profilePicture) is None:
+            defaults, _ = storage.scan(StorageNamespace.DEFAULT_PROFILE_PICTURES)
+            raise UserProfilePictureNotFoundError("The provided profile picture is available. Please choose one of the following: " + ", ".join(stored.key for stored in defaults))
         
         with Database.getConnection() as conn:
             cursor = conn.cursor()
@@ -224,13 +227,11 @@ class UserManager:
         try:
             userID = authentication_manager.retrieveUserIDByToken(token)
             
-            if not path.exists(f"app/static/profile_pictures/{userID}.webp"):
+            if not storage.delete(StorageNamespace.PROFILE_PICTURES, f"{userID}.webp"):
                 raise UserProfilePictureNotFoundError("The user profile picture is not set.")
-        
-            remove(f"app/static/profile_pictures/{userID}.webp")
             
-            profilePictures = os.listdir("app/static/profile_pictures/default/")
-            profilePicture = f"/public/profile_pictures/default/{random.choice(profilePictures)}"
+            profilePictures, _ = storage.scan(StorageNamespace.DEFAULT_PROFILE_PICTURES)
+            profilePicture = f"/public/profile_pictures/default/{random.choice(profilePictures).key}"
             
             with Database.getConnection() as conn:
                 cursor = conn.cursor()
@@ -246,7 +247,7 @@ class UserManager:
     def getMyProfilePicture(self, token: str) -> str:
         userID = authentication_manager.retrieveUserIDByToken(token)
         
-        if not path.exists(f"app/static/profile_pictures/{userID}.webp"):
+        if storage.stat(StorageNamespace.PROFILE_PICTURES, f"{userID}.webp") is None:
             with Database.getConnection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("SELECT profile_picture FROM users WHERE user_id = %s;", (userID, ))
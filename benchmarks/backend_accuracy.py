@@ -0,0 +1,94 @@
+"""
+Accuracy and latency check of the ONNX Runtime backend against the torch models.
+Every fixture is run through both backends, the u2net masks are compared by mean absolute
+difference and IoU, the FashionCLIP embeddings by cosine similarity and predicted category.
+Exits with status 1 when a fixture falls outside the tolerances.
+
+Usage: python -m benchmarks.backend_accuracy path/to/images/ [--quantize] [--min-iou 0.95] [--min-cosine 0.99]
+"""
+
+import os
+import sys
+import time
+import hashlib
+import argparse
+import numpy as np
+import torch
+from backgroundremover.u2net import detect
+from fashion_clip.fashion_clip import FashionCLIP
+from app.utils.inference_backends import TorchBackend, OnnxBackend
+from app.utils.label_embeddings import label_bank, MODEL_CACHE_DIR
+from app.utils.segmentation_engine import SegmentationEngine
+from app.utils.model_managment import FASHION_CLIP_MODEL, INFERENCE_THREADS
+from benchmarks.batching_throughput import load_fixtures
+
+def normalize(prediction: np.ndarray) -> np.ndarray:
+    minimum = prediction.min(axis=(1, 2), keepdims=True)
+    maximum = prediction.max(axis=(1, 2), keepdims=True)
+    return (prediction - minimum) / (maximum - minimum)
+
+def timed(fn, *args) -> tuple[np.ndarray, float]:
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("fixtures")
+    parser.add_argument("--quantize", action="store_true")
+    parser.add_argument("--min-iou", type=float, default=0.95)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    args = parser.parse_args()
+
+    images = load_fixtures(args.fixtures)
+    torch.set_num_threads(INFERENCE_THREADS)
+
+    # the torch reference is loaded here instead of through the model_manager, which releases it when INFERENCE_BACKEND=onnx
+    fclip = FashionCLIP(FASHION_CLIP_MODEL)
+    fclip.model.eval()
+    segmentation = SegmentationEngine()
+    torch_backend = TorchBackend(segmentation_net=segmentation.load(), clip_model=fclip.model, device=fclip.device)
+    label_bank.load(fclip)
+
+    model_version = hashlib.sha256(f"{fclip.model_hash}-{segmentation.model_name}".encode()).hexdigest()
+    onnx_backend = OnnxBackend(os.path.join(MODEL_CACHE_DIR, "onnx"), model_version, quantize=args.quantize, num_threads=INFERENCE_THREADS)
+    onnx_backend.export(torch_backend)
+
+    failures = 0
+    timings = {"torch": [], "onnx": []}
+
+    for index, image in enumerate(images):
+        segmentation_inputs = detect.preprocess(np.asarray(image))["image"].numpy()[None].astype(np.float32)
+        pixel_values = fclip.preprocess(images=[image], return_tensors="np")["pixel_values"].astype(np.float32)
+
+        torch_mask, torch_mask_ms = timed(torch_backend.segment, segmentation_inputs)
+        onnx_mask, onnx_mask_ms = timed(onnx_backend.segment, segmentation_inputs)
+        torch_emb, torch_emb_ms = timed(torch_backend.encode_images, pixel_values)
+        onnx_emb, onnx_emb_ms = timed(onnx_backend.encode_images, pixel_values)
+
+        timings["torch"].append(torch_mask_ms + torch_emb_ms)
+        timings["onnx"].append(onnx_mask_ms + onnx_emb_ms)
+
+        torch_mask, onnx_mask = normalize(torch_mask)[0], normalize(onnx_mask)[0]
+        mask_mad = float(np.abs(torch_mask - onnx_mask).mean())
+        intersection = np.logical_and(torch_mask > 0.5, onnx_mask > 0.5).sum()
+        union = np.logical_or(torch_mask > 0.5, onnx_mask > 0.5).sum()
+        iou = float(intersection / union) if union else 1.0
+
+        cosine = float((torch_emb[0] @ onnx_emb[0]) / (np.linalg.norm(torch_emb[0]) * np.linalg.norm(onnx_emb[0])))
+        same_category = label_bank.classify(torch_emb[0])["category"] == label_bank.classify(onnx_emb[0])["category"]
+
+        failed = iou < args.min_iou or cosine < args.min_cosine or not same_category
+        failures += failed
+
+        print(f"#{index:<3} mask mad {mask_mad:.4f}  iou {iou:.4f}  cosine {cosine:.5f}  category {'same' if same_category else 'DIFFERENT'}{'  FAILED' if failed else ''}")
+
+    for name, values in timings.items():
+        print(f"{name:<5} mean {np.mean(values):8.2f}ms  p95 {np.percentile(values, 95):8.2f}ms")
+
+    if failures:
+        print(f"{failures} of {len(images)} fixtures outside the tolerances.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Load benchmark for the micro batchers in front of u2net and FashionCLIP.
+Concurrent clients submit images through a MicroBatcher capped at batch sizes 1, 4 and 8
+and the throughput in images/sec is reported for each model.
+
+Usage: python -m benchmarks.batching_throughput path/to/images/ [--clients 8] [--images 64]
+"""
+
+import os
+import time
+import argparse
+import threading
+from PIL import Image
+from app.utils.batching import MicroBatcher
+from app.utils.model_managment import model_manager
+from app.utils.image_managment import image_manager
+
+BATCH_SIZES = (1, 4, 8)
+
+def load_fixtures(path: str) -> list[Image.Image]:
+    if os.path.isfile(path):
+        files = [path]
+    else:
+        files = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.lower().endswith((".png", ".jpg", ".jpeg", ".webp"))]
+
+    return [Image.open(file).convert("RGB") for file in files]
+
+def run_load(batcher: MicroBatcher, images: list[Image.Image], clients: int, total: int) -> float:
+    """
+    Returns: images/sec
+    """
+    counter = iter(range(total))
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            batcher(images[index % len(images)])
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return total / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("fixtures")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    images = load_fixtures(args.fixtures)
+    model_manager.load()
+
+    models = {
+        "u2net": model_manager.segmentation.predict_masks,
+        "fashion-clip": image_manager._encode_images,
+    }
+
+    for name, batch_fn in models.items():
+        # warm up so the first measured batch size does not pay for lazy initialization
+        batch_fn(images[:1])
+
+        for batch_size in BATCH_SIZES:
+            batcher = MicroBatcher(name, batch_fn, max_batch_size=batch_size, max_wait_ms=args.max_wait_ms)
+            throughput = run_load(batcher, images, args.clients, args.images)
+            print(f"{name:<13} batch {batch_size}: {throughput:7.2f} images/sec")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Times the perceptual hash of a working resolution cutout and the duplicate lookup
+in a wardrobe of random hashes, both have to stay well below a millisecond.
+
+Usage: python -m benchmarks.duplicate_lookup [--items 100 1000 10000] [--runs 1000]
+"""
+
+import time
+import random
+import argparse
+import statistics
+import tempfile
+import numpy as np
+from PIL import Image
+from app.utils.duplicate_index import DuplicateIndex
+
+def timed(fn, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--runs", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    cutout = Image.fromarray(rng.integers(0, 255, (1024, 800, 4), dtype=np.uint8), "RGBA")
+    print(f"dhash 800x1024 RGBA  median {timed(lambda: DuplicateIndex.dhash(cutout), args.runs):.3f}ms")
+
+    for items in args.items:
+        index = DuplicateIndex(tempfile.mkdtemp())
+        # written in one go, put() rewrites the shard on every call
+        with index._file_lock("benchmark"):
+            index._write("benchmark", {f"clothing-{i}": random.getrandbits(64) for i in range(items)})
+        query = random.getrandbits(64)
+        index.lookup("benchmark", query) # builds the bucket tables
+
+        print(f"lookup {items:>6} items  median {timed(lambda: index.lookup('benchmark', query), args.runs):.3f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Times every image kernel compiled with numba against its NumPy fallback and the PIL call it replaced.
+Inputs are sized like production: a 1024px cutout, the 64x64 palette sample and the 320px segmentation mask.
+
+Usage: python -m benchmarks.image_kernels [--runs 200]
+"""
+
+import time
+import argparse
+import statistics
+import numpy as np
+from PIL import Image
+from app.utils.kernels import ImageKernels
+from app.utils.color_palette import SRGB_TO_LINEAR, RGB_TO_XYZ, L_BIN_SIZE, L_BINS, AB_BIN_SIZE, AB_BINS, MIN_ALPHA
+
+def timed(fn, runs: int) -> float:
+    fn() # warm up, compiles the numba kernels
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def garment(size: tuple[int, int], rng: np.random.Generator) -> np.ndarray:
+    """
+    Returns: (H, W, 4) uint8 noise with an elliptic opaque garment and a transparent background
+    """
+    height, width = size
+    y, x = np.ogrid[:height, :width]
+    inside = ((x - width / 2) / (width * 0.35)) ** 2 + ((y - height / 2) / (height * 0.4)) ** 2 < 1
+    pixels = rng.integers(0, 256, (height, width, 4), dtype=np.uint8)
+    pixels[..., 3] = np.where(inside, 255, 0)
+    return pixels
+
+def report(name: str, timings: dict[str, float]):
+    baseline = timings["numpy"]
+    print(f"{name:<16}" + "  ".join(f"{label} {ms:7.3f}ms ({baseline / ms:5.1f}x)" for label, ms in timings.items()))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    jit, fallback = ImageKernels(jit=True), ImageKernels(jit=False)
+    if not jit.jit:
+        print("numba is not installed, only the NumPy fallback can be timed.")
+        return
+
+    # alpha bbox of a segmentation mask, replaces mask.point(threshold).getbbox()
+    mask = Image.fromarray(garment((320, 320), rng)[..., 3])
+    mask_array = np.asarray(mask)
+    report("alpha_bbox", {
+        "numpy": timed(lambda: fallback.alpha_bbox(mask_array, 10), args.runs),
+        "numba": timed(lambda: jit.alpha_bbox(mask_array, 10), args.runs),
+        "pil": timed(lambda: mask.point(lambda value: 255 if value > 10 else 0).getbbox(), args.runs),
+    })
+
+    # alpha thresholding + Lab quantization of the palette sample
+    pixels = garment((64, 64), rng).reshape(-1, 4)
+    bin_count = L_BINS * AB_BINS * AB_BINS
+    buffers = lambda: (np.zeros(bin_count), np.zeros((bin_count, 3)), np.zeros((bin_count, 3)))
+    report("lab_histogram", {
+        "numpy": timed(lambda: fallback.lab_histogram(pixels, MIN_ALPHA, SRGB_TO_LINEAR, RGB_TO_XYZ, L_BIN_SIZE, L_BINS, AB_BIN_SIZE, AB_BINS, *buffers()), args.runs),
+        "numba": timed(lambda: jit.lab_histogram(pixels, MIN_ALPHA, SRGB_TO_LINEAR, RGB_TO_XYZ, L_BIN_SIZE, L_BINS, AB_BIN_SIZE, AB_BINS, *buffers()), args.runs),
+    })
+
+    # one garment drawn onto the outfit canvas
+    canvas = garment((1024, 1024), rng)
+    item = garment((600, 450), rng)
+    canvas_image, item_image = Image.fromarray(canvas, "RGBA"), Image.fromarray(item, "RGBA")
+    report("composite_over", {
+        "numpy": timed(lambda: fallback.composite_over(canvas.copy(), item, 300, 200), args.runs),
+        "numba": timed(lambda: jit.composite_over(canvas.copy(), item, 300, 200), args.runs),
+        "pil paste": timed(lambda: canvas_image.copy().paste(item_image, (300, 200), item_image), args.runs),
+    })
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Times the outfit ranking on synthetic wardrobes of growing size.
+Items get random normalized embeddings, colors and context fits, the database and the
+embedding store are left out so only the scoring itself is measured.
+
+Usage: python -m benchmarks.outfit_suggestions [--sizes 50 500 5000] [--runs 20]
+"""
+
+import time
+import argparse
+import statistics
+import numpy as np
+from app.utils.outfit_suggestions import outfit_suggestion_engine, SUGGESTION_CATEGORIES
+
+EMBEDDING_DIM = 512
+
+def synthetic_wardrobe(size: int, rng: np.random.Generator):
+    categories = rng.integers(0, len(SUGGESTION_CATEGORIES), size)
+    embeddings = rng.standard_normal((size, EMBEDDING_DIM)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    colors = outfit_suggestion_engine.hex_to_lab([f"#{value:06x}" for value in rng.integers(0, 0xFFFFFF, size)])
+    context = rng.choice(np.array([0.0, 0.5, 1.0], dtype=np.float32), size)
+    return categories, embeddings, colors, context
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 5000])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for size in args.sizes:
+        wardrobe = synthetic_wardrobe(size, rng)
+        outfit_suggestion_engine.rank(*wardrobe, args.limit) # warm up
+
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            outfit_suggestion_engine.rank(*wardrobe, args.limit)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        print(f"{size:>6} items  median {statistics.median(timings):7.2f}ms  p95 {sorted(timings)[int(len(timings) * 0.95) - 1]:7.2f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Compares full frame background removal with the two pass ROI mode on a fixture set.
+Both cutouts are composited onto the full frame and compared by alpha IoU, next to the
+timings and the share of the frame the ROI crop covered.
+
+Usage: python -m benchmarks.roi_segmentation path/to/images/ [--quality best] [--runs 3]
+"""
+
+import time
+import argparse
+import statistics
+import numpy as np
+from PIL import Image
+from app.utils.image_ingest import image_ingest
+from app.utils.model_managment import model_manager
+from app.utils.preview_quality import quality_policy, PreviewQuality
+from benchmarks.batching_throughput import load_fixtures
+
+def timed(fn, runs: int):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(timings)
+
+def alpha_iou(first: np.ndarray, second: np.ndarray) -> float:
+    first, second = first > 128, second > 128
+    union = np.logical_or(first, second).sum()
+    return float(np.logical_and(first, second).sum() / union) if union else 1.0
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("fixtures")
+    parser.add_argument("--quality", default=PreviewQuality.BEST.value, choices=[PreviewQuality.BALANCED.value, PreviewQuality.BEST.value])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    # fixtures go through the same ingest as uploads, so the working resolution matches production
+    images = []
+    for image in load_fixtures(args.fixtures):
+        image.thumbnail((image_ingest.working_size, image_ingest.working_size), Image.BILINEAR)
+        images.append(image)
+
+    settings = {key: value for key, value in quality_policy.settings(PreviewQuality(args.quality)).items() if key != "roi"}
+    segmentation = model_manager.segmentation
+    segmentation.segment(images[0], **settings) # warm up
+
+    full_timings, roi_timings = [], []
+    for index, image in enumerate(images):
+        full_cutout, full_ms = timed(lambda: segmentation.segment(image, **settings), args.runs)
+        (roi_cutout, box), roi_ms = timed(lambda: segmentation.segment_roi(image, **settings), args.runs)
+
+        canvas = Image.new("RGBA", image.size)
+        canvas.paste(roi_cutout, box[:2])
+        iou = alpha_iou(np.asarray(full_cutout.getchannel("A")), np.asarray(canvas.getchannel("A")))
+        coverage = (box[2] - box[0]) * (box[3] - box[1]) / (image.width * image.height)
+
+        full_timings.append(full_ms)
+        roi_timings.append(roi_ms)
+        print(f"#{index:<3} {image.width}x{image.height}  full {full_ms:8.1f}ms  roi {roi_ms:8.1f}ms  crop {coverage:6.1%}  alpha iou {iou:.4f}")
+
+    print(f"full frame mean {statistics.mean(full_timings):8.1f}ms")
+    print(f"roi        mean {statistics.mean(roi_timings):8.1f}ms  ({statistics.mean(full_timings) / statistics.mean(roi_timings):.2f}x)")
+
+if __name__ == "__main__":
+    main()
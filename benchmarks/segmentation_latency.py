@@ -0,0 +1,65 @@
+"""
+Compares the latency of backgroundremover's bg.remove (model loaded on every call)
+with the resident segmentation engine.
+
+Usage: python -m benchmarks.segmentation_latency path/to/image.jpg [--runs 10]
+"""
+
+import argparse
+import time
+import statistics
+from io import BytesIO
+from PIL import Image
+from backgroundremover import bg
+from app.utils.model_managment import model_manager
+
+MATTING_ARGS = {
+    "foreground_threshold": 200,
+    "background_threshold": 10,
+    "erode_structure_size": 13,
+    "base_size": 512,
+}
+
+def time_runs(fn, runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def report(name: str, timings: list[float]) -> None:
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<12} mean {statistics.mean(timings):8.1f} ms | p50 {statistics.median(timings):8.1f} ms | p95 {p95:8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("image")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    image = Image.open(args.image).convert("RGB")
+    png = BytesIO()
+    image.save(png, format="PNG")
+    data = png.getvalue()
+
+    def before():
+        bg.remove(data, model_name="u2net_cloth_segm",
+                  alpha_matting=True,
+                  alpha_matting_foreground_threshold=MATTING_ARGS["foreground_threshold"],
+                  alpha_matting_background_threshold=MATTING_ARGS["background_threshold"],
+                  alpha_matting_erode_structure_size=MATTING_ARGS["erode_structure_size"],
+                  alpha_matting_base_size=MATTING_ARGS["base_size"])
+
+    def after():
+        model_manager.segmentation.segment(image, alpha_matting=True, **MATTING_ARGS)
+
+    # warm up the resident model so only steady-state latency is measured
+    model_manager.load()
+
+    report("bg.remove", time_runs(before, args.runs))
+    report("resident", time_runs(after, args.runs))
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,50 @@
 import os
+import sys
+import subprocess
 import multiprocessing
+from dotenv import load_dotenv
 
+load_dotenv()
 os.makedirs("logs", exist_ok=True)
 
-preload_app = False # set to false because causes artifacts on background removal
+def worker_count() -> int:
+    cpus = multiprocessing.cpu_count()
+
+    # the API tier only waits on redis and MySQL when the models run in inference_worker.py
+    if os.getenv("INFERENCE_QUEUE_ENABLED", "False").lower() == "true":
+        return cpus * 2 + 1
+
+    # inline inference is CPU bound, every worker runs INFERENCE_THREADS torch threads of its own
+    return max(1, cpus // int(os.getenv("INFERENCE_THREADS", "2")))
+
+preload_app = True # models are loaded once in the master and shared copy-on-write, see when_ready / post_fork
 bind = "0.0.0.0:8000"
-workers = 1 #multiprocessing.cpu_count() * 2 + 1
+workers = worker_count()
 errorlog = os.path.join(os.path.dirname(__file__), "logs", "gunicorn_error.log")
 accesslog = os.path.join(os.path.dirname(__file__), "logs", "gunicorn_access.log")
-loglevel = "info"
\ No newline at end of file
+loglevel = "info"
+
+def when_ready(server):
+    from app.utils.inference_queue import inference_queue
+    from app.utils.model_managment import model_manager
+
+    # with the inference queue enabled the API tier never runs the models
+    if server.cfg.preload_app and not inference_queue.enabled:
+        model_manager.preload()
+
+    # a process of its own (temp_janitor.py) instead of a thread in the master or a worker,
+    # the redis lock keeps the janitors of several nodes from sweeping at once
+    if os.getenv("TEMP_JANITOR_ENABLED", "True").lower() == "true":
+        server.temp_janitor = subprocess.Popen([sys.executable, "temp_janitor.py"], cwd=os.path.dirname(os.path.abspath(__file__)))
+
+def on_exit(server):
+    janitor = getattr(server, "temp_janitor", None)
+    if janitor is not None:
+        janitor.terminate()
+
+def post_fork(server, worker):
+    from app.utils.database import Database
+    from app.utils.model_managment import model_manager
+
+    Database.reset_pool()
+    model_manager.after_fork()
@@ -0,0 +1,25 @@
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.utils.logging import get_logger
+from app.utils.image_gc import image_gc, REFERENCES
+
+logger = get_logger()
+
+def main():
+    parser = argparse.ArgumentParser(description="Deletes stored clothing images and outfit collages no clothing or outfit references anymore.")
+    parser.add_argument("--dry-run", action="store_true", help="only report the garbage and the bytes it would free")
+    parser.add_argument("--namespace", choices=list(REFERENCES), help="collect a single namespace instead of all of them")
+    args = parser.parse_args()
+
+    if args.namespace:
+        reports = [image_gc.collect(args.namespace, args.dry_run)]
+    else:
+        reports = image_gc.collect_all(args.dry_run)
+
+    logger.info(f"-- 🗑️ Image GC finished, {sum(report.bytes_reclaimable for report in reports)} bytes reclaimable, {sum(report.bytes_reclaimed for report in reports)} bytes reclaimed --")
+
+if __name__ == "__main__":
+    main()
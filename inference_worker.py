@@ -0,0 +1,147 @@
+import os
+import signal
+import socket
+import traceback
+import threading
+import multiprocessing
+from dotenv import load_dotenv
+from redis import RedisError
+
+load_dotenv()
+
+from app.utils.logging import get_logger
+from app.utils.inference_queue import inference_queue
+from app.utils.image_managment import image_manager
+from app.utils.model_managment import model_manager
+from app.utils.preview_quality import quality_policy, PreviewQuality
+from app.utils.exceptions import ImageUnclearError, FileTooLargeError, ValidationError
+
+logger = get_logger()
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+INFERENCE_WORKER_THREADS = int(os.getenv("INFERENCE_WORKER_THREADS", "4"))
+INFERENCE_HEARTBEAT_INTERVAL = int(os.getenv("INFERENCE_HEARTBEAT_INTERVAL", "10"))
+INFERENCE_DEQUEUE_BACKOFF = 1 # seconds a consumer thread waits after redis failed
+
+def process_jobs(consumer: str, stopping: threading.Event):
+    while not stopping.is_set():
+        try:
+            item = inference_queue.next_job(consumer, timeout=5)
+        except RedisError as e:
+            # the thread has to outlive redis hiccups, the heartbeat keeps its jobs from being requeued meanwhile
+            logger.warning(f"Could not take a preview job from the queue: {e}")
+            stopping.wait(INFERENCE_DEQUEUE_BACKOFF)
+            continue
+
+        if item is None:
+            continue
+
+        try:
+            process_job(consumer, *item)
+        except RedisError as e:
+            # the job stays in the processing list and is requeued once this worker stops
+            logger.error(f"Could not finish preview job {item[0]}: {e}")
+            stopping.wait(INFERENCE_DEQUEUE_BACKOFF)
+
+def process_job(consumer: str, job_id: str, job: dict, payload: bytes):
+    try:
+        # the tier is resolved when the job runs, the remaining backlog decides whether it has to be cheaper
+        quality = quality_policy.resolve(quality_policy.parse(job.get("quality")), inference_queue.depth())
+
+        if job["stream"]:
+            result = stream_preview(job_id, payload, quality, job["user_id"])
+        else:
+            result = image_manager.process_image_preview_data(payload, job["user_id"], quality)
+    except FileTooLargeError as e:
+        fail_job(job_id, job, str(e), 413)
+    except ImageUnclearError as e:
+        fail_job(job_id, job, str(e), 422)
+    except ValidationError as e:
+        fail_job(job_id, job, str(e), 400)
+    except Exception as e:
+        logger.error(f"An unexpected error occurred while processing preview job {job_id}: {e}")
+        logger.error(traceback.format_exc())
+        fail_job(job_id, job, "An unexpected error occurred.", 500)
+    else:
+        inference_queue.complete(job_id, result)
+        logger.debug(f"Preview job {job_id} finished.")
+    finally:
+        inference_queue.ack(consumer, job_id)
+
+def stream_preview(job_id: str, payload: bytes, quality: PreviewQuality, user_id: str) -> dict:
+    """
+    Returns: the final result, every stage before it is published to the client right away
+    """
+    for stage, stage_payload in image_manager.stream_image_preview_data(payload, user_id, quality):
+        inference_queue.publish_event(job_id, stage, stage_payload)
+
+    return stage_payload
+
+def fail_job(job_id: str, job: dict, message: str, status_code: int):
+    inference_queue.fail(job_id, message, status_code)
+
+    if job["stream"]:
+        inference_queue.publish_event(job_id, "error", {"error": message, "status_code": status_code})
+
+def send_heartbeats(consumer: str, stopping: threading.Event):
+    while not stopping.wait(INFERENCE_HEARTBEAT_INTERVAL):
+        try:
+            inference_queue.heartbeat(consumer)
+        except Exception as e:
+            logger.warning(f"Could not send the heartbeat of inference worker {consumer}: {e}")
+
+def run_worker(worker_index: int):
+    model_manager.after_fork()
+
+    # jobs taken by this process stay in its processing list until they are acknowledged
+    consumer = f"{socket.gethostname()}:{os.getpid()}"
+    inference_queue.heartbeat(consumer)
+
+    # several jobs in flight per process let the micro batchers group their model calls
+    stopping = threading.Event()
+    threads = [threading.Thread(target=process_jobs, args=(consumer, stopping), name=f"inference-{worker_index}-{index}") for index in range(INFERENCE_WORKER_THREADS)]
+    heartbeat = threading.Thread(target=send_heartbeats, args=(consumer, stopping), name=f"inference-{worker_index}-heartbeat", daemon=True)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    heartbeat.start()
+    for thread in threads:
+        thread.start()
+    logger.info(f"Inference worker {worker_index} started ({INFERENCE_WORKER_THREADS} threads).")
+
+    for thread in threads:
+        thread.join()
+    inference_queue.unregister(consumer)
+    logger.info(f"Inference worker {worker_index} stopped.")
+
+def main():
+    # weights are loaded once here and shared copy-on-write with the forked workers
+    model_manager.preload()
+
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=run_worker, args=(index,), name=f"inference-{index}") for index in range(INFERENCE_WORKERS)]
+
+    def stop(signum, frame):
+        for process in processes:
+            process.terminate()
+
+    for process in processes:
+        process.start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info(f"-- 🧠 Started {INFERENCE_WORKERS} inference workers --")
+
+    # jobs of workers that crashed here or on another node go back onto the queue
+    while any(process.is_alive() for process in processes):
+        try:
+            inference_queue.requeue_stale()
+        except Exception as e:
+            logger.warning(f"Could not requeue the jobs of dead inference workers: {e}")
+
+        for process in processes:
+            process.join(timeout=INFERENCE_HEARTBEAT_INTERVAL / len(processes))
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,7 @@ from app.utils.authentication_managment import authentication_manager
 from app.utils.user_managment import user_manager
 from app.utils.clothing_managment import clothing_manager
 from app.utils.outfit_managment import outfit_manager
+from app.utils.image_store import image_store
 from app.main.routes import api as main
 from app.auth.routes import auth
 from app.users.routes import users
@@ -82,6 +83,7 @@ def initialize_database():
     authentication_manager.ensure_table_exists()
     clothing_manager.ensure_table_exists()
     outfit_manager.ensure_table_exists()
+    image_store.ensure_table_exists()
 
     logger.debug("Database initialized successfully.")
 
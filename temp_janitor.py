@@ -0,0 +1,30 @@
+import signal
+import argparse
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.utils.logging import get_logger
+from app.utils.temp_janitor import temp_janitor
+
+logger = get_logger()
+
+def main():
+    parser = argparse.ArgumentParser(description="Removes expired and over budget previews from the temp storage.")
+    parser.add_argument("--once", action="store_true", help="run a single sweep and exit, regardless of other nodes")
+    args = parser.parse_args()
+
+    if args.once:
+        temp_janitor.sweep()
+        return
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    logger.info(f"-- 🧹 Started temp janitor (every {temp_janitor.interval}s) --")
+    temp_janitor.run(stopping)
+
+if __name__ == "__main__":
+    main()
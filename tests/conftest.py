@@ -0,0 +1,8 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# the rate limiter would otherwise connect to redis on import
+os.environ.setdefault("RATELIMITER_ENABLED", "False")
+os.environ.setdefault("STORAGE_BACKEND", "local")
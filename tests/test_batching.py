@@ -0,0 +1,94 @@
+import os
+import threading
+import multiprocessing
+import pytest
+from app.utils.batching import MicroBatcher
+
+class Recorder:
+    """
+    Doubles every item and remembers the batches it was called with.
+    """
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, items: list) -> list:
+        self.batches.append(list(items))
+        return [item * 2 for item in items]
+
+def test_every_caller_gets_its_own_result():
+    recorder = Recorder()
+    batcher = MicroBatcher("test", recorder, max_batch_size=4, max_wait_ms=20)
+    results = {}
+    start = threading.Barrier(16)
+
+    def call(item: int):
+        start.wait()
+        results[item] = batcher(item)
+
+    threads = [threading.Thread(target=call, args=(item,)) for item in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {item: item * 2 for item in range(16)}
+    assert sorted(item for batch in recorder.batches for item in batch) == list(range(16))
+    assert max(len(batch) for batch in recorder.batches) <= 4
+    # concurrent calls share forward passes
+    assert len(recorder.batches) < 16
+
+def test_submit_keeps_the_order_of_a_batch():
+    recorder = Recorder()
+    batcher = MicroBatcher("test", recorder, max_batch_size=8, max_wait_ms=50)
+
+    futures = [batcher.submit(item) for item in range(8)]
+
+    assert [future.result(timeout=5) for future in futures] == [item * 2 for item in range(8)]
+    assert recorder.batches == [list(range(8))]
+
+def test_a_failed_batch_fails_its_callers_and_the_next_batch_runs():
+    calls = []
+
+    def batch_fn(items: list) -> list:
+        calls.append(items)
+        if len(calls) == 1:
+            raise RuntimeError("model failed")
+        return items
+
+    batcher = MicroBatcher("test", batch_fn, max_batch_size=2, max_wait_ms=1)
+
+    with pytest.raises(RuntimeError):
+        batcher(1)
+    assert batcher(2) == 2
+
+def test_a_batch_with_the_wrong_number_of_results_fails():
+    batcher = MicroBatcher("test", lambda items: items[:-1], max_batch_size=2, max_wait_ms=1)
+
+    with pytest.raises(ValueError):
+        batcher(1)
+
+def test_batch_size_one_runs_in_the_caller():
+    recorder = Recorder()
+    batcher = MicroBatcher("test", recorder, max_batch_size=1)
+
+    assert batcher(3) == 6
+    assert batcher._thread is None
+
+def call_in_child(batcher: MicroBatcher, results):
+    results.put((batcher(21), batcher._pid == os.getpid()))
+
+def test_the_batch_thread_is_restarted_after_fork():
+    batcher = MicroBatcher("test", Recorder(), max_batch_size=4, max_wait_ms=1)
+    assert batcher(1) == 2
+
+    # the parent's batch thread does not exist in the child, the first call there starts a new one
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    child = context.Process(target=call_in_child, args=(batcher, results))
+    child.start()
+    child.join(timeout=10)
+
+    assert child.exitcode == 0
+    assert results.get(timeout=1) == (42, True)
+    assert batcher(2) == 4
@@ -0,0 +1,67 @@
+import random
+import numpy as np
+import pytest
+from PIL import Image
+from app.utils.duplicate_index import DuplicateIndex, DUPLICATE_MAX_DISTANCE
+
+USER_ID = "user-a"
+
+def flip(value: int, bits: int, rng: random.Random) -> int:
+    for bit in rng.sample(range(64), bits):
+        value ^= 1 << bit
+    return value
+
+@pytest.fixture
+def index(tmp_path):
+    return DuplicateIndex(str(tmp_path))
+
+def test_lookup_finds_every_hash_within_the_max_distance(index):
+    rng = random.Random(0)
+    query = rng.getrandbits(64)
+    hashes = {f"near-{distance}-{copy}": flip(query, distance, rng) for distance in range(DUPLICATE_MAX_DISTANCE + 1) for copy in range(20)}
+    hashes.update({f"far-{copy}": flip(query, DUPLICATE_MAX_DISTANCE + 1 + copy % 8, rng) for copy in range(50)})
+    hashes.update({f"random-{copy}": rng.getrandbits(64) for copy in range(500)})
+    with index._file_lock(USER_ID):
+        index._write(USER_ID, hashes)
+
+    matches = index.lookup(USER_ID, query)
+
+    # the multi-index lookup has to agree with a scan of the whole wardrobe
+    expected = {clothing_id for clothing_id, value in hashes.items() if (value ^ query).bit_count() <= DUPLICATE_MAX_DISTANCE}
+    assert {clothing_id for clothing_id, _ in matches} == expected
+    assert all(f"near-{distance}-{copy}" in expected for distance in range(DUPLICATE_MAX_DISTANCE + 1) for copy in range(20))
+    assert [distance for _, distance in matches] == sorted(distance for _, distance in matches)
+
+def test_lookup_respects_a_tighter_distance_and_exclude(index):
+    index.put(USER_ID, "same", 0)
+    index.put(USER_ID, "close", 0b11)
+    index.put(USER_ID, "edge", 0b1111)
+
+    assert index.lookup(USER_ID, 0, max_distance=2) == [("same", 0), ("close", 2)]
+    assert index.lookup(USER_ID, 0, max_distance=2, exclude="same") == [("close", 2)]
+    assert index.lookup("user-b", 0) == []
+
+def test_delete_updates_the_loaded_tables(index):
+    index.put(USER_ID, "item", 42)
+    assert index.lookup(USER_ID, 42) == [("item", 0)]
+
+    index.delete(USER_ID, "item")
+
+    assert index.lookup(USER_ID, 42) == []
+
+def test_dhash_is_stable_across_sizes_and_transparency():
+    # one flat block per hash cell, so every bit is decided by a clear difference
+    rng = np.random.default_rng(0)
+    blocks = rng.integers(0, 256, size=(8, 9, 3), dtype=np.uint8)
+    image = Image.fromarray(blocks, "RGB").resize((360, 320), Image.NEAREST)
+
+    resized = image.resize((180, 160), Image.NEAREST)
+    cutout = image.convert("RGBA")
+    cutout.paste((0, 0, 0, 0), (0, 0, 360, 40))
+    whitened = image.copy()
+    whitened.paste((255, 255, 255), (0, 0, 360, 40))
+
+    assert DuplicateIndex.dhash(image) == DuplicateIndex.dhash(resized)
+    assert DuplicateIndex.dhash(image) != DuplicateIndex.dhash(whitened)
+    # transparent pixels hash like white ones
+    assert DuplicateIndex.dhash(cutout) == DuplicateIndex.dhash(whitened)
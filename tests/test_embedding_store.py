@@ -0,0 +1,106 @@
+import os
+import threading
+import numpy as np
+import pytest
+from app.utils.embedding_store import EmbeddingStore
+
+USER_ID = "user-a"
+
+def vector(*values: float) -> np.ndarray:
+    return np.array(values, dtype=np.float32)
+
+@pytest.fixture
+def store(tmp_path):
+    return EmbeddingStore(str(tmp_path))
+
+def test_search_ranks_by_cosine_similarity(store):
+    store.put(USER_ID, "red", vector(1, 0, 0))
+    store.put(USER_ID, "orange", vector(1, 1, 0))
+    store.put(USER_ID, "blue", vector(0, 0, 1))
+
+    results = store.search(USER_ID, vector(2, 0, 0), limit=2)
+
+    assert [clothing_id for clothing_id, _ in results] == ["red", "orange"]
+    assert results[0][1] == pytest.approx(1.0, abs=1e-3)
+    assert [clothing_id for clothing_id, _ in store.similar(USER_ID, "red")] == ["orange", "blue"]
+    assert store.similar(USER_ID, "missing") is None
+    assert store.search("user-b", vector(1, 0, 0)) == []
+
+def test_put_replaces_and_delete_removes(store):
+    store.put(USER_ID, "item", vector(1, 0))
+    store.put(USER_ID, "other", vector(0, 1))
+    store.put(USER_ID, "item", vector(0, 1))
+
+    ids, rows, matrix = store.load(USER_ID)
+    assert ids == ["item", "other"]
+    assert matrix[rows["item"]].tolist() == [0, 1]
+
+    store.delete(USER_ID, "item")
+    store.delete(USER_ID, "missing")
+
+    assert store.load(USER_ID)[0] == ["other"]
+
+def test_every_write_is_a_new_version(store, tmp_path):
+    store.put(USER_ID, "first", vector(1, 0))
+    store.put(USER_ID, "second", vector(0, 1))
+
+    # only the current matrix is kept on disk, next to the index
+    assert sorted(os.listdir(tmp_path / USER_ID[:2])) == [f"{USER_ID}.2.npy", f"{USER_ID}.json", f"{USER_ID}.lock"]
+    assert store._read_index(USER_ID)["version"] == 2
+
+def test_a_loaded_version_stays_readable_after_a_write(store):
+    store.put(USER_ID, "first", vector(1, 0))
+    ids, _, matrix = store.load(USER_ID)
+
+    store.put(USER_ID, "second", vector(0, 1))
+
+    # the old memmap keeps its inode, the next load picks up the new version
+    assert ids == ["first"]
+    assert matrix.tolist() == [[1, 0]]
+    assert store.load(USER_ID)[0] == ["first", "second"]
+
+def test_load_retries_when_the_version_is_replaced_while_reading(store, monkeypatch):
+    store.put(USER_ID, "first", vector(1, 0))
+    stale = store._read_index(USER_ID)
+    store.put(USER_ID, "second", vector(0, 1))
+
+    indexes = iter([stale, store._read_index(USER_ID)])
+    monkeypatch.setattr(store, "_read_index", lambda user_id: next(indexes))
+
+    assert store.load(USER_ID)[0] == ["first", "second"]
+
+def test_concurrent_readers_never_see_a_partial_version(tmp_path):
+    writer, reader = EmbeddingStore(str(tmp_path)), EmbeddingStore(str(tmp_path))
+    writer.put(USER_ID, "item-0", vector(1, 0, 0))
+    stopping = threading.Event()
+    errors = []
+
+    def read():
+        while not stopping.is_set():
+            try:
+                ids, rows, matrix = reader.load(USER_ID)
+                assert len(ids) == len(matrix) == len(rows)
+                assert reader.search(USER_ID, vector(1, 0, 0), limit=3)
+            except Exception as e:
+                errors.append(e)
+                return
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for index in range(1, 50):
+        writer.put(USER_ID, f"item-{index}", vector(1, index, 0))
+    stopping.set()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(reader.load(USER_ID)[0]) == 50
+
+def test_open_shards_are_bounded(store, monkeypatch):
+    monkeypatch.setattr("app.utils.embedding_store.EMBEDDING_SHARD_CACHE_SIZE", 2)
+    for user_id in ("user-a", "user-b", "user-c"):
+        store.put(user_id, "item", vector(1, 0))
+        store.load(user_id)
+
+    assert list(store._shards) == ["user-b", "user-c"]
@@ -0,0 +1,149 @@
+import os
+import time
+import pytest
+from app.utils.database import Database
+from app.utils.storage import LocalStorage, StorageNamespace
+from app.utils.image_gc import ImageGarbageCollector
+
+OLD = time.time() - 7200
+NOW = time.time()
+
+class FakeTables:
+    """
+    The clothing, image_refs and image_blobs rows the collector reads, answered with the same keyset pagination.
+    """
+
+    def __init__(self, storage: LocalStorage):
+        self.storage = storage
+        self.clothing = {}
+        self.refs = {} # image_id -> (created_at, content_hash)
+        self.blobs = {} # content_hash -> (size, refcount)
+
+    def select(self, query: str, params: tuple) -> list[tuple]:
+        *_, last, limit = params
+        if "FROM clothing" in query:
+            rows = sorted(self.clothing.items())
+        elif "FROM image_refs" in query:
+            rows = sorted((image_id, created_at, content_hash, self.blobs[content_hash][0]) for image_id, (created_at, content_hash) in self.refs.items())
+        elif "SELECT content_hash, content_hash" in query:
+            rows = sorted((content_hash, content_hash) for content_hash in self.blobs)
+        else:
+            rows = sorted((content_hash, refcount) for content_hash, (_, refcount) in self.blobs.items())
+
+        return [row for row in rows if row[0] > last][:limit]
+
+    def release(self, namespace: str, image_id: str) -> bool:
+        _, content_hash = self.refs.pop(image_id)
+        size, refcount = self.blobs[content_hash]
+        if refcount > 1:
+            self.blobs[content_hash] = (size, refcount - 1)
+            return False
+
+        del self.blobs[content_hash]
+        return self.storage.delete(namespace, f"{content_hash}.webp")
+
+class FakeCursor:
+    def __init__(self, tables: FakeTables):
+        self.tables = tables
+        self.rows = []
+
+    def execute(self, query: str, params: tuple):
+        self.rows = self.tables.select(query, params)
+
+    def fetchall(self):
+        return self.rows
+
+class FakeConnection:
+    def __init__(self, tables: FakeTables):
+        self.tables = tables
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return FakeCursor(self.tables)
+
+@pytest.fixture
+def local(tmp_path, monkeypatch):
+    local = LocalStorage(str(tmp_path))
+    monkeypatch.setattr("app.utils.image_gc.storage", local)
+    return local
+
+@pytest.fixture
+def tables(local, monkeypatch):
+    tables = FakeTables(local)
+    monkeypatch.setattr(Database, "getConnection", classmethod(lambda cls: FakeConnection(tables)))
+    monkeypatch.setattr("app.utils.image_gc.image_store.release", tables.release)
+    return tables
+
+def put(local: LocalStorage, key: str, size: int, modified: float):
+    local.put(StorageNamespace.CLOTHING, key, b"x" * size)
+    os.utime(local.local_path(StorageNamespace.CLOTHING, key), (modified, modified))
+
+def keys(local: LocalStorage) -> set[str]:
+    return {stored.key for stored in local.scan(StorageNamespace.CLOTHING)[0]}
+
+@pytest.fixture
+def wardrobe(local, tables):
+    # live image, and an orphaned ref sharing its content
+    tables.clothing["clothing-1"] = "image-1"
+    tables.refs["image-1"] = (OLD, "a" * 64)
+    tables.refs["image-3"] = (OLD, "a" * 64)
+    tables.blobs["a" * 64] = (10, 2)
+    put(local, f"{'a' * 64}.webp", 10, OLD)
+
+    # orphaned ref holding the only reference to its content
+    tables.refs["image-2"] = (OLD, "b" * 64)
+    tables.blobs["b" * 64] = (20, 1)
+    put(local, f"{'b' * 64}.webp", 20, OLD)
+
+    # orphaned but within the grace period, its clothing row may not be committed yet
+    tables.refs["image-4"] = (NOW, "c" * 64)
+    tables.blobs["c" * 64] = (30, 1)
+    put(local, f"{'c' * 64}.webp", 30, NOW)
+
+    # files from before content addressing are kept alive by their image_id
+    tables.clothing["clothing-2"] = "legacy"
+    put(local, "legacy.webp", 40, OLD)
+    put(local, "stray.webp", 50, OLD)
+    put(local, "recent.webp", 60, NOW)
+
+def test_collect_releases_orphaned_refs_and_sweeps_unreferenced_files(local, tables, wardrobe):
+    report = ImageGarbageCollector(batch_size=2, pause=0, grace=3600).collect(StorageNamespace.CLOTHING)
+
+    assert keys(local) == {f"{'a' * 64}.webp", f"{'c' * 64}.webp", "legacy.webp", "recent.webp"}
+    assert set(tables.refs) == {"image-1", "image-4"}
+    assert tables.blobs["a" * 64] == (10, 1)
+    assert report.live_images == 2
+    assert report.refs_orphaned == 2
+    assert report.refs_released == 2
+    assert report.files_garbage == 2
+    assert report.files_deleted == 2
+    assert report.bytes_reclaimed == 70
+
+def test_dry_run_reports_what_a_real_run_reclaims(local, tables, wardrobe):
+    collector = ImageGarbageCollector(batch_size=2, pause=0, grace=3600)
+    before = keys(local)
+
+    dry = collector.collect(StorageNamespace.CLOTHING, dry_run=True)
+
+    assert keys(local) == before
+    assert len(tables.refs) == 4
+    assert dry.refs_released == 0
+    assert dry.files_deleted == 0
+
+    real = collector.collect(StorageNamespace.CLOTHING)
+
+    assert (dry.refs_orphaned, dry.files_garbage, dry.bytes_reclaimable) == (real.refs_orphaned, real.files_garbage, real.bytes_reclaimable)
+    assert real.bytes_reclaimed == dry.bytes_reclaimable
+
+def test_is_live_looks_up_every_hash():
+    collector = ImageGarbageCollector()
+    live = collector._hash(["b", "d"])
+    live.sort()
+
+    assert collector._is_live(live, collector._hash(["a", "b", "c", "d"])).tolist() == [False, True, False, True]
+    assert collector._is_live(live[:0], collector._hash(["a"])).tolist() == [False]
@@ -0,0 +1,83 @@
+import pytest
+from io import BytesIO
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+from app.utils.exceptions import UnsupportedFileTypeError, FileTooLargeError, ImageDimensionsTooLargeError
+from app.utils.image_ingest import ImageIngest, WEBP_MAX_SIZE
+
+def encode(image: Image.Image, format: str) -> bytes:
+    data = BytesIO()
+    image.save(data, format)
+    return data.getvalue()
+
+class CountingStream(BytesIO):
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+def upload(data: bytes, filename: str = "upload.jpg") -> FileStorage:
+    return FileStorage(stream=CountingStream(data), filename=filename)
+
+def test_the_type_comes_from_the_magic_bytes():
+    ingest = ImageIngest()
+    png = encode(Image.new("RGB", (10, 10)), "PNG")
+
+    assert ingest.read_upload(upload(png, "named-like-a.jpg")) == png
+    with pytest.raises(UnsupportedFileTypeError):
+        ingest.read_upload(upload(encode(Image.new("RGB", (10, 10)), "GIF"), "named-like-a.png"))
+    with pytest.raises(UnsupportedFileTypeError):
+        ingest.read_upload(upload(b"not an image", "image.png"))
+
+def test_a_wrong_type_is_rejected_before_the_rest_is_read():
+    file = upload(b"\0" * (1024 * 1024))
+
+    with pytest.raises(UnsupportedFileTypeError):
+        ImageIngest().read_upload(file)
+    assert file.stream.bytes_read < 1024 * 1024
+
+def test_an_upload_over_the_size_limit_is_rejected_while_streaming():
+    png = encode(Image.new("RGB", (10, 10)), "PNG")
+    file = upload(png + b"\0" * (1024 * 1024))
+
+    with pytest.raises(FileTooLargeError):
+        ImageIngest(max_bytes=256 * 1024).read_upload(file)
+    assert file.stream.bytes_read <= 256 * 1024 + 64 * 1024
+
+def test_the_pixel_guard_is_checked_from_the_header():
+    data = encode(Image.new("RGB", (400, 300)), "PNG")
+
+    with pytest.raises(ImageDimensionsTooLargeError):
+        ImageIngest(max_pixels=100_000).decode(data)
+    assert ImageIngest(max_pixels=120_000).decode(data).size == (400, 300)
+
+def test_decode_keeps_the_full_resolution_and_the_working_copy_is_bounded():
+    ingest = ImageIngest(working_size=256)
+    image = ingest.decode(encode(Image.new("RGB", (1200, 800), "red"), "JPEG"))
+
+    assert image.size == (1200, 800)
+    assert ingest.to_working_size(image).size == (256, 171)
+    small = ingest.decode(encode(Image.new("RGB", (200, 100)), "JPEG"))
+    assert ingest.to_working_size(small) is small
+
+def test_decode_shrinks_what_webp_cannot_store():
+    image = ImageIngest().decode(encode(Image.new("L", (WEBP_MAX_SIZE + 1000, 10)), "PNG"))
+
+    assert max(image.size) == WEBP_MAX_SIZE
+    assert image.mode == "RGB"
+
+def test_transparency_survives_decoding():
+    cutout = Image.new("RGBA", (100, 100), (0, 0, 0, 0))
+    cutout.paste((200, 30, 30, 255), (25, 25, 75, 75))
+    ingest = ImageIngest()
+
+    image = ingest.decode(encode(cutout, "PNG"))
+
+    assert image.mode == "RGBA"
+    assert ingest.has_cutout_alpha(image)
+    assert not ingest.has_cutout_alpha(Image.new("RGBA", (100, 100), (0, 0, 0, 255)))
+    assert not ingest.has_cutout_alpha(Image.new("RGB", (100, 100)))
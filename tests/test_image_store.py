@@ -0,0 +1,73 @@
+import hashlib
+import pytest
+from app.utils.database import Database
+from app.utils.storage import LocalStorage
+from app.utils.image_store import ImageStore
+
+class FakeCursor:
+    def __init__(self, connection: "FakeConnection"):
+        self.connection = connection
+        self.result = None
+
+    def execute(self, query: str, params: tuple):
+        self.connection.queries.append(query)
+        self.result = self.connection.rows.get(params[0])
+
+    def fetchone(self):
+        return self.result
+
+class FakeConnection:
+    def __init__(self, rows: dict):
+        self.rows = rows
+        self.queries = []
+        self.commits = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+def fake_database(monkeypatch, rows: dict) -> FakeConnection:
+    connection = FakeConnection(rows)
+    monkeypatch.setattr(Database, "getConnection", classmethod(lambda cls: connection))
+    return connection
+
+def test_resolve_caches_refs(monkeypatch):
+    connection = fake_database(monkeypatch, {"image-a": ("a" * 64,)})
+    store = ImageStore()
+
+    assert store.resolve("clothing_images", "image-a") == f"{'a' * 64}.webp"
+    assert store.resolve("clothing_images", "image-a") == f"{'a' * 64}.webp"
+    assert len(connection.queries) == 1
+
+def test_resolve_finds_a_ref_written_after_a_miss(monkeypatch):
+    connection = fake_database(monkeypatch, {})
+    store = ImageStore()
+
+    # the image_id of a preview is resolved before the clothing that stores it is committed
+    assert store.resolve("clothing_images", "image-a") == "image-a.webp"
+    connection.rows["image-a"] = ("a" * 64,)
+
+    assert store.resolve("clothing_images", "image-a") == f"{'a' * 64}.webp"
+    assert store.resolve("clothing_images", "image-a") == f"{'a' * 64}.webp"
+    assert len(connection.queries) == 2
+
+def test_add_writes_the_ref_in_the_callers_transaction(monkeypatch, tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    monkeypatch.setattr("app.utils.image_store.storage", storage)
+    monkeypatch.setattr(Database, "getConnection", classmethod(lambda cls: pytest.fail("add must not open a connection of its own")))
+    connection = FakeConnection({})
+
+    content_hash = ImageStore().add("clothing_images", "image-a", b"data", connection)
+
+    assert content_hash == hashlib.sha256(b"data").hexdigest()
+    assert connection.commits == 0
+    assert any("INSERT INTO image_refs" in query for query in connection.queries)
+    assert storage.get("clothing_images", f"{content_hash}.webp") == b"data"
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from app.utils import kernels as kernel_module
+from app.utils.kernels import ImageKernels
+from app.utils.color_palette import SRGB_TO_LINEAR, RGB_TO_XYZ, L_BIN_SIZE, L_BINS, AB_BIN_SIZE, AB_BINS, MIN_ALPHA
+
+# the loop versions are what numba compiles, run as plain Python they are the reference for the NumPy fallback
+
+def alpha_masks() -> list[np.ndarray]:
+    rng = np.random.default_rng(0)
+    sparse = np.zeros((40, 30), dtype=np.uint8)
+    sparse[7, 3] = sparse[31, 22] = 200
+    border = np.zeros((40, 30), dtype=np.uint8)
+    border[:, -1] = 255
+    return [
+        np.zeros((40, 30), dtype=np.uint8),
+        np.full((40, 30), 255, dtype=np.uint8),
+        sparse,
+        border,
+        (rng.random((40, 30)) > 0.97).astype(np.uint8) * rng.integers(1, 256, (40, 30), dtype=np.uint8),
+    ]
+
+def lab_histogram(function, pixels: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    bins = L_BINS * AB_BINS * AB_BINS
+    weight, rgb_sum, lab_sum = np.zeros(bins), np.zeros((bins, 3)), np.zeros((bins, 3))
+    function(pixels, MIN_ALPHA, SRGB_TO_LINEAR, RGB_TO_XYZ, L_BIN_SIZE, L_BINS, AB_BIN_SIZE, AB_BINS, weight, rgb_sum, lab_sum)
+    return weight, rgb_sum, lab_sum
+
+def layers() -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(1)
+    canvas = rng.integers(0, 256, (24, 32, 4), dtype=np.uint8)
+    canvas[:8, :, 3] = 0
+    item = rng.integers(0, 256, (12, 10, 4), dtype=np.uint8)
+    item[:4, :, 3] = 255
+    item[4:8, :, 3] = 0
+    return canvas, item
+
+@pytest.mark.parametrize("threshold", [0, 100])
+def test_alpha_bbox_fallback_matches_the_loop(threshold):
+    for alpha in alpha_masks():
+        loop = kernel_module._alpha_bbox_loop(alpha, threshold)
+        vectorized = kernel_module._alpha_bbox_numpy(alpha, threshold)
+
+        # both mark an empty mask with right <= left
+        if loop[2] <= loop[0]:
+            assert vectorized[2] <= vectorized[0]
+        else:
+            assert loop == vectorized
+
+def test_lab_histogram_fallback_matches_the_loop():
+    rng = np.random.default_rng(2)
+    pixels = rng.integers(0, 256, (500, 4), dtype=np.uint8)
+
+    loop = lab_histogram(kernel_module._lab_histogram_loop, pixels)
+    vectorized = lab_histogram(kernel_module._lab_histogram_numpy, pixels)
+
+    for expected, actual in zip(loop, vectorized):
+        np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-3)
+
+@pytest.mark.parametrize("x, y", [(5, 3), (-4, -2), (26, 18), (40, 0)])
+def test_composite_over_fallback_matches_the_loop(x, y):
+    canvas, item = layers()
+    loop, vectorized = canvas.copy(), canvas.copy()
+
+    kernel_module._composite_over_loop(loop, item, x, y)
+    kernel_module._composite_over_numpy(vectorized, item, x, y)
+
+    assert np.abs(loop.astype(int) - vectorized.astype(int)).max() <= 1
+
+def test_compiled_kernels_match_the_fallback():
+    pytest.importorskip("numba")
+    compiled, fallback = ImageKernels(jit=True), ImageKernels(jit=False)
+
+    for alpha in alpha_masks():
+        assert compiled.alpha_bbox(alpha) == fallback.alpha_bbox(alpha)
+
+    pixels = np.random.default_rng(2).integers(0, 256, (500, 4), dtype=np.uint8)
+    for expected, actual in zip(lab_histogram(fallback.lab_histogram, pixels), lab_histogram(compiled.lab_histogram, pixels)):
+        np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-3)
+
+    canvas, item = layers()
+    expected, actual = canvas.copy(), canvas.copy()
+    fallback.composite_over(expected, item, 5, 3)
+    compiled.composite_over(actual, item, 5, 3)
+    assert np.abs(expected.astype(int) - actual.astype(int)).max() <= 1
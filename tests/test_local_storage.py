@@ -0,0 +1,116 @@
+import os
+import pytest
+from app.utils.storage import Storage, LocalStorage, StorageNamespace
+
+@pytest.fixture
+def local(tmp_path):
+    return LocalStorage(str(tmp_path))
+
+def scan_all(local: LocalStorage, namespace: str, limit: int) -> tuple[list[str], int]:
+    scanned, cursor, pages = [], None, 0
+    while True:
+        objects, cursor = local.scan(namespace, cursor, limit)
+        scanned.extend(stored.key for stored in objects)
+        pages += 1
+        if cursor is None:
+            return scanned, pages
+
+def test_put_stores_under_the_sharded_path(local, tmp_path):
+    local.put(StorageNamespace.CLOTHING, "image.webp", b"data")
+
+    path = tmp_path / "clothing_images" / Storage.shard("image.webp") / "image.webp"
+    assert path.read_bytes() == b"data"
+    assert local.local_path(StorageNamespace.CLOTHING, "image.webp") == str(path)
+
+def test_put_leaves_no_temporary_file(local, tmp_path):
+    local.put(StorageNamespace.CLOTHING, "image.webp", b"old")
+    local.put(StorageNamespace.CLOTHING, "image.webp", b"new")
+
+    directory = tmp_path / "clothing_images" / Storage.shard("image.webp")
+    assert os.listdir(directory) == ["image.webp"]
+    assert local.get(StorageNamespace.CLOTHING, "image.webp") == b"new"
+
+def test_legacy_flat_files_are_found(local, tmp_path):
+    (tmp_path / "clothing_images").mkdir()
+    (tmp_path / "clothing_images" / "legacy.webp").write_bytes(b"data")
+
+    assert local.get(StorageNamespace.CLOTHING, "legacy.webp") == b"data"
+    assert local.stat(StorageNamespace.CLOTHING, "legacy.webp").size == 4
+    assert local.local_path(StorageNamespace.CLOTHING, "legacy.webp") == str(tmp_path / "clothing_images" / "legacy.webp")
+
+    assert local.delete(StorageNamespace.CLOTHING, "legacy.webp") is True
+    assert local.stat(StorageNamespace.CLOTHING, "legacy.webp") is None
+
+def test_missing_keys(local):
+    with pytest.raises(FileNotFoundError):
+        local.get(StorageNamespace.CLOTHING, "missing.webp")
+
+    assert local.stat(StorageNamespace.CLOTHING, "missing.webp") is None
+    assert local.delete(StorageNamespace.CLOTHING, "missing.webp") is False
+    assert local.local_path(StorageNamespace.CLOTHING, "missing.webp") is None
+
+def test_move_replaces_the_target_and_marks_the_arrival(local):
+    local.put(StorageNamespace.TEMP, "preview.webp", b"new")
+    local.put(StorageNamespace.CLOTHING, "image.webp", b"old")
+    os.utime(local.local_path(StorageNamespace.TEMP, "preview.webp"), (0, 0))
+
+    local.move(StorageNamespace.TEMP, "preview.webp", StorageNamespace.CLOTHING, "image.webp")
+
+    assert local.stat(StorageNamespace.TEMP, "preview.webp") is None
+    assert local.get(StorageNamespace.CLOTHING, "image.webp") == b"new"
+    assert local.stat(StorageNamespace.CLOTHING, "image.webp").modified > 0
+
+def test_move_of_a_legacy_file_shards_it(local, tmp_path):
+    (tmp_path / "temp").mkdir()
+    (tmp_path / "temp" / "preview.webp").write_bytes(b"data")
+
+    local.move(StorageNamespace.TEMP, "preview.webp", StorageNamespace.CLOTHING, "image.webp")
+
+    assert (tmp_path / "clothing_images" / Storage.shard("image.webp") / "image.webp").read_bytes() == b"data"
+
+def test_move_missing_source(local):
+    with pytest.raises(FileNotFoundError):
+        local.move(StorageNamespace.TEMP, "missing.webp", StorageNamespace.CLOTHING, "image.webp")
+
+def test_scan_pages_through_sharded_and_legacy_files(local, tmp_path):
+    keys = {f"image-{index}.webp" for index in range(7)}
+    for key in keys:
+        local.put(StorageNamespace.CLOTHING, key, b"data")
+    (tmp_path / "clothing_images" / "legacy.webp").write_bytes(b"data")
+    local.put(StorageNamespace.TEMP, "preview.webp", b"data")
+
+    scanned, pages = scan_all(local, StorageNamespace.CLOTHING, limit=3)
+
+    assert pages == 3
+    assert sorted(scanned) == sorted(keys | {"legacy.webp"})
+    # sharded files come first, the legacy flat ones after them
+    assert scanned[-1] == "legacy.webp"
+
+def test_scan_cursor_survives_deletes(local):
+    for index in range(6):
+        local.put(StorageNamespace.CLOTHING, f"image-{index}.webp", b"data")
+
+    first, cursor = local.scan(StorageNamespace.CLOTHING, limit=3)
+    for stored in first:
+        local.delete(StorageNamespace.CLOTHING, stored.key)
+    rest, cursor = local.scan(StorageNamespace.CLOTHING, cursor, limit=3)
+
+    assert cursor is None
+    assert {stored.key for stored in first}.isdisjoint(stored.key for stored in rest)
+    assert len(rest) == 3
+
+def test_scan_of_a_missing_namespace(local):
+    assert local.scan(StorageNamespace.OUTFITS) == ([], None)
+
+def test_partial_writes_are_purged_after_the_grace_period(local, tmp_path):
+    local.put(StorageNamespace.TEMP, "preview.webp", b"data")
+    directory = tmp_path / "temp" / Storage.shard("preview.webp")
+    (directory / "preview.webp.1.1.tmp").write_bytes(b"stale")
+    (directory / "preview.webp.2.2.tmp").write_bytes(b"in flight")
+    os.utime(directory / "preview.webp.1.1.tmp", (100, 100))
+
+    purged = local.purge_partial_writes(StorageNamespace.TEMP, before=1000)
+
+    assert [(stored.key, stored.size) for stored in purged] == [("preview.webp.1.1.tmp", 5)]
+    assert sorted(os.listdir(directory)) == ["preview.webp", "preview.webp.2.2.tmp"]
+    assert [stored.key for stored in local.scan(StorageNamespace.TEMP)[0]] == ["preview.webp"]
@@ -0,0 +1,37 @@
+import numpy as np
+from app.utils.outfit_suggestions import OutfitSuggestionEngine, SUGGESTION_CATEGORIES
+
+def synthetic_wardrobe(items_per_category: int, dimensions: int = 64, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    size = items_per_category * len(SUGGESTION_CATEGORIES)
+
+    categories = np.repeat(np.arange(len(SUGGESTION_CATEGORIES)), items_per_category)
+    embeddings = rng.normal(size=(size, dimensions)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    colors = np.column_stack([rng.uniform(30, 70, size), rng.uniform(-60, 60, size), rng.uniform(-60, 60, size)])
+    # every item fits the context equally well, pruning by context alone would keep an arbitrary subset
+    context = np.full(size, 0.5, dtype=np.float32)
+
+    return categories, embeddings, colors, context
+
+def test_rank_keeps_the_best_combination_through_pruning():
+    categories, embeddings, colors, context = synthetic_wardrobe(500)
+    engine = OutfitSuggestionEngine(candidates=8)
+
+    # one item per category shares the same style and a neutral color, a clearly better outfit than any random one
+    planted = tuple(int(np.flatnonzero(categories == category_index)[-1]) for category_index in range(len(SUGGESTION_CATEGORIES)))
+    style = embeddings[planted[0]].copy()
+    for index in planted:
+        embeddings[index] = style
+        colors[index] = (50.0, 0.0, 0.0)
+    # the jacket slot is optional, without a better fit the outfit would tie with itself minus the jacket
+    context[planted[0]] = 1.0
+
+    ranked = engine.rank(categories, embeddings, colors, context, limit=1)
+
+    assert ranked[0][1] == planted
+
+def test_rank_without_pruning_matches_the_pruned_grid():
+    categories, embeddings, colors, context = synthetic_wardrobe(6)
+
+    assert OutfitSuggestionEngine(candidates=6).rank(categories, embeddings, colors, context, limit=5) == OutfitSuggestionEngine(candidates=24).rank(categories, embeddings, colors, context, limit=5)
@@ -0,0 +1,38 @@
+import pytest
+from app.utils.exceptions import PreviewQualityInvalidError
+from app.utils.preview_quality import QualityPolicy, PreviewQuality
+
+@pytest.mark.parametrize("queue_depth, expected", [
+    (0, PreviewQuality.BEST),
+    (15, PreviewQuality.BEST),
+    (16, PreviewQuality.BALANCED),
+    (31, PreviewQuality.BALANCED),
+    (32, PreviewQuality.FAST),
+    (500, PreviewQuality.FAST),
+])
+def test_every_downgrade_depth_costs_one_tier(queue_depth, expected):
+    assert QualityPolicy(downgrade_depth=16).resolve(PreviewQuality.BEST, queue_depth) == expected
+
+def test_downgrade_starts_from_the_requested_tier():
+    policy = QualityPolicy(downgrade_depth=16)
+
+    assert policy.resolve(PreviewQuality.BALANCED, 16) == PreviewQuality.FAST
+    assert policy.resolve(PreviewQuality.FAST, 100) == PreviewQuality.FAST
+
+def test_a_downgrade_depth_of_zero_disables_it():
+    assert QualityPolicy(downgrade_depth=0).resolve(PreviewQuality.BEST, 1000) == PreviewQuality.BEST
+
+def test_parse():
+    policy = QualityPolicy(default="Balanced")
+
+    assert policy.parse(None) == PreviewQuality.BALANCED
+    assert policy.parse("") == PreviewQuality.BALANCED
+    assert policy.parse("FAST") == PreviewQuality.FAST
+    with pytest.raises(PreviewQualityInvalidError):
+        policy.parse("ultra")
+
+def test_cheaper_tiers_never_matte_at_a_higher_resolution():
+    settings = [QualityPolicy.settings(quality) for quality in (PreviewQuality.FAST, PreviewQuality.BALANCED, PreviewQuality.BEST)]
+
+    assert settings[0]["alpha_matting"] is False
+    assert settings[1]["base_size"] < settings[2]["base_size"]
@@ -0,0 +1,53 @@
+import pytest
+from app.utils.storage import LocalStorage
+from app.utils.preview_staging import PreviewStaging
+
+class FakeRedis:
+    def __init__(self):
+        self.hashes = {}
+
+    def hget(self, key: str, field: str):
+        value = self.hashes.get(key, {}).get(field)
+        return None if value is None else str(value).encode()
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+
+    def hset(self, key: str, mapping: dict):
+        self.redis.hashes[key] = mapping
+
+    def expire(self, key: str, ttl: int):
+        pass
+
+    def zadd(self, key: str, mapping: dict):
+        pass
+
+    def execute(self):
+        pass
+
+@pytest.fixture
+def staging(monkeypatch, tmp_path):
+    monkeypatch.setattr("app.utils.preview_staging.storage", LocalStorage(str(tmp_path)))
+    staging = PreviewStaging()
+    staging._redis = FakeRedis()
+    return staging
+
+def test_only_the_owner_can_read_a_preview(staging):
+    staging.stage("image-a", "user-a", b"webp")
+
+    assert staging.is_staged("image-a", "user-a")
+    assert not staging.is_staged("image-a", "user-b")
+    assert staging.read("image-a", "user-a") == b"webp"
+    with pytest.raises(FileNotFoundError):
+        staging.read("image-a", "user-b")
+
+def test_previews_are_never_staged_without_an_owner(staging):
+    with pytest.raises(ValueError):
+        staging.stage("image-a", "", b"webp")
+
+    assert staging.owner("image-a") is None
+    assert not staging.is_staged("image-a", "")
@@ -0,0 +1,32 @@
+import os
+import time
+from app.utils.renditions import RenditionCache
+
+def write(path, size: int, mtime: float):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    os.utime(path, (mtime, mtime))
+
+def test_evict_removes_the_least_recently_used_renditions(tmp_path):
+    renditions = RenditionCache(str(tmp_path), max_bytes=250)
+    write(tmp_path / "clothing_images" / "a" / "256.webp", 100, 100)
+    write(tmp_path / "clothing_images" / "b" / "256.webp", 100, 200)
+    write(tmp_path / "clothing_images" / "c" / "256.webp", 100, 300)
+
+    assert renditions.evict() == 100
+    assert not (tmp_path / "clothing_images" / "a" / "256.webp").exists()
+    assert (tmp_path / "clothing_images" / "c" / "256.webp").exists()
+    assert renditions._written_bytes == 200
+
+def test_evict_reclaims_temporary_files_of_failed_renders(tmp_path):
+    renditions = RenditionCache(str(tmp_path), max_bytes=1000)
+    stale = tmp_path / "clothing_images" / "a" / "256.webp.1.1.tmp"
+    in_flight = tmp_path / "clothing_images" / "a" / "512.webp.2.2.tmp"
+    write(stale, 100, 100)
+    write(in_flight, 50, time.time())
+
+    assert renditions.evict() == 100
+    assert not stale.exists()
+    assert in_flight.exists()
+    # a render in progress still takes up its space
+    assert renditions._written_bytes == 50
@@ -0,0 +1,87 @@
+import pytest
+from app.utils.storage import Storage, S3Storage, StorageNamespace
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+BUCKET = "clothing-booth-test"
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+
+    with moto.mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+        yield S3Storage(bucket=BUCKET, endpoint_url=None, region="us-east-1")
+
+def object_keys(s3: S3Storage) -> list[str]:
+    return [item["Key"] for item in s3._client.list_objects_v2(Bucket=BUCKET).get("Contents", [])]
+
+def test_shard_is_a_stable_two_level_prefix():
+    shard = Storage.shard("image.webp")
+
+    assert shard == Storage.shard("image.webp")
+    assert len(shard) == 5 and shard[2] == "/"
+    assert all(character in "0123456789abcdef" for character in shard.replace("/", ""))
+
+def test_put_stores_under_the_sharded_key(s3):
+    s3.put(StorageNamespace.CLOTHING, "image.webp", b"data")
+
+    assert object_keys(s3) == [f"clothing_images/{Storage.shard('image.webp')}/image.webp"]
+
+def test_put_get_stat(s3):
+    s3.put(StorageNamespace.CLOTHING, "image.webp", b"data")
+
+    assert s3.get(StorageNamespace.CLOTHING, "image.webp") == b"data"
+
+    stored = s3.stat(StorageNamespace.CLOTHING, "image.webp")
+    assert stored.key == "image.webp"
+    assert stored.size == 4
+    assert stored.modified > 0
+
+def test_missing_keys(s3):
+    with pytest.raises(FileNotFoundError):
+        s3.get(StorageNamespace.CLOTHING, "missing.webp")
+
+    assert s3.stat(StorageNamespace.CLOTHING, "missing.webp") is None
+    assert s3.delete(StorageNamespace.CLOTHING, "missing.webp") is False
+
+def test_delete(s3):
+    s3.put(StorageNamespace.TEMP, "image.webp", b"data")
+
+    assert s3.delete(StorageNamespace.TEMP, "image.webp") is True
+    assert s3.stat(StorageNamespace.TEMP, "image.webp") is None
+    assert object_keys(s3) == []
+
+def test_move(s3):
+    s3.put(StorageNamespace.TEMP, "preview.webp", b"data")
+
+    s3.move(StorageNamespace.TEMP, "preview.webp", StorageNamespace.CLOTHING, "image.webp")
+
+    assert s3.stat(StorageNamespace.TEMP, "preview.webp") is None
+    assert s3.get(StorageNamespace.CLOTHING, "image.webp") == b"data"
+    assert object_keys(s3) == [f"clothing_images/{Storage.shard('image.webp')}/image.webp"]
+
+def test_move_missing_source(s3):
+    with pytest.raises(FileNotFoundError):
+        s3.move(StorageNamespace.TEMP, "missing.webp", StorageNamespace.CLOTHING, "image.webp")
+
+def test_scan_pages_through_one_namespace(s3):
+    keys = {f"image-{index}.webp" for index in range(7)}
+    for key in keys:
+        s3.put(StorageNamespace.CLOTHING, key, b"data")
+    s3.put(StorageNamespace.TEMP, "preview.webp", b"data")
+
+    scanned, cursor, pages = [], None, 0
+    while True:
+        objects, cursor = s3.scan(StorageNamespace.CLOTHING, cursor, limit=3)
+        scanned.extend(objects)
+        pages += 1
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert {stored.key for stored in scanned} == keys
+    assert all(stored.size == 4 for stored in scanned)
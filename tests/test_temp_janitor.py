@@ -0,0 +1,108 @@
+import os
+import time
+import pytest
+from app.utils.storage import LocalStorage, StorageNamespace
+from app.utils.temp_janitor import TempJanitor
+
+class FakePipeline:
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+class FakeRedis:
+    def pipeline(self):
+        return FakePipeline()
+
+class FakeStaging:
+    def __init__(self, expired: list[str]):
+        self.expired = expired
+        self.discarded = []
+        self.redis = FakeRedis()
+
+    def pop_expired(self, limit: int, now: float) -> list[str]:
+        image_ids, self.expired = self.expired[:limit], self.expired[limit:]
+        return image_ids
+
+    def discard(self, image_id: str):
+        self.discarded.append(image_id)
+
+@pytest.fixture
+def local(tmp_path, monkeypatch):
+    local = LocalStorage(str(tmp_path))
+    monkeypatch.setattr("app.utils.temp_janitor.storage", local)
+    return local
+
+@pytest.fixture
+def staging(monkeypatch):
+    staging = FakeStaging([])
+    monkeypatch.setattr("app.utils.temp_janitor.preview_staging", staging)
+    return staging
+
+def put(local: LocalStorage, key: str, size: int, age: float):
+    local.put(StorageNamespace.TEMP, key, b"x" * size)
+    modified = time.time() - age
+    os.utime(local.local_path(StorageNamespace.TEMP, key), (modified, modified))
+
+def keys(local: LocalStorage) -> set[str]:
+    return {stored.key for stored in local.scan(StorageNamespace.TEMP)[0]}
+
+def test_sweep_expires_staged_previews_and_old_files(local, staging):
+    put(local, "expired.webp", 10, age=5)
+    put(local, "expired.emb", 4, age=5)
+    put(local, "abandoned.webp", 10, age=7200)
+    put(local, "fresh.webp", 10, age=5)
+    staging.expired = ["expired"]
+
+    stats = TempJanitor(max_age=3600, max_bytes=1000, batch_size=2, pause=0).sweep()
+
+    assert keys(local) == {"fresh.webp"}
+    assert stats.files_expired == 3
+    assert stats.files_evicted == 0
+    assert stats.bytes_reclaimed == 24
+    assert stats.bytes_remaining == 10
+
+def test_sweep_evicts_the_oldest_previews_down_to_the_target(local, staging):
+    for index in range(10):
+        put(local, f"preview-{index}.webp", 100, age=100 - index)
+    put(local, "preview-0.emb", 4, age=1)
+
+    # 1004 bytes against a budget of 600, trimmed to 90% of it
+    stats = TempJanitor(max_age=3600, max_bytes=600, batch_size=3, pause=0).sweep()
+
+    assert keys(local) == {f"preview-{index}.webp" for index in range(5, 10)}
+    assert staging.discarded == [f"preview-{index}" for index in range(5)]
+    # the embedding goes with its preview and is accounted for
+    assert stats.files_evicted == 6
+    assert stats.bytes_reclaimed == 504
+    assert stats.bytes_remaining == 500
+
+def test_sweep_within_the_budget_evicts_nothing(local, staging):
+    for index in range(4):
+        put(local, f"preview-{index}.webp", 100, age=10)
+
+    stats = TempJanitor(max_age=3600, max_bytes=400, batch_size=3, pause=0).sweep()
+
+    assert len(keys(local)) == 4
+    assert stats.files_evicted == 0
+    assert stats.bytes_remaining == 400
+
+def test_oldest_holds_only_the_files_that_have_to_go(local, staging):
+    for index, age in enumerate([50, 10, 90, 30, 70]):
+        put(local, f"preview-{index}.webp", 100, age=age)
+
+    oldest = TempJanitor(batch_size=2, pause=0)._oldest(250)
+
+    assert [stored.key for stored in oldest] == ["preview-2.webp", "preview-4.webp", "preview-0.webp"]
+
+def test_sweep_reclaims_partial_writes(local, staging, tmp_path):
+    put(local, "preview.webp", 10, age=5)
+    directory = os.path.dirname(local.local_path(StorageNamespace.TEMP, "preview.webp"))
+    stale = os.path.join(directory, "preview.webp.1.1.tmp")
+    with open(stale, "wb") as f:
+        f.write(b"x" * 7)
+    os.utime(stale, (0, 0))
+
+    stats = TempJanitor(max_age=3600, max_bytes=1000, pause=0).sweep()
+
+    assert not os.path.exists(stale)
+    assert stats.files_expired == 1
+    assert stats.bytes_reclaimed == 7
@@ -0,0 +1,111 @@
+import builtins
+import pytest
+from io import BytesIO
+from PIL import Image
+from flask import Flask
+from app.utils.limiter import limiter
+from app.utils.storage import LocalStorage, StorageNamespace
+from app.utils.renditions import RenditionCache
+from app.utils.image_store import image_store
+from app.uploads import routes
+
+IMAGE_ID = "0b6f2f55-8a4e-4c43-9a7a-5d1e1f0c2a10"
+
+def webp_bytes(size: tuple[int, int] = (300, 200)) -> bytes:
+    data = BytesIO()
+    Image.new("RGBA", size, (200, 30, 30, 255)).save(data, "WEBP")
+    return data.getvalue()
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path / "static"))
+    monkeypatch.setattr(routes, "storage", storage)
+    monkeypatch.setattr("app.utils.renditions.storage", storage)
+    renditions = RenditionCache(str(tmp_path / "renditions"))
+    renditions._written_bytes = 0 # keeps the background eviction from scanning the temporary directory
+    monkeypatch.setattr(routes, "rendition_cache", renditions)
+    monkeypatch.setattr(image_store, "resolve", lambda namespace, image_id: f"{image_id}.webp")
+    return storage
+
+@pytest.fixture
+def client(storage):
+    app = Flask(__name__)
+    limiter.init_app(app)
+    app.register_blueprint(routes.uploads, url_prefix="/uploads")
+    return app.test_client()
+
+@pytest.fixture
+def reads(storage, tmp_path, monkeypatch):
+    """
+    Records every read of an image file, through the storage backend or a plain open().
+    """
+    reads = []
+    real_get, real_open = storage.get, builtins.open
+
+    def get(namespace, key):
+        reads.append(f"{namespace}/{key}")
+        return real_get(namespace, key)
+
+    def tracked_open(file, mode="r", *args, **kwargs):
+        if "r" in mode and str(file).startswith(str(tmp_path)):
+            reads.append(str(file))
+        return real_open(file, mode, *args, **kwargs)
+
+    monkeypatch.setattr(storage, "get", get)
+    monkeypatch.setattr(builtins, "open", tracked_open)
+    return reads
+
+@pytest.mark.parametrize("path, namespace", [
+    (f"/uploads/clothing_images/{IMAGE_ID}.webp", StorageNamespace.CLOTHING),
+    (f"/uploads/outfit_images/{IMAGE_ID}.webp", StorageNamespace.OUTFITS),
+    (f"/uploads/temp/{IMAGE_ID}.webp", StorageNamespace.TEMP),
+])
+def test_revalidation_answers_304_without_reading_the_file(client, storage, reads, path, namespace):
+    storage.put(namespace, f"{IMAGE_ID}.webp", webp_bytes())
+
+    response = client.get(path)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    response.close()
+    reads.clear()
+
+    response = client.get(path, headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.data == b""
+    assert reads == []
+
+def test_rendition_revalidation_does_not_render(client, storage, reads, monkeypatch):
+    storage.put(StorageNamespace.CLOTHING, f"{IMAGE_ID}.webp", webp_bytes())
+    path = f"/uploads/clothing_images/{IMAGE_ID}?w=128"
+
+    response = client.get(path, headers={"Accept": "image/webp"})
+    assert response.status_code == 200
+    assert Image.open(BytesIO(response.data)).width == 128
+    etag = response.headers["ETag"]
+    response.close()
+    reads.clear()
+
+    def render(*args, **kwargs):
+        raise AssertionError("a revalidation must not render")
+
+    monkeypatch.setattr(routes.rendition_cache, "get", render)
+    response = client.get(path, headers={"Accept": "image/webp", "If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert reads == []
+
+def test_changed_etag_sends_the_image(client, storage):
+    storage.put(StorageNamespace.CLOTHING, f"{IMAGE_ID}.webp", webp_bytes())
+
+    response = client.get(f"/uploads/clothing_images/{IMAGE_ID}", headers={"If-None-Match": '"stale"'})
+
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == routes.IMMUTABLE_CACHE_CONTROL
+    assert response.data == storage.get(StorageNamespace.CLOTHING, f"{IMAGE_ID}.webp")
+
+def test_missing_image_is_404(client, storage):
+    response = client.get(f"/uploads/clothing_images/{IMAGE_ID}", headers={"If-None-Match": '"anything"'})
+
+    assert response.status_code == 404